@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""A stand-in for the helm command used by the benchmark.
+
+It implements only what HelmCommand calls, for charts whose templates are plain YAML (no Go templates).
+
+- helm template CHART [--set KEY=VALUE ...]
+- helm package CHART --destination DIR
+- helm repo index DIR [--merge FILE]
+- helm dep update CHART
+- helm version --short
+"""
+import os
+import sys
+import glob
+import tarfile
+import hashlib
+import datetime
+import yaml
+
+
+def template(args):
+    module_dir_path = args[0]
+    chart_name = os.path.basename(module_dir_path.rstrip('/'))
+    templates_dir_path = os.path.join(module_dir_path, 'templates')
+    for path in sorted(glob.glob(os.path.join(templates_dir_path, '**', '*.yaml'), recursive=True)):
+        with open(path) as file:
+            text = file.read()
+        sys.stdout.write('---\n# Source: {name}/templates/{rel}\n{text}'.format(name=chart_name, rel=os.path.relpath(path, templates_dir_path), text=text))
+    return 0
+
+
+def package(args):
+    module_dir_path = args[0].rstrip('/')
+    dest_dir_path = args[args.index('--destination') + 1]
+    with open(os.path.join(module_dir_path, 'Chart.yaml')) as file:
+        chart = yaml.safe_load(file)
+    tgz_path = os.path.abspath(os.path.join(dest_dir_path, '{name}-{version}.tgz'.format(name=chart['name'], version=chart['version'])))
+    with tarfile.open(tgz_path, 'w:gz') as tar:
+        tar.add(module_dir_path, arcname=chart['name'])
+    sys.stdout.write('Successfully packaged chart and saved it to: {path}\n'.format(path=tgz_path))
+    return 0
+
+
+def repo_index(args):
+    dir_path = args[0]
+    now = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    entries = {}
+    for tgz_path in sorted(glob.glob(os.path.join(dir_path, '*.tgz'))):
+        with tarfile.open(tgz_path, 'r:gz') as tar:
+            member = [m for m in tar.getmembers() if m.name.count('/') == 1 and m.name.endswith('/Chart.yaml')][0]
+            chart = yaml.safe_load(tar.extractfile(member))
+        with open(tgz_path, 'rb') as file:
+            digest = hashlib.sha256(file.read()).hexdigest()
+        chart.update({'created': now, 'digest': digest, 'urls': [os.path.basename(tgz_path)]})
+        entries.setdefault(chart['name'], []).append(chart)
+    if '--merge' in args:
+        with open(args[args.index('--merge') + 1]) as file:
+            merged = yaml.safe_load(file) or {}
+        for name, versions in merged.get('entries', {}).items():
+            known = [chart['version'] for chart in entries.get(name, [])]
+            entries.setdefault(name, []).extend([chart for chart in versions if chart['version'] not in known])
+    with open(os.path.join(dir_path, 'index.yaml'), 'w') as file:
+        file.write(yaml.dump({'apiVersion': 'v1', 'entries': entries, 'generated': now}))
+    return 0
+
+
+def main(argv):
+    if argv[:1] == ['template']:
+        return template(argv[1:])
+    if argv[:1] == ['package']:
+        return package(argv[1:])
+    if argv[:2] == ['repo', 'index']:
+        return repo_index(argv[2:])
+    if argv[:1] in (['dep'], ['dependency']):
+        return 0
+    if argv[:1] == ['version']:
+        sys.stdout.write('v0.0.0+standin\n')
+        return 0
+    sys.stderr.write('Error: unknown command {argv}\n'.format(argv=' '.join(argv)))
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""Hermetic end-to-end benchmark of the pipeline. (Collector.work + Publisher.work)
+
+Nothing leaves the machine:
+
+- The source repositories are generated as local bare repositories. (file:// URLs)
+- The destination repository (master and gh-pages) is a local bare repository.
+- Docker Hub and the icon hosts are replaced by a local HTTP server. (DockerHubStandin)
+- helm is replaced by benchmarks/helm_standin.py unless --helm is given.
+
+The first run is cold. The later runs change --touch charts upstream before they start,
+so they measure the incremental path. (mirrors, conversion cache and change plan)
+With --arch-snapshot, the architectures of the images are resolved from a snapshot without the stand-in.
+(Export one with --export-arch-snapshot)
+
+usage: python3 -m benchmarks.pipeline --charts 100 --repos 2 --runs 2 --output bench.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+from contextlib import contextmanager
+
+import rdbox_app_market.config
+from rdbox_app_market import yaml_io
+from rdbox_app_market.settings import Settings
+from benchmarks.standins import LocalBareRepos, SyntheticChartRepos, DockerHubStandin
+
+DST_ACCOUNT = 'rdbox-intec'
+DST_REPOSITORY = 'rdbox_app_market'
+SPECIFIC_DIR_FROM_TOP = 'bot-gen'
+
+
+class StageTimer(object):
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def measure(self, name):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started_at
+
+    def get_stages(self):
+        return self.stages
+
+
+def write_config(workspace, url_of_dockerhub, helm_command, arch_snapshot=None):
+    """Point the settings to the workspace and the stand-ins.
+
+    Returns:
+        str: Path of the config file that overrides rdbox_app_market.conf.
+    """
+    path = os.path.join(workspace, 'benchmark.conf')
+    config = {
+        'rdbox': {'log_path': os.path.join(workspace, 'rdbox_app_market.log')},
+        'dockerhub': {'url': url_of_dockerhub},
+        'helm': {'command': helm_command},
+        'git': {'mirror_dir': os.path.join(workspace, 'mirrors')},
+        'cache': {'conversion_dir': os.path.join(workspace, 'cache', 'conversion'), 'arch_dir': os.path.join(workspace, 'cache', 'arch'),
+                  'template_dir': os.path.join(workspace, 'cache', 'template')},
+    }
+    if arch_snapshot is not None:
+        config['registry'] = {'snapshot': os.path.abspath(arch_snapshot)}
+    with open(path, 'w') as file:
+        for section, items in config.items():
+            file.write('[{section}]\n'.format(section=section))
+            for key, value in items.items():
+                file.write('{key} = {value}\n'.format(key=key, value=value))
+            file.write('\n')
+    return path
+
+
+def run_once(src_repos_list, dst_repos, settings, use_cache, use_change_plan):
+    """Run the pipeline once and measure each stage.
+
+    Returns:
+        dict[str, float]: Seconds of each stage.
+    """
+    from multiprocessing import Pool
+    from rdbox_app_market.github import GithubRepos, RdboxGithubRepos, ReferenceGithubRepos
+    from rdbox_app_market.app_market import Collector, Publisher, ChartInSpecificDir
+    from rdbox_app_market.acquisition import RepositoryAcquisition
+    from rdbox_app_market.mission_control import MissionControl
+    timer = StageTimer()
+    shutil.rmtree(GithubRepos.TOP_DIR, ignore_errors=True)
+    acquisition = RepositoryAcquisition.from_settings(settings)
+    pool = None
+    try:
+        with timer.measure('acquire'):
+            src_tasks = []
+            for priority, src in enumerate(reversed(src_repos_list)):
+                src_tasks.append(acquisition.submit(ReferenceGithubRepos, src.get_url(), 'master', settings=settings,
+                                                    specific_dir_from_top=src.get_specific_dir_from_top(), check_tldr=True, priority=priority + 1))
+            dst_master = acquisition.submit(RdboxGithubRepos, dst_repos.get_url(), 'master', settings=settings, specific_dir_from_top=SPECIFIC_DIR_FROM_TOP)
+            dst_ghpage = acquisition.submit(RdboxGithubRepos, dst_repos.get_url(), 'gh-pages', settings=settings, specific_dir_from_top=SPECIFIC_DIR_FROM_TOP)
+            src_repos = [task.result() for task in src_tasks]
+            dst_master = dst_master.result()
+            dst_ghpage = dst_ghpage.result()
+        with timer.measure('collect'):
+            change_plan = MissionControl.build_change_plan(use_change_plan, dst_ghpage, settings)
+            isolations, dependons = Collector(src_repos, dst_master, settings, change_plan).work()
+        with timer.measure('convert_and_pack'):
+            pool = Pool(ChartInSpecificDir.get_number_of_processes(settings))
+            publisher = Publisher(isolations, dependons, dst_ghpage, settings, MissionControl.build_conversion_cache(use_cache, settings), change_plan, pool)
+            publisher.work(False, exec_commit=False)
+        with timer.measure('commit_and_push'):
+            MissionControl.commit_and_push(dst_master, dst_ghpage, True, settings)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        acquisition.close()
+    return timer.get_stages()
+
+
+def count_published(dst_repos):
+    try:
+        index = yaml_io.safe_load(dst_repos.get_bare().git.show('gh-pages:{prefix}/index.yaml'.format(prefix=SPECIFIC_DIR_FROM_TOP)))
+    except Exception:
+        return 0
+    return len((index or {}).get('entries', {}))
+
+
+def benchmark(args):
+    """Run the benchmark.
+
+    Returns:
+        dict: The report. (JSON serializable)
+    """
+    workspace = args.workspace or tempfile.mkdtemp(prefix='rdbox_app_market.bench.')
+    os.makedirs(workspace, exist_ok=True)
+    for key, value in [('GIT_AUTHOR_NAME', 'rdbox-bot'), ('GIT_COMMITTER_NAME', 'rdbox-bot'),
+                       ('GIT_AUTHOR_EMAIL', 'info-rdbox@intec.co.jp'), ('GIT_COMMITTER_EMAIL', 'info-rdbox@intec.co.jp')]:
+        os.environ.setdefault(key, value)
+    helm_command = args.helm or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'helm_standin.py')
+    report = {'params': {'charts': args.charts, 'repos': args.repos, 'runs': args.runs, 'touch': args.touch,
+                         'latency_ms': args.latency_ms, 'helm': helm_command, 'use_cache': not args.no_cache,
+                         'use_change_plan': not args.full_rebuild, 'arch_snapshot': args.arch_snapshot, 'workspace': workspace},
+              'runs': []}
+    with DockerHubStandin(args.latency_ms / 1000.0) as dockerhub:
+        rdbox_app_market.config.read(write_config(workspace, dockerhub.get_url(), helm_command, args.arch_snapshot))
+        settings = Settings.from_config()
+        started_at = time.perf_counter()
+        src_repos_list = [SyntheticChartRepos(workspace, 'bench', 'charts{i}'.format(i=i), 'stable', args.charts, dockerhub.get_url() + '/icons')
+                          for i in range(args.repos)]
+        dst_repos = LocalBareRepos(workspace, DST_ACCOUNT, DST_REPOSITORY, ['master', 'gh-pages'])
+        report['setup'] = time.perf_counter() - started_at
+        for run in range(args.runs):
+            touched = 0
+            if run > 0:
+                for src in src_repos_list:
+                    touched += len(src.touch(args.touch))
+            count = dockerhub.get_count()
+            started_at = time.perf_counter()
+            stages = run_once(src_repos_list, dst_repos, settings, not args.no_cache, not args.full_rebuild)
+            report['runs'].append({'run': run + 1, 'touched': touched, 'stages': stages,
+                                   'total': time.perf_counter() - started_at,
+                                   'published': count_published(dst_repos),
+                                   'http_requests': dockerhub.get_count() - count})
+        if args.export_arch_snapshot is not None:
+            from rdbox_app_market.image_arch import ImageArchResolver
+            ImageArchResolver.get_instance(settings).export_snapshot(args.export_arch_snapshot)
+    if args.workspace is None and not args.keep:
+        shutil.rmtree(workspace, ignore_errors=True)
+    return report
+
+
+def print_report(report):
+    stage_names = []
+    for run in report['runs']:
+        stage_names.extend([name for name in run['stages'] if name not in stage_names])
+    header = ['run', 'touched'] + stage_names + ['total', 'published', 'http_requests']
+    print(' '.join('{:>16}'.format(name) for name in header))
+    for run in report['runs']:
+        row = [run['run'], run['touched']] + ['{:.3f}'.format(run['stages'].get(name, 0.0)) for name in stage_names] + \
+              ['{:.3f}'.format(run['total']), run['published'], run['http_requests']]
+        print(' '.join('{:>16}'.format(str(value)) for value in row))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Hermetic end-to-end benchmark of rdbox_app_market.')
+    parser.add_argument('--charts', type=int, default=50, help='Number of charts in each source repository.')
+    parser.add_argument('--repos', type=int, default=2, help='Number of source repositories.')
+    parser.add_argument('--runs', type=int, default=2, help='Number of runs. (The first one is cold)')
+    parser.add_argument('--touch', type=int, default=5, help='Number of charts changed upstream before each later run.')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Latency of the Docker Hub and icon stand-in.')
+    parser.add_argument('--helm', default=None, help='Full path of a real helm command. (The stand-in by default)')
+    parser.add_argument('--workspace', default=None, help='Directory for the repositories, mirrors and caches. (A temporary one by default)')
+    parser.add_argument('--keep', action='store_true', help='Keep the temporary workspace.')
+    parser.add_argument('--no-cache', action='store_true', help='Convert every chart again without the conversion cache.')
+    parser.add_argument('--full-rebuild', action='store_true', help='Process every chart, not only the changed ones.')
+    parser.add_argument('--arch-snapshot', default=None, help='Resolve the architectures of the images from this snapshot.')
+    parser.add_argument('--export-arch-snapshot', default=None, help='Export the architectures of the images looked up by the runs.')
+    parser.add_argument('--output', default=None, help='Write the report as JSON.')
+    parser.add_argument('--verbose', action='store_true', help='Show the output of the pipeline.')
+    args = parser.parse_args(argv)
+    if args.verbose:
+        r_print = logging.getLogger('rdbox_cli').getChild('stdout')
+        r_print.setLevel(logging.DEBUG)
+        r_print.addHandler(logging.StreamHandler())
+    report = benchmark(args)
+    print_report(report)
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
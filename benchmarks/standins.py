@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""Local stand-ins for the services the pipeline talks to. (GitHub, Docker Hub and the icon hosts)"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from git import Repo
+
+
+class LocalBareRepos(object):
+    """A bare repository reachable by a file:// URL, and a working clone to commit to it.
+
+    The path ends with <account>/<repository>.git so that GithubRepos can parse the URL.
+    """
+
+    def __init__(self, root_dir, account, repository_name, branches=['master']):
+        """ constructor
+
+        Args:
+            root_dir (str): Directory of the workspace.
+            account (str): Account name in the URL.
+            repository_name (str): Repository name in the URL.
+            branches (list[str], optional): Branches to be created. The first one is the default branch. Defaults to ['master'].
+        """
+        self.bare_dir = os.path.join(root_dir, 'remote', account, repository_name + '.git')
+        self.work_dir = os.path.join(root_dir, 'work', account, repository_name)
+        for path in [self.bare_dir, self.work_dir]:
+            shutil.rmtree(path, ignore_errors=True)
+        self.bare = Repo.init(self.bare_dir, bare=True)
+        # Allow the partial clone of ReferenceGithubRepos (--filter=blob:none)
+        self.bare.git.config('uploadpack.allowFilter', 'true')
+        self.work = Repo.init(self.work_dir)
+        self.work.create_remote('origin', self.get_url())
+        for branch in branches:
+            self.work.git.checkout('--orphan', branch)
+            self.write_files({'README.md': '# {name} ({branch})\n'.format(name=repository_name, branch=branch)})
+            self.commit_and_push(branch)
+        self.bare.git.symbolic_ref('HEAD', 'refs/heads/' + branches[0])
+
+    def get_url(self):
+        return 'file://' + self.bare_dir
+
+    def get_bare(self):
+        return self.bare
+
+    def write_files(self, files):
+        for path, text in files.items():
+            path = os.path.join(self.work_dir, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as file:
+                file.write(text)
+
+    def commit_and_push(self, branch='master'):
+        if self.work.head.ref.name != branch:
+            self.work.git.checkout(branch)
+        self.work.git.add('--all')
+        self.work.index.commit('benchmark')
+        self.work.git.push('origin', branch)
+
+
+class SyntheticChartRepos(LocalBareRepos):
+    """A source repository (like helm/charts) with generated helm charts.
+
+    Every chart passes the preprocessing. Some of them depend on the previous chart through requirements.yaml,
+    and half of the images are reported as multi-arch by DockerHubStandin.
+    """
+
+    def __init__(self, root_dir, account, repository_name, specific_dir_from_top, num_of_charts, url_of_icons, dependency_interval=5):
+        """ constructor
+
+        Args:
+            root_dir (str): Directory of the workspace.
+            account (str): Account name in the URL.
+            repository_name (str): Repository name in the URL.
+            specific_dir_from_top (str): Directory where the charts are stored.
+            num_of_charts (int): Number of the charts.
+            url_of_icons (str): URL where the icon images are served.
+            dependency_interval (int, optional): Every n-th chart depends on the previous one. Defaults to 5.
+        """
+        super().__init__(root_dir, account, repository_name)
+        self.specific_dir_from_top = specific_dir_from_top
+        self.url_of_icons = url_of_icons
+        self.chart_names = ['{repo}-chart-{i:04d}'.format(repo=repository_name, i=i) for i in range(num_of_charts)]
+        self.revisions = {}
+        for i, name in enumerate(self.chart_names):
+            dependency = self.chart_names[i - 1] if i > 0 and i % dependency_interval == 0 else None
+            self.write_chart(name, dependency)
+        self.commit_and_push()
+
+    def get_specific_dir_from_top(self):
+        return self.specific_dir_from_top
+
+    def get_chart_names(self):
+        return self.chart_names
+
+    def touch(self, num_of_charts):
+        """Change some charts upstream. (Like a daily update)
+
+        Args:
+            num_of_charts (int): Number of the charts to be changed.
+
+        Returns:
+            list[str]: Names of the changed charts.
+        """
+        step = max(1, len(self.chart_names) // max(1, num_of_charts))
+        names = self.chart_names[::step][:num_of_charts]
+        for name in names:
+            self.revisions[name] = self.revisions.get(name, 0) + 1
+            self.write_files({os.path.join(self.specific_dir_from_top, name, 'values.yaml'): self.build_values_yaml(name)})
+        self.commit_and_push()
+        return names
+
+    def write_chart(self, name, dependency=None):
+        files = {
+            'Chart.yaml': 'apiVersion: v1\nname: {name}\nversion: 1.0.0\ndescription: Synthetic chart {name}\nicon: {icons}/{name}.png\n'.format(name=name, icons=self.url_of_icons),
+            'values.yaml': self.build_values_yaml(name),
+            'README.md': '# {name}\n\n## TL;DR\n\n```console\n$ helm install my-release bench/{name}\n```\n'.format(name=name),
+            'templates/deployment.yaml': ('apiVersion: apps/v1\nkind: Deployment\nmetadata:\n  name: {name}\nspec:\n  template:\n    spec:\n'
+                                          '      nodeSelector: {{}}\n      containers:\n        - name: {name}\n          image: bench/{name}:1.0.0\n').format(name=name),
+        }
+        if dependency is not None:
+            files['requirements.yaml'] = 'dependencies:\n  - name: {dep}\n    version: 1.0.0\n    repository: https://example.com/charts\n'.format(dep=dependency)
+        self.write_files({os.path.join(self.specific_dir_from_top, name, path): text for path, text in files.items()})
+
+    def build_values_yaml(self, name):
+        return ('# revision {rev}\nimage:\n  repository: bench/{name}\n  tag: 1.0.0\n\nnodeSelector: {{}}\n\n'
+                'persistence:\n  enabled: true\n  # storageClass: "-"\n  size: 8Gi\n\n'
+                'ingress:\n  enabled: false\n  hosts:\n    - {name}.local\n').format(rev=self.revisions.get(name, 0), name=name)
+
+
+class DockerHubStandin(object):
+    """A local HTTP server that answers the Docker Hub tag API and serves the icon images.
+
+    - GET /v2/repositories/<namespace>/<name>/tags/<tag>: The architectures of the image. (amd64, and arm64 for half of them)
+    - GET /icons/<file>: A small PNG-like payload.
+    """
+
+    def __init__(self, latency=0.0):
+        """ constructor
+
+        Args:
+            latency (float, optional): Seconds to wait before each response. (To emulate the network) Defaults to 0.0.
+        """
+        self.latency = latency
+        self.count = 0
+        self.lock = threading.Lock()
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                standin.count_up()
+                time.sleep(standin.latency)
+                status, body, content_type = standin.respond(self.path)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_url(self):
+        return 'http://127.0.0.1:{port}'.format(port=self.server.server_address[1])
+
+    def get_count(self):
+        return self.count
+
+    def count_up(self):
+        with self.lock:
+            self.count += 1
+
+    def respond(self, path):
+        parts = path.strip('/').split('/')
+        if len(parts) == 6 and parts[:2] == ['v2', 'repositories'] and parts[4] == 'tags':
+            images = [{'architecture': 'amd64', 'os': 'linux'}]
+            if int(hashlib.sha256('/'.join(parts[2:4]).encode()).hexdigest(), 16) % 2 == 0:
+                images.append({'architecture': 'arm64', 'os': 'linux'})
+            return 200, json.dumps({'name': parts[5], 'images': images}).encode(), 'application/json'
+        if len(parts) == 2 and parts[0] == 'icons':
+            return 200, b'\x89PNG\r\n\x1a\n' + parts[1].encode(), 'image/png'
+        return 404, b'{}', 'application/json'
@@ -2,26 +2,26 @@
 import sys
 import logging
 import argparse
-import rdbox_app_market.config
+from rdbox_app_market.settings import Settings, SettingsError
 from rdbox_app_market.group_write_rotating_fileHandler import GroupWriteRotatingFileHandler
-from rdbox_app_market.mission_control import VendorMissionControl, RDBOXMissionControl
+from rdbox_app_market.mission_control import MissionControl, VendorMissionControl, RDBOXMissionControl
 from logging import getLogger, StreamHandler, Formatter
 
 r_logger = getLogger('rdbox_cli')
 r_print = getLogger('rdbox_cli').getChild("stdout")
 
 
-def r_logger_setup():
+def r_logger_setup(settings: Settings):
     # r_logger
     r_logger = getLogger('rdbox_cli')
     r_logger.setLevel(logging.DEBUG)
     handler_format = Formatter(
         fmt='%(asctime)s - %(process)d - %(levelname)s - %(message)s', datefmt='%Y-%m-%dT%H:%M:%S%z')
-    file_path = rdbox_app_market.config.get("rdbox", "log_path")
+    file_path = settings.rdbox.log_path
     file_handler = GroupWriteRotatingFileHandler(
         filename=file_path, maxBytes=10 * 1024 * 1024, backupCount=10)
     file_handler.setLevel(
-        getattr(logging, rdbox_app_market.config.get("rdbox", "log_level")))
+        getattr(logging, settings.rdbox.log_level))
     file_handler.setFormatter(handler_format)
     r_logger.addHandler(file_handler)
     # r_print
@@ -30,34 +30,63 @@ def r_logger_setup():
     handler_format = Formatter('%(message)s')
     stream_handler = StreamHandler()
     stream_handler.setLevel(
-        getattr(logging, rdbox_app_market.config.get("rdbox", "out_level")))
+        getattr(logging, settings.rdbox.out_level))
     stream_handler.setFormatter(handler_format)
     r_print.addHandler(stream_handler)
 
 
-def launch(type: str, exec_publish: bool):
+MISSION_CONTROLS = {
+    'bot-gen': VendorMissionControl,
+    'manually': RDBOXMissionControl,
+}
+
+
+def launch(type: str, exec_publish: bool, settings: Settings, use_cache: bool = True, use_change_plan: bool = True, export_arch_snapshot: str = None,
+           dump_features: str = None):
     ret = False
-    if type == 'bot-gen':
-        ret = VendorMissionControl.launch(exec_publish)
-    elif type == 'manually':
-        ret = RDBOXMissionControl.launch(exec_publish)
+    if type == 'all':
+        types = list(MISSION_CONTROLS.keys())
+    else:
+        types = type.split(',')
+    if all(t in MISSION_CONTROLS for t in types):
+        ret = MissionControl.launch_all([MISSION_CONTROLS[t] for t in types], exec_publish, settings, use_cache, use_change_plan, export_arch_snapshot, dump_features)
     else:
         r_print.error("argment error.")
     return ret
 
 
 def main():
+    # settings
+    try:
+        settings = Settings.from_config()
+    except SettingsError as e:
+        sys.stderr.write('[rdbox_app_market] Invalid settings: {e}\n'.format(e=e))
+        return False
     # logging
-    r_logger_setup()
+    r_logger_setup(settings)
     r_print.info("[rdbox_app_market] Start.")
     # args
     parser = argparse.ArgumentParser(description='RDBOX service.')
-    parser.add_argument('type', help='bot-gen OR manually')
+    parser.add_argument('type', help='bot-gen OR manually OR all (or comma-separated, like bot-gen,manually)')
     parser.add_argument('--publish', action='store_true')
+    parser.add_argument('--no-cache', action='store_true', help='Convert every chart again without the conversion cache.')
+    parser.add_argument('--full-rebuild', action='store_true', help='Process every chart, not only the charts changed since the previous run.')
+    parser.add_argument('--arch-snapshot', default=None, metavar='FILE',
+                        help='Resolve the architectures of the images only from this snapshot. ([registry] snapshot_miss for the missing ones)')
+    parser.add_argument('--export-arch-snapshot', default=None, metavar='FILE', help='Export the architectures of the images looked up in this run.')
+    parser.add_argument('--dump-features', default=None, metavar='FILE',
+                        help='Dump the features of the collected charts as JSON for inspection. (FILE.<type>.json for each type if several are given)')
     args = parser.parse_args()
     r_logger.info("ARGS: {args}".format(args=args))
+    if args.arch_snapshot is not None:
+        settings = settings._replace(registry=settings.registry._replace(snapshot=args.arch_snapshot))
+        try:
+            settings.validate()
+        except SettingsError as e:
+            r_print.error('[rdbox_app_market] Invalid settings: {e}'.format(e=e))
+            return False
     # launch
-    ret = launch(args.type, args.publish)
+    ret = launch(args.type, args.publish, settings, not args.no_cache, not args.full_rebuild, args.export_arch_snapshot, args.dump_features)
     return ret
 
 
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterator, List
+
+from rdbox_app_market.github import GithubRepos
+from rdbox_app_market.settings import Settings
+
+from logging import getLogger
+r_logger = getLogger('rdbox_cli')
+r_print = getLogger('rdbox_cli').getChild("stdout")
+
+
+class RepositoryAcquisitionError(Exception):
+    pass
+
+
+class AcquisitionTask(object):
+    """ A Git repository that is being cloned (or fetched) in the background.
+    """
+    def __init__(self, repos_class, url, branch, kwargs, timeout=None):
+        self.repos_class = repos_class
+        self.url = url
+        self.branch = branch
+        self.kwargs = kwargs
+        self.timeout = timeout
+        self.future = None
+        self.started_at = None
+        self.finished_at = None
+        self.started = threading.Event()
+
+    def __repr__(self):
+        return "<AcquisitionTask '%s' : '%s'>" % (self.url, self.branch)
+
+    def get_url(self):
+        return self.url
+
+    def get_branch(self):
+        return self.branch
+
+    def get_elapsed_time(self) -> float:
+        if self.started_at is None:
+            return 0.0
+        if self.finished_at is None:
+            return time.monotonic() - self.started_at
+        return self.finished_at - self.started_at
+
+    def run(self) -> GithubRepos:
+        self.started_at = time.monotonic()
+        self.started.set()
+        try:
+            return self.repos_class(self.url, self.branch, **self.kwargs)
+        finally:
+            self.finished_at = time.monotonic()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def get_remaining_time(self) -> float:
+        if self.timeout is None:
+            return float('inf')
+        return max(self.timeout - self.get_elapsed_time(), 0)
+
+    def is_timed_out(self) -> bool:
+        return self.get_remaining_time() <= 0
+
+    def result(self) -> GithubRepos:
+        """Wait for the repository.
+
+        The timeout counts the acquisition itself, not the time spent waiting in the queue.
+
+        Raises:
+            RepositoryAcquisitionError: Timed out or failed.
+
+        Returns:
+            GithubRepos: The acquired repository.
+        """
+        # It may be cancelled (see RepositoryAcquisition.close) or fail before it starts.
+        while not self.started.wait(1.0):
+            if self.future.done():
+                break
+        if self.future.cancelled():
+            r_print.info('AcquireERR(Cancelled): {url} {branch}'.format(url=self.url, branch=self.branch))
+            raise RepositoryAcquisitionError('{url} ({branch}) Cancelled'.format(url=self.url, branch=self.branch))
+        remaining = None
+        if self.timeout is not None:
+            remaining = self.get_remaining_time()
+        try:
+            return self.future.result(remaining)
+        except Exception as e:
+            if not self.future.done():
+                msg = 'Timed out after {sec} seconds'.format(sec=self.timeout)
+            else:
+                msg = '{name}: {e}'.format(name=type(e).__name__, e=str(e))
+                import traceback
+                r_logger.warning(traceback.format_exc())
+            r_print.info('AcquireERR({msg}): {url} {branch}'.format(msg=msg, url=self.url, branch=self.branch))
+            raise RepositoryAcquisitionError('{url} ({branch}) {msg}'.format(url=self.url, branch=self.branch, msg=msg))
+
+
+class RepositoryAcquisition(object):
+    """ This instance clones (or fetches) all Git repositories concurrently.
+
+    Network waits of the repositories overlap instead of stacking up one after another.
+    """
+    def __init__(self, max_workers, timeout=None):
+        """ constructor
+
+        Args:
+            max_workers (int): Number of concurrent acquisitions.
+            timeout (float, optional): Seconds allowed for each repository. Defaults to None (no limit).
+        """
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.tasks = []
+
+    @classmethod
+    def from_settings(cls, settings: Settings):
+        return cls(settings.git.max_concurrent_acquisitions, settings.git.acquisition_timeout)
+
+    def submit(self, repos_class, url, branch, **kwargs) -> AcquisitionTask:
+        """Start acquiring a repository in the background.
+
+        Args:
+            repos_class (type): GithubRepos subclass. (ReferenceGithubRepos or RdboxGithubRepos)
+            url (str): Accessible Git addresses
+            branch (str): Git branch name
+            **kwargs: Other arguments of the constructor.
+
+        Returns:
+            AcquisitionTask: The repository in acquisition.
+        """
+        task = AcquisitionTask(repos_class, url, branch, kwargs, self.timeout)
+        task.future = self.executor.submit(task.run)
+        self.tasks.append(task)
+        return task
+
+    def as_completed(self, tasks: List[AcquisitionTask]) -> Iterator[GithubRepos]:
+        """Yield the repositories in the order they become ready.
+
+        Args:
+            tasks (List[AcquisitionTask]): Tasks to wait for.
+
+        Raises:
+            RepositoryAcquisitionError: Any of them timed out or failed.
+
+        Yields:
+            GithubRepos: The acquired repository.
+        """
+        pending = list(tasks)
+        while len(pending) > 0:
+            poll = min([1.0] + [task.get_remaining_time() for task in pending if task.started.is_set()])
+            done, _ = wait([task.future for task in pending], timeout=poll, return_when=FIRST_COMPLETED)
+            for task in list(pending):
+                if task.future in done or task.is_timed_out():
+                    pending.remove(task)
+                    repo = task.result()
+                    r_logger.debug('Acquired {url} {branch} ({sec:.1f}s)'.format(url=task.get_url(), branch=task.get_branch(), sec=task.get_elapsed_time()))
+                    yield repo
+
+    def close(self) -> None:
+        """Wait for all acquisitions, then close every acquired repository.
+
+        The acquisitions that have not started are cancelled. If any of them timed out, nothing is waited for.
+        (Its git command is killed after the timeout. See GitMirror)
+        The repositories acquired after that are closed when they are ready.
+        """
+        for task in self.tasks:
+            task.future.cancel()
+        timed_out = [task for task in self.tasks if not task.done() and task.is_timed_out()]
+        for task in timed_out:
+            r_logger.warning('Not waiting for {url} {branch} ({sec:.1f}s)'.format(url=task.get_url(), branch=task.get_branch(), sec=task.get_elapsed_time()))
+        self.executor.shutdown(wait=len(timed_out) == 0)
+        for task in self.tasks:
+            # Called at once if it is done.
+            task.future.add_done_callback(self.__close_repos)
+
+    @staticmethod
+    def __close_repos(future):
+        if not future.cancelled() and future.exception() is None:
+            future.result().close()
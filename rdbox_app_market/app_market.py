@@ -2,23 +2,29 @@
 from __future__ import annotations                      # noqa: F404
 
 import os
+import glob
 import shutil
-from typing import Dict, List
-import yaml
+from typing import Dict, Iterable, List, Tuple
 import re
-import urllib.request
 
 from pathlib import Path
 from multiprocessing import Pool, Manager
 from itertools import repeat
 
-import rdbox_app_market.config
+from rdbox_app_market import yaml_io
 from rdbox_app_market.util import Util
 from rdbox_app_market.helm import HelmCommand
 from rdbox_app_market.github import GithubRepos, RdboxGithubRepos, ReferenceGithubRepos
-from rdbox_app_market.values_yaml import ValuesYaml
-
-from logging import getLogger
+from rdbox_app_market.acquisition import AcquisitionTask
+from rdbox_app_market.values_yaml import ValuesYaml, StageOfNodeSelector
+from rdbox_app_market.conversion_cache import ConversionCache
+from rdbox_app_market.template_cache import TemplateValidation, TemplateValidationCache
+from rdbox_app_market.change_plan import ChangePlan
+from rdbox_app_market.image_arch import ImageArch, ImageArchResolver
+from rdbox_app_market.chart_features import ChartFeatureIndex, RejectionRules
+from rdbox_app_market.settings import Settings
+
+from logging import getLogger, DEBUG
 r_logger = getLogger('rdbox_cli')
 r_print = getLogger('rdbox_cli').getChild("stdout")
 
@@ -28,81 +34,154 @@ class Collector(object):
 
     Also, if the format is not specified, the Chart will be excluded.
     """
-    def __init__(self, src_repos: ReferenceGithubRepos, dst_repo: RdboxGithubRepos):
+    def __init__(self, src_repos: Iterable[ReferenceGithubRepos], dst_repo: RdboxGithubRepos, settings: Settings, change_plan: ChangePlan = None,
+                 features_path: str = None):
         """ constructor
 
         Args:
-            src_repos (list[ReferenceGithubRepos]): List of Git repositories to reference when generating a Helm Chart for RDBOX
-            dst_repo (RdboxGithubRepos): The output destination GitHub repository.
+            src_repos (Iterable[ReferenceGithubRepos]): Git repositories to reference when generating a Helm Chart for RDBOX. They are preprocessed in the order they are yielded, so they can still be in acquisition. (see RepositoryAcquisition.as_completed)
+            dst_repo (RdboxGithubRepos or AcquisitionTask): The output destination GitHub repository. It is waited for only after preprocessing. (Before it with change_plan)
+            settings (Settings): settings
+            change_plan (ChangePlan, optional): Only the charts changed since the previous run are collected. Defaults to None (all charts).
+            features_path (str, optional): Path to dump the features of the collected charts as JSON. Defaults to None (not dumped).
         """
         self.src_repos = src_repos
         self.rdbox_master_repo = dst_repo
+        self.settings = settings
+        self.change_plan = change_plan
+        self.features_path = features_path
 
     def work(self) -> tuple[ChartInSpecificDir]:
         """Do the work
 
+        Each source repository is preprocessed as soon as it is acquired.
+        With the change plan, a repository is preprocessed again if the ones acquired later add charts to its selection.
+        (Charts depend on the charts in other repositories.)
+
         Returns:
             Tuple[ChartInSpecificDir, ChartInSpecificDir]: 1st is Non-dependent charts. 2nd is Charts with dependencies.
         """
-        chart_in_specific_dir = ChartInSpecificDir(self.rdbox_master_repo, ChartInSpecificDir.ANNOTATION_OTHERS)
+        if self.change_plan is not None:
+            self.change_plan.load(self.get_rdbox_master_repo())
+        preprocessed_by_repo = {}
+        module_names_by_repo = {}
         for repo in self.src_repos:
-            r_print.info('------------------- {url} ------------------'.format(url=repo.get_url()))
-            ref_chart_in_specific_dir = ChartInSpecificDir(repo, ChartInSpecificDir.ANNOTATION_OTHERS)
-            now_processing_isolations, now_processing_dependons = ref_chart_in_specific_dir.preprocessing()
+            module_names = None
+            if self.change_plan is not None:
+                requirements, images = self.__scan(repo)
+                self.change_plan.add(repo, requirements, images)
+                module_names = self.change_plan.get_selection()[repo]
+            preprocessed_by_repo[repo] = self.__preprocess(repo, module_names)
+            module_names_by_repo[repo] = module_names
+        if self.change_plan is not None:
+            for repo, module_names in self.change_plan.get_selection().items():
+                if not module_names.issubset(module_names_by_repo[repo]):
+                    preprocessed_by_repo[repo] = self.__preprocess(repo, module_names)
+            self.change_plan.report()
+        chart_in_specific_dir = ChartInSpecificDir(self.get_rdbox_master_repo(), self.settings, ChartInSpecificDir.ANNOTATION_OTHERS)
+        for now_processing_isolations, now_processing_dependons in preprocessed_by_repo.values():
             chart_in_specific_dir.merge(now_processing_isolations)
             chart_in_specific_dir.merge(now_processing_dependons)
         chart_in_specific_dir.move_entity()
         ################
-        isolations_collect_result, dependons_collect_result = chart_in_specific_dir.preprocessing()
+        isolations_collect_result, dependons_collect_result = chart_in_specific_dir.preprocessing(features_path=self.features_path)
         return isolations_collect_result, dependons_collect_result
 
+    def get_rdbox_master_repo(self) -> RdboxGithubRepos:
+        if isinstance(self.rdbox_master_repo, AcquisitionTask):
+            self.rdbox_master_repo = self.rdbox_master_repo.result()
+        return self.rdbox_master_repo
+
+    def __scan(self, repo):
+        helm_modules = ChartInSpecificDir(repo, self.settings).get_HelmModule_all()
+        requirements = {module_name: [req_obj.get_name() for req_obj in helm_module.get_RequirementObject_list()]
+                        for module_name, helm_module in helm_modules.items()}
+        # The conversion does not look up the images for the manually repository. (See ChartInSpecificDir.prefetch_image_archs)
+        images = None
+        if not self.get_rdbox_master_repo().is_manually_repo():
+            images = {module_name: helm_module.get_ValuesYaml().get_images_to_look_up() for module_name, helm_module in helm_modules.items()}
+        return requirements, images
+
+    def __preprocess(self, repo, module_names):
+        r_print.info('------------------- {url} ------------------'.format(url=repo.get_url()))
+        ref_chart_in_specific_dir = ChartInSpecificDir(repo, self.settings, ChartInSpecificDir.ANNOTATION_OTHERS)
+        return ref_chart_in_specific_dir.preprocessing(module_names)
+
 
 class Publisher(object):
     """ The Instance is to arrange the converting and publish of helm chart.
 
     like a publishing company.
     """
-    def __init__(self, isolations: ChartInSpecificDir, dependons: ChartInSpecificDir, dest_repo: RdboxGithubRepos):
+    def __init__(self, isolations: ChartInSpecificDir, dependons: ChartInSpecificDir, dest_repo: RdboxGithubRepos, settings: Settings, conversion_cache: ConversionCache = None, change_plan: ChangePlan = None, pool: Pool = None):
         """ constructor
 
         Args:
             isolations (ChartInSpecificDir): Chart that is independent of other Charts.
             dependons (ChartInSpecificDir): Chart that depend on other Charts.
             dst_repo (RdboxGithubRepos): The output destination GitHub repository.
+            settings (Settings): settings
+            conversion_cache (ConversionCache, optional): Reuse the charts converted in previous runs. Defaults to None (no cache).
+            change_plan (ChangePlan, optional): The plan used by Collector. Unchanged charts are carried over. Defaults to None (all charts).
+            pool (Pool, optional): Process pool shared with other Publishers. Defaults to None (a pool for each conversion).
         """
         self.isolations = isolations
         self.dependons = dependons
         self.rdbox_gh_repo = dest_repo
+        self.settings = settings
+        self.conversion_cache = conversion_cache
+        self.change_plan = change_plan
+        self.pool = pool
 
-    def work(self, exec_publish: bool) -> ChartInSpecificDir:
+    def work(self, exec_publish: bool, exec_commit: bool = True) -> ChartInSpecificDir:
         """Do the work
 
         Args:
             exec_publish (bool): Do you want to publish it?
+            exec_commit (bool, optional): Do you want to commit it? If not, the caller commits (and publishes) the destination repositories. Defaults to True.
 
-        - convert
-            - specify_nodeSelector_for_rdbox
+        - prefetch the architectures of the images on the Docker Hub (concurrently, each image once)
+        - convert (or reuse the result of a previous run)
+            - specify_values_yaml_for_rdbox (storageClass, ingress and nodeSelector, written once)
             - Scraping icon images
             - customize_chartyaml_for_rdbox
-            - helm_command.template
+            - helm_command.template (or reuse the verification of the same converted chart)
             - helm_command.package
+        - carry over (only with change_plan)
         - pack
             - helm_command.repo_index
             - commit
         - publish
             - push
 
+        Raises:
+            ChartInSpecificDirPackError: Failed to pack when exec_commit is False.
+
         Returns:
             ChartInSpecificDir: Information about the Helm Chart to be published in the RDBOX App Market.
         """
         r_print.info('------------------- {url} ------------------'.format(url=self.rdbox_gh_repo.get_url()))
         #########
-        invalid_key_list = self.isolations.convert(self.rdbox_gh_repo)
+        isolations_image_archs = self.isolations.prefetch_image_archs()
+        dependons_image_archs = self.dependons.prefetch_image_archs()
+        invalid_key_list = self.isolations.convert(self.rdbox_gh_repo, self.conversion_cache, self.pool, isolations_image_archs)
         self.dependons.remove_by_depend_modules_list(invalid_key_list)
-        _ = self.dependons.convert(self.rdbox_gh_repo)
+        _ = self.dependons.convert(self.rdbox_gh_repo, self.conversion_cache, self.pool, dependons_image_archs)
+        if self.conversion_cache is not None:
+            self.conversion_cache.evict()
+        ImageArchResolver.get_instance(self.settings).get_cache().evict()
+        TemplateValidationCache.from_settings(self.settings).evict()
         #########
         rdbox_app_market_all_chart = self.dependons.merge(self.isolations)
-        rdbox_app_market_all_chart.publish(self.rdbox_gh_repo, exec_publish)
+        index_to_merge = None
+        if self.change_plan is not None:
+            index_to_merge = self.change_plan.carry_over(rdbox_app_market_all_chart.get_repo(), rdbox_app_market_all_chart.get_all_HelmModule_mapped_by_module_name().keys())
+            self.change_plan.save(rdbox_app_market_all_chart.get_repo(), rdbox_app_market_all_chart.get_all_HelmModule_mapped_by_module_name().keys())
+        try:
+            rdbox_app_market_all_chart.publish(self.rdbox_gh_repo, exec_publish, index_to_merge, exec_commit)
+        finally:
+            if index_to_merge is not None:
+                os.remove(index_to_merge)
         return rdbox_app_market_all_chart
 
 
@@ -114,20 +193,26 @@ class ChartInSpecificDirPackError(Exception):
     pass
 
 
+class ChartInSpecificDirPublishError(Exception):
+    pass
+
+
 class ChartInSpecificDir(object):
 
     ANNOTATION_OTHERS = 'others'
     ANNOTATION_ISOLATIONS = 'isolations'
     ANNOTATION_DEPENDONS = 'dependons'
 
-    def __init__(self, repo: GithubRepos, annotation=ANNOTATION_OTHERS):
+    def __init__(self, repo: GithubRepos, settings: Settings, annotation=ANNOTATION_OTHERS):
         """Constructor
 
         Args:
             repo (GithubRepos): GitHub repositories to reference.
+            settings (Settings): settings (It is sent to the worker processes with this instance)
             annotation (str, optional): The classification of the data held by GitHub repositories when it is classified.
         """
         self.repo = repo
+        self.settings = settings
         if annotation == ChartInSpecificDir.ANNOTATION_OTHERS or \
             annotation == ChartInSpecificDir.ANNOTATION_ISOLATIONS or \
                 annotation == ChartInSpecificDir.ANNOTATION_DEPENDONS:
@@ -150,6 +235,9 @@ class ChartInSpecificDir(object):
         """
         return self.repo
 
+    def get_settings(self) -> Settings:
+        return self.settings
+
     def get_annotation(self) -> str:
         """Get annotation string
 
@@ -224,7 +312,7 @@ class ChartInSpecificDir(object):
                 import traceback
                 r_logger.warning(traceback.format_exc())
 
-    def preprocessing(self) -> tuple[ChartInSpecificDir]:
+    def preprocessing(self, module_names: Iterable[str] = None, features_path: str = None) -> tuple[ChartInSpecificDir]:
         """Pre-processing before converting to charts for RDBOX App Market.
 
         - Filtering Charts with Unknown Dependencies.
@@ -233,40 +321,97 @@ class ChartInSpecificDir(object):
             - Can't select a nodeSelector.
             - Bad image key structure
             - deprecated image
+            - (See RejectionRules. The cheaper rules run first, and a chart stops at the first rejection)
+
+        Args:
+            module_names (Iterable[str], optional): Only these charts are processed. Defaults to None (all charts).
+            features_path (str, optional): Path to dump all features of the charts as JSON for inspection. Defaults to None (not dumped).
 
         Returns:
             Tuple[ChartInSpecificDir, ChartInSpecificDir]: 1st is Non-dependent charts. 2nd is Charts with dependencies.
         """
-        self.all_HelmModule_mapped_by_module_name = self.get_HelmModule_all()
+        self.all_HelmModule_mapped_by_module_name = self.get_HelmModule_all(module_names)
+        if features_path is None:
+            # The features are read once, and only when a rejection rule asks for them.
+            feature_index = ChartFeatureIndex(self.all_HelmModule_mapped_by_module_name)
+        else:
+            # All features are read before the rules modify the charts. (The rules reuse them)
+            feature_index = ChartFeatureIndex.build(self.all_HelmModule_mapped_by_module_name, self.get_number_of_processes(self.settings))
+            feature_index.dump(features_path)
+            r_print.info('dump features ({num} charts): {path}'.format(num=len(feature_index), path=features_path))
         ########
         isolations_collect_result, dependons_collect_result = self.__split_module_by_dependencies()
         if self.get_repo().is_manually_repo():
-            isolations_collect_result = ChartInSpecificDir(self.repo, ChartInSpecificDir.ANNOTATION_ISOLATIONS).__update(isolations_collect_result)
-            dependons_collect_result = ChartInSpecificDir(self.repo, ChartInSpecificDir.ANNOTATION_DEPENDONS).__update(dependons_collect_result)
+            isolations_collect_result = ChartInSpecificDir(self.repo, self.settings, ChartInSpecificDir.ANNOTATION_ISOLATIONS).__update(isolations_collect_result)
+            dependons_collect_result = ChartInSpecificDir(self.repo, self.settings, ChartInSpecificDir.ANNOTATION_DEPENDONS).__update(dependons_collect_result)
         else:
             isolations_collect_result, dependons_collect_result = self.__excludes_unknown_dependencies(isolations_collect_result, dependons_collect_result)
         ########
-        invalid_key_list = isolations_collect_result.__get_invalid_key_list()
+        invalid_key_list = isolations_collect_result.__get_invalid_key_list(feature_index)
         isolations_collect_result.remove_by_key_list(invalid_key_list)
         dependons_collect_result.remove_by_depend_modules_list(invalid_key_list)
         ########
-        invalid_key_list = dependons_collect_result.__get_invalid_key_list()
+        invalid_key_list = dependons_collect_result.__get_invalid_key_list(feature_index)
         dependons_collect_result.remove_by_key_list(invalid_key_list)
+        if r_logger.isEnabledFor(DEBUG):
+            r_logger.debug(feature_index.to_json())
         ########
         return isolations_collect_result, dependons_collect_result
 
-    def convert(self, repo_for_rdbox: GithubRepos) -> list[str]:
+    @classmethod
+    def get_number_of_processes(cls, settings: Settings) -> int:
+        """Get the number of worker processes for the conversion.
+
+        Args:
+            settings (Settings): settings
+
+        Returns:
+            int: os.cpu_count() * [rdbox] maximum_cpu_usage (at least 1)
+        """
+        return max(1, int(os.cpu_count() * settings.rdbox.maximum_cpu_usage))
+
+    def prefetch_image_archs(self) -> Dict[str, Dict[Tuple[str, str], ImageArch]]:
+        """Look up the architectures of the images of all charts before the conversion.
+
+        The images are looked up concurrently, and the ones shared by the charts are looked up once.
+        (See ImageArchResolver.prefetch)
+
+        Returns:
+            Dict[str, Dict[Tuple[str, str], ImageArch]]: The resolved images of each chart mapped by module name. (For convert)
+        """
+        if self.get_repo().is_manually_repo():
+            return {}
+        images_by_module = {module_name: helm_module.get_ValuesYaml().get_images_to_look_up()
+                            for module_name, helm_module in self.get_all_HelmModule_mapped_by_module_name().items()}
+        return ImageArchResolver.get_instance(self.settings).prefetch(images_by_module, self.settings.dockerhub.max_concurrent_requests)
+
+    def convert(self, repo_for_rdbox: GithubRepos, conversion_cache: ConversionCache = None, pool: Pool = None,
+                image_archs: Dict[str, Dict[Tuple[str, str], ImageArch]] = None) -> list[str]:
         """Convert to RDBOX App Market chart.
 
         Args:
             repo_for_rdbox (GithubRepos): Github repository (like gh-pages) for publishing RDBOX App Market
+            conversion_cache (ConversionCache, optional): Reuse the charts converted in previous runs. Defaults to None (no cache).
+            pool (Pool, optional): Process pool to convert in. Defaults to None (a new pool for this conversion).
+            image_archs (Dict[str, Dict[Tuple[str, str], ImageArch]], optional): The result of prefetch_image_archs. Defaults to None (looked up by each chart).
 
         Returns:
             list[str]: List of module names that failed to be converted.
         """
         invalid_key_list = []
-        p = Pool(int(os.cpu_count() * float(rdbox_app_market.config.get('rdbox', 'maximum_cpu_usage'))))
-        result = p.starmap(self.convert_detail, zip(repeat(repo_for_rdbox), self.get_all_HelmModule_mapped_by_module_name().keys(), self.get_all_HelmModule_mapped_by_module_name().values()))
+        if image_archs is None:
+            image_archs = {}
+        items = list(self.get_all_HelmModule_mapped_by_module_name().items())
+        p = pool
+        if p is None:
+            p = Pool(self.get_number_of_processes(self.settings))
+        try:
+            result = p.starmap(self.convert_detail, zip(repeat(repo_for_rdbox), [module_name for module_name, _ in items], [helm_module for _, helm_module in items],
+                                                        repeat(conversion_cache), [image_archs.get(module_name) for module_name, _ in items]))
+        finally:
+            if pool is None:
+                p.close()
+                p.join()
         for invalids in result:
             invalid_key_list.extend(invalids)
         for module_name in invalid_key_list:
@@ -274,26 +419,35 @@ class ChartInSpecificDir(object):
         self.remove_by_key_list(invalid_key_list)
         return list(set(invalid_key_list))
 
-    def publish(self, rdbox_gh_repo: GithubRepos, exec_publish: bool) -> list[str]:
+    def publish(self, rdbox_gh_repo: GithubRepos, exec_publish: bool, index_to_merge: str = None, exec_commit: bool = True) -> list[str]:
         """Push (publish) the corresponding Git repository in order to make it presentable for publishing helm charts.
 
         Args:
             rdbox_gh_repo (GithubRepos): Github repository (like gh-pages) for publishing RDBOX App Market
             exec_publish (bool): Do you want to publish it?
+            index_to_merge (str, optional): Path of index.yaml whose entries are kept in the generated index.yaml. Defaults to None.
+            exec_commit (bool, optional): Do you want to commit it? If not, it is neither committed nor published. Defaults to True.
+
+        Raises:
+            ChartInSpecificDirPackError: Failed to pack when exec_commit is False. (The caller must not commit the destination repositories)
 
         Returns:
             list[str]: List of module names that failed to be published.
         """
         invalid_key_list = []
         try:
-            self.__pack(rdbox_gh_repo)
-            if exec_publish:
+            self.__pack(rdbox_gh_repo, index_to_merge, exec_commit)
+            if exec_commit and exec_publish:
                 self.__publish(rdbox_gh_repo)
         except ChartInSpecificDirPackError:
+            if not exec_commit:
+                raise
             import traceback
             r_logger.warning(traceback.format_exc())
             invalid_key_list.extend(self.get_all_HelmModule_mapped_by_module_name().keys())
-        except Exception:
+        except Exception as e:
+            if not exec_commit:
+                raise ChartInSpecificDirPackError(str(e)) from e
             import traceback
             r_logger.warning(traceback.format_exc())
             invalid_key_list.extend(self.get_all_HelmModule_mapped_by_module_name().keys())
@@ -328,33 +482,50 @@ class ChartInSpecificDir(object):
             self.__delete_entity_by_module_name(key)
             self.all_HelmModule_mapped_by_module_name.pop(key)
 
-    def get_HelmModule_all(self) -> Dict[str, HelmModule]:
+    def get_HelmModule_all(self, module_names: Iterable[str] = None) -> Dict[str, HelmModule]:
         """Retrieve HelmModules stored in a specific directory as a map.
 
+        Args:
+            module_names (Iterable[str], optional): Only these charts are retrieved. Defaults to None (all charts).
+
         Returns:
             Dict[str, HelmModule]: HelmModule() mapped to a module_name.
         """
         module_mapping_data = {}
         _module_list = self.__get_module_list()
+        if module_names is not None:
+            _module_list = [module_name for module_name in _module_list if module_name in module_names]
         for module_name in _module_list:
             if os.path.isfile(os.path.join(self.get_specific_dirpath(), module_name, 'values.yaml')):
-                helm_module = HelmModule(self.get_specific_dirpath(), module_name, self.repo.get_priority())
+                helm_module = HelmModule(self.get_specific_dirpath(), module_name, self.repo.get_priority(), self.settings)
                 module_mapping_data.setdefault(module_name, helm_module)
         return module_mapping_data
 
-    def convert_detail(self, repo_for_rdbox: GithubRepos, module_name: str, helm_module: HelmModule) -> List[str]:
+    def convert_detail(self, repo_for_rdbox: GithubRepos, module_name: str, helm_module: HelmModule, conversion_cache: ConversionCache = None,
+                       image_archs: Dict[Tuple[str, str], ImageArch] = None) -> List[str]:
         """Performs various conversions for app_market. Returns a list of module names that failed to be converted.
 
         Args:
             repo_for_rdbox (GithubRepos): Github repository (like gh-pages) for publishing RDBOX App Market
             module_name (str): The module name of the chart to be processed.
             helm_module (HelmModule): A class representing the chart to be processed.
+            conversion_cache (ConversionCache, optional): Reuse the charts converted in previous runs. Defaults to None (no cache).
+            image_archs (Dict[Tuple[str, str], ImageArch], optional): The prefetched images of the chart. Defaults to None.
 
         Returns:
             List[str]: List of module names that failed to be converted.
         """
         invalid_key_list = []
         try:
+            if image_archs is not None:
+                ImageArchResolver.get_instance(self.settings).preload(image_archs)
+            # Cache
+            cache_key = None
+            if conversion_cache is not None:
+                cache_key = self.__build_cache_key(conversion_cache, repo_for_rdbox, helm_module)
+                if cache_key is not None and self.__restore_from_cache(conversion_cache, cache_key, module_name, helm_module):
+                    r_print.info("Convert(CACHED): " + module_name)
+                    return invalid_key_list
             # Core Processing
             if self.get_repo().is_manually_repo():
                 self.__specify_chart_yaml(module_name, helm_module)
@@ -364,6 +535,8 @@ class ChartInSpecificDir(object):
                 self.__specify_chart_yaml(module_name, helm_module)
                 self.__resolve_dependencies_based_on_requirements_yaml(repo_for_rdbox, module_name, helm_module)
                 self.__generate_package_tgz(module_name, helm_module)
+            if cache_key is not None:
+                self.__store_to_cache(conversion_cache, cache_key, module_name, helm_module)
             # Logging
             if self.get_annotation() == ChartInSpecificDir.ANNOTATION_ISOLATIONS:
                 r_print.info("Convert(ISOLATIONS): " + module_name)
@@ -382,18 +555,47 @@ class ChartInSpecificDir(object):
         finally:
             return invalid_key_list
 
-    def __specify_values_yaml(self, module_name: str, helm_module: HelmModule):
-        multi_arch_dict = {}
+    def __build_cache_key(self, conversion_cache: ConversionCache, repo_for_rdbox: GithubRepos, helm_module: HelmModule):
+        # The architectures of the images are a part of the key. (They are prefetched and preloaded, so it is not looked up again)
+        image_archs = {}
+        if not self.get_repo().is_manually_repo():
+            try:
+                resolver = ImageArchResolver.get_instance(self.settings)
+                for repo_uri, tag in helm_module.get_ValuesYaml().get_images_to_look_up():
+                    image_archs[resolver.build_key(repo_uri, tag)] = resolver.resolve(repo_uri, tag)
+            except Exception:
+                # Not cached. The conversion handles the error.
+                import traceback
+                r_logger.warning(traceback.format_exc())
+                return None
+        return conversion_cache.build_key(helm_module, self.get_annotation(), self.get_repo().is_manually_repo(), repo_for_rdbox, self.settings, image_archs)
+
+    def __restore_from_cache(self, conversion_cache: ConversionCache, cache_key: str, module_name: str, helm_module: HelmModule):
+        path_of_generation_result = conversion_cache.restore(cache_key, helm_module.get_module_dir_path(), self.get_specific_dirpath(), self.__get_dir_to_save_icon())
+        if path_of_generation_result is None:
+            return False
+        self.all_packaged_tgz_path_mapped_by_module_name[module_name] = path_of_generation_result
+        return True
+
+    def __store_to_cache(self, conversion_cache: ConversionCache, cache_key: str, module_name: str, helm_module: HelmModule):
         # Continue even if it fails.
         try:
-            helm_module.specify_storageClass_for_rdbox()
-            helm_module.specify_ingress_for_rdbox()
+            icon_paths = [path for path in glob.glob(os.path.join(self.__get_dir_to_save_icon(), module_name + '.*'))
+                          if os.path.splitext(os.path.basename(path))[0] == module_name]
+            conversion_cache.store(cache_key, helm_module.get_module_dir_path(), self.all_packaged_tgz_path_mapped_by_module_name[module_name], icon_paths)
         except Exception:
             import traceback
             r_logger.warning(traceback.format_exc())
-        # Stop even if it fails.
+
+    def __get_dir_to_save_icon(self):
+        return os.path.join(self.repo.get_dirpath(), 'icons')
+
+    def __specify_values_yaml(self, module_name: str, helm_module: HelmModule):
+        multi_arch_dict = {}
+        # Continue even if storageClass or ingress fails. (They are skipped in the pipeline)
+        # Stop even if nodeSelector fails.
         try:
-            _, _, multi_arch_dict = helm_module.specify_nodeSelector_for_rdbox()
+            _, multi_arch_dict = helm_module.specify_values_yaml_for_rdbox()
             if len(multi_arch_dict.keys()) > 0:
                 r_logger.debug('It has Multi Arch Image. ' + module_name)
                 r_logger.debug(multi_arch_dict)
@@ -403,7 +605,7 @@ class ChartInSpecificDir(object):
             raise ChartInSpecificDirConverError('Error in specify_nodeSelector_for_rdbox')
 
     def __specify_chart_yaml(self, module_name: str, helm_module: HelmModule):
-        dir_to_save_icon = os.path.join(self.repo.get_dirpath(), 'icons')
+        dir_to_save_icon = self.__get_dir_to_save_icon()
         os.makedirs(dir_to_save_icon, exist_ok=True)
         helm_module.customize_chartyaml_for_rdbox(dir_to_save_icon)
 
@@ -412,13 +614,12 @@ class ChartInSpecificDir(object):
             helm_module.resolve_dependencies_based_on_requirements_yaml(repo_for_rdbox)
 
     def __generate_package_tgz(self, module_name: str, helm_module: HelmModule):
-        helm_command = HelmCommand()
+        helm_command = HelmCommand(self.settings.helm.command)
         if self.get_repo().is_manually_repo():
             helm_command.dep_update(self.get_specific_dirpath(), module_name)
             helm_module.get_RequirementsYaml().remove_lock_file()
         # Verify Format
-        manifest_map = helm_command.template(self.get_specific_dirpath(), module_name, helm_module.extract_set_options_from_install_command())
-        if not self.__is_correct_manifest_map(manifest_map):
+        if not self.__validate_template(helm_command, module_name, helm_module).correct:
             raise ChartInSpecificDirConverError('Contains workloads (Pods, Deployment, DaemonSet, etc.) for which nodeSelector is not specified.')
         # Generate Package
         path_of_generation_result = helm_command.package(self.get_specific_dirpath(), module_name, self.get_specific_dirpath())
@@ -427,9 +628,9 @@ class ChartInSpecificDir(object):
         else:
             raise ChartInSpecificDirConverError(path_of_generation_result)
 
-    def __pack(self, rdbox_gh_repo):
-        helm_command = HelmCommand()
-        path_of_generation_result = helm_command.repo_index(self.get_specific_dirpath())
+    def __pack(self, rdbox_gh_repo, index_to_merge=None, exec_commit=True):
+        helm_command = HelmCommand(self.settings.helm.command)
+        path_of_generation_result = helm_command.repo_index(self.get_specific_dirpath(), index_to_merge)
         if os.path.isfile(path_of_generation_result):
             target = os.path.join(rdbox_gh_repo.get_dirpath_with_prefix(), os.path.basename(path_of_generation_result))
             os.makedirs(os.path.dirname(target), exist_ok=True)
@@ -439,6 +640,8 @@ class ChartInSpecificDir(object):
         for _, path in self.all_packaged_tgz_path_mapped_by_module_name.items():
             target = os.path.join(rdbox_gh_repo.get_dirpath_with_prefix(), os.path.basename(path))
             shutil.move(path, target)
+        if not exec_commit:
+            return
         # for gh-pages
         rdbox_gh_repo.commit()
         r_print.info('commit gh-pages')
@@ -447,16 +650,10 @@ class ChartInSpecificDir(object):
         r_print.info('commit master')
 
     def __publish(self, rdbox_gh_repo):
-        try:
-            # for gh-pages
-            rdbox_gh_repo.push()
-            r_print.info('push origin gh-pages')
-            # for master
-            self.get_repo().push()
-            r_print.info('push origin master')
-        except Exception:
-            import traceback
-            r_logger.warning(traceback.format_exc())
+        result = GithubRepos.push_atomically([rdbox_gh_repo, self.get_repo()], self.settings.git.push_retries, self.settings.git.push_backoff)
+        if not result.is_success():
+            raise ChartInSpecificDirPublishError(result.get_message())
+        r_print.info('push origin {branches}'.format(branches=' '.join(result.get_branches())))
 
     def __update(self, all_RequirementsYaml_mapped_by_module_name):
         """Overwrite with dict(all_RequirementsYaml_mapped_by_module_name).
@@ -470,29 +667,38 @@ class ChartInSpecificDir(object):
         self.all_HelmModule_mapped_by_module_name.update(all_RequirementsYaml_mapped_by_module_name)
         return self
 
-    def __is_correct_manifest_map(self, manifest_map):
-        flg = True
+    def __validate_template(self, helm_command: HelmCommand, module_name: str, helm_module: HelmModule) -> TemplateValidation:
+        set_list = helm_module.extract_set_options_from_install_command()
+        template_cache = TemplateValidationCache.from_settings(self.settings)
+        cache_key = template_cache.build_key(helm_module.get_module_dir_path(), set_list, helm_command.version(), self.get_annotation())
+        if cache_key is not None:
+            validation = template_cache.get(cache_key)
+            if validation is not None:
+                for filename in validation.offending_manifests:
+                    r_logger.debug(filename)
+                return validation
+        manifest_map = helm_command.template(self.get_specific_dirpath(), module_name, set_list)
+        offending_manifests = self.__find_offending_manifests(manifest_map)
+        # TODO: Provisional support
+        # It may be missing. 'helm template .' command.
+        is_correct = not (self.get_annotation() == ChartInSpecificDir.ANNOTATION_ISOLATIONS and len(offending_manifests) > 0)
+        validation = TemplateValidation(is_correct, tuple(offending_manifests))
+        if cache_key is not None:
+            template_cache.put(cache_key, validation)
+        return validation
+
+    def __find_offending_manifests(self, manifest_map):
+        offending_manifests = []
         for filename, manifest in manifest_map.items():
             if manifest is None:
                 continue
             if manifest.get('kind') in ['Pod', 'Deployment', 'Job', 'DaemonSet', 'ReplicaSet', 'StatefulSet']:
                 node_selector = Util.has_key_recursion(manifest, 'nodeSelector')
-                if node_selector is None:
-                    if 'test' in filename:
-                        flg = True
-                    else:
-                        r_logger.debug(filename)
-                        r_logger.debug(yaml.dump(manifest))
-                        # TODO: Provisional support
-                        # It may be missing. 'helm template .' command.
-                        if self.get_annotation() == ChartInSpecificDir.ANNOTATION_ISOLATIONS:
-                            flg = False
-                            break
-                else:
-                    flg = True
-            else:
-                continue
-        return flg
+                if node_selector is None and 'test' not in filename:
+                    r_logger.debug(filename)
+                    r_logger.debug(yaml_io.dump(manifest))
+                    offending_manifests.append(filename)
+        return offending_manifests
 
     def __split_module_by_dependencies(self):
         isolations = {}      # An independent helm chart on which no other dependencies exist.
@@ -521,8 +727,8 @@ class ChartInSpecificDir(object):
             r_print.info('Delete(UNKNOWN_DEP): ' + key)
             self.__delete_entity_by_module_name(key)
             dependons.pop(key)
-        return (ChartInSpecificDir(self.repo, ChartInSpecificDir.ANNOTATION_ISOLATIONS).__update(isolations),
-                ChartInSpecificDir(self.repo, ChartInSpecificDir.ANNOTATION_DEPENDONS).__update(dependons))
+        return (ChartInSpecificDir(self.repo, self.settings, ChartInSpecificDir.ANNOTATION_ISOLATIONS).__update(isolations),
+                ChartInSpecificDir(self.repo, self.settings, ChartInSpecificDir.ANNOTATION_DEPENDONS).__update(dependons))
 
     def __delete_entity_by_module_name(self, module_name):
         dir_path = os.path.join(self.get_specific_dirpath(), module_name)
@@ -531,76 +737,11 @@ class ChartInSpecificDir(object):
         except FileNotFoundError:
             pass
 
-    def __get_invalid_key_list(self):
-        invalid_keys = []
-        not_has_key_nodeSelector = self.__filter_nodeselector()
-        invalid_imagetag = self.__filter_valuesyaml_imagetag()
-        deprecated = self.__filter_deprecate()
-        invalid_keys += not_has_key_nodeSelector
-        invalid_keys += invalid_imagetag
-        invalid_keys += deprecated
-        if self.repo.get_check_tldr():
-            tldr = self.__filter_tldr()
-            invalid_keys += tldr
+    def __get_invalid_key_list(self, feature_index: ChartFeatureIndex):
+        rules = RejectionRules.build_default(self.repo.get_check_tldr())
+        invalid_keys = rules.apply(feature_index, self.get_all_HelmModule_mapped_by_module_name().keys(), self.get_number_of_processes(self.settings))
         return list(set(invalid_keys))
 
-    def __filter_nodeselector(self):
-        invalid_module = {}
-        for module_name, helm_module in self.get_all_HelmModule_mapped_by_module_name().items():
-            # Special support for bitnami.
-            if (module_name == 'common') and helm_module.is_contain_bitnami_string():
-                continue
-            if helm_module.has_active_nodeSelector() is False:
-                invalid_module.setdefault(module_name, helm_module)
-        # Bail out the commented out nodeSelector.
-        list_of_module_names_that_fixed_nodeSelector = []
-        for module_name, helm_module in invalid_module.items():
-            if helm_module.has_commentout_nodeSelector():
-                try:
-                    helm_module.correct_commentout_nodeSelector()
-                    r_print.info("Modify(nodeSelector): " + module_name)
-                    list_of_module_names_that_fixed_nodeSelector.append(module_name)
-                except Exception:
-                    pass
-        for module_name in list_of_module_names_that_fixed_nodeSelector:
-            invalid_module.pop(module_name)
-        for module_name in list(set(invalid_module.keys())):
-            r_print.info('Delete(nodeSelector): ' + module_name)
-        return list(set(invalid_module.keys()))
-
-    def __filter_valuesyaml_imagetag(self):
-        invalid_module = []
-        for module_name, helm_module in self.get_all_HelmModule_mapped_by_module_name().items():
-            # Special support for bitnami.
-            if (module_name == 'common') and helm_module.is_contain_bitnami_string():
-                continue
-            if helm_module.has_expected_structure_for_imagetag() is False:
-                invalid_module.append(module_name)
-        for module_name in list(set(invalid_module)):
-            r_print.info('Delete(imageTag): ' + module_name)
-        return list(set(invalid_module))
-
-    def __filter_deprecate(self):
-        invalid_module = []
-        for module_name, helm_module in self.get_all_HelmModule_mapped_by_module_name().items():
-            if helm_module.is_contain_deprecate_string_at_head():
-                invalid_module.append(module_name)
-        for module_name in list(set(invalid_module)):
-            r_print.info('Delete(deprecate): ' + module_name)
-        return list(set(invalid_module))
-
-    def __filter_tldr(self):
-        invalid_module = []
-        for module_name, helm_module in self.get_all_HelmModule_mapped_by_module_name().items():
-            # Special support for bitnami.
-            if (module_name == 'common') and helm_module.is_contain_bitnami_string():
-                continue
-            if helm_module.is_contain_tldr_string() is False:
-                invalid_module.append(module_name)
-        for module_name in list(set(invalid_module)):
-            r_print.info('Delete(TLDR): ' + module_name)
-        return list(set(invalid_module))
-
     def __get_module_list(self):
         stable_module_path = self.repo.get_dirpath_with_prefix()
         li = os.listdir(stable_module_path)
@@ -608,14 +749,14 @@ class ChartInSpecificDir(object):
 
 
 class HelmModule(object):
-    def __init__(self, specific_dir_path, module_name, priority):
+    def __init__(self, specific_dir_path, module_name, priority, settings: Settings):
         self.module_name = module_name
         self.specific_dir_path = specific_dir_path
         self.module_dir_path = os.path.join(specific_dir_path, module_name)
         self.priority = priority
         # Original Object
         self.requirements_yaml = RequirementsYaml(self.module_dir_path, module_name)
-        self.values_yaml = ValuesYaml(self.module_dir_path, module_name)
+        self.values_yaml = ValuesYaml(self.module_dir_path, module_name, settings)
         self.readme_md = ReadmeMd(self.module_dir_path, module_name)
         self.chart_yaml = ChartYaml(self.module_dir_path, module_name)
 
@@ -683,6 +824,10 @@ class HelmModule(object):
     def specify_ingress_for_rdbox(self):
         return self.get_ValuesYaml().specify_ingress_for_rdbox()
 
+    def specify_values_yaml_for_rdbox(self, dry_run=False):
+        result = self.get_ValuesYaml().specify_all_for_rdbox(dry_run)
+        return result, result.get_stage(StageOfNodeSelector.NAME).get_multi_arch_dict()
+
     def is_contain_deprecate_string_at_head(self):
         return self.get_ReadmeMd().is_contain_deprecate_string_at_head()
 
@@ -692,6 +837,9 @@ class HelmModule(object):
     def is_contain_bitnami_string(self):
         return self.get_ReadmeMd().is_contain_bitnami_string()
 
+    def is_library_chart(self):
+        return self.get_ChartYaml().is_library_chart()
+
     def get_install_command(self):
         return self.get_ReadmeMd().get_install_command()
 
@@ -707,10 +855,18 @@ class ChartYaml(object):
         self.module_name = module_name
         self.full_path = os.path.join(module_dir_path, 'Chart.yaml')
 
+    def is_library_chart(self):
+        try:
+            with open(self.full_path) as file:
+                obj_values = yaml_io.safe_load(file)
+            return isinstance(obj_values, dict) and obj_values.get('type') == 'library'
+        except Exception:
+            return False
+
     def customize_chartyaml_for_rdbox(self, dir_to_save_icon):
         file_text = ''
         with open(self.full_path) as file:
-            obj_values = yaml.safe_load(file)
+            obj_values = yaml_io.safe_load(file)
         try:
             obj_values['maintainers'] = [{'name': 'RDBOX Project', 'email': 'info-rdbox@intec.co.jp'}]
             # collect icon image and change the url to RDBOX #
@@ -720,12 +876,15 @@ class ChartYaml(object):
                 _, original_file_ext = os.path.splitext(original_file_name)
                 icon_filename = self.module_name + original_file_ext
                 try:
-                    urllib.request.urlretrieve(url, os.path.join(dir_to_save_icon, icon_filename))
+                    r = Util.get_http_session().get(url)
+                    r.raise_for_status()
+                    with open(os.path.join(dir_to_save_icon, icon_filename), 'wb') as file:
+                        file.write(r.content)
                     obj_values['icon'] = 'https://raw.githubusercontent.com/rdbox-intec/rdbox_app_market/master/icons/' + icon_filename
                 except Exception:
                     pass
             ##################################################
-            file_text = yaml.dump(obj_values)
+            file_text = yaml_io.dump(obj_values)
         except Exception:
             import traceback
             r_logger.warning(traceback.format_exc())
@@ -739,39 +898,55 @@ class ReadmeMd(object):
         self.full_path = os.path.join(module_dir_path, 'README.md')
 
     def is_contain_deprecate_string_at_head(self):
+        return self.get_flags()[0]
+
+    def is_contain_tldr_string(self):
+        return self.is_contain_word_string('TL;DR')
+
+    def is_contain_bitnami_string(self):
+        return self.is_contain_word_string('bitnami')
+
+    def is_contain_word_string(self, word):
         try:
             with open(self.full_path) as file:
                 try:
-                    l_XXX_i = [i for i, line in enumerate(file.readlines()) if 'eprecat' in line or 'EPRECAT' in line]
-                    if len(l_XXX_i) > 0:
-                        if l_XXX_i[0] < 10:
-                            return True
-                    return False
+                    return self.__has_word(file.readlines(), word)
                 except Exception:
                     import traceback
                     r_logger.warning(traceback.format_exc())
         except FileNotFoundError:
             return False
 
-    def is_contain_tldr_string(self):
-        return self.is_contain_word_string('TL;DR')
+    def get_flags(self):
+        """Read README.md once, and check it for the deprecation, TL;DR and bitnami.
 
-    def is_contain_bitnami_string(self):
-        return self.is_contain_word_string('bitnami')
-
-    def is_contain_word_string(self, word):
+        Returns:
+            Tuple[bool, bool, bool]: is_contain_deprecate_string_at_head, is_contain_tldr_string and is_contain_bitnami_string. (Each is None if README.md can not be read)
+        """
         try:
             with open(self.full_path) as file:
                 try:
-                    l_XXX_i = [i for i, line in enumerate(file.readlines()) if word in line]
-                    if len(l_XXX_i) > 0:
-                        return True
-                    return False
+                    lines = file.readlines()
                 except Exception:
                     import traceback
                     r_logger.warning(traceback.format_exc())
+                    return None, None, None
         except FileNotFoundError:
-            return False
+            return False, False, False
+        return self.__is_deprecated_at_head(lines), self.__has_word(lines, 'TL;DR'), self.__has_word(lines, 'bitnami')
+
+    def __is_deprecated_at_head(self, lines):
+        l_XXX_i = [i for i, line in enumerate(lines) if 'eprecat' in line or 'EPRECAT' in line]
+        if len(l_XXX_i) > 0:
+            if l_XXX_i[0] < 10:
+                return True
+        return False
+
+    def __has_word(self, lines, word):
+        l_XXX_i = [i for i, line in enumerate(lines) if word in line]
+        if len(l_XXX_i) > 0:
+            return True
+        return False
 
     def get_install_command(self):
         try:
@@ -836,7 +1011,7 @@ class RequirementsYaml(object):
     def parse(self):
         with open(self.full_path) as file:
             try:
-                obj = yaml.safe_load(file)
+                obj = yaml_io.safe_load(file)
                 for item in obj['dependencies']:
                     req_obj = RequirementsYaml.RequirementObject(item['name'], item['version'], item['repository'], item.get('condition', None), item.get('tags', None))
                     self._list.append(req_obj)
@@ -847,7 +1022,7 @@ class RequirementsYaml(object):
         obj = {'dependencies': []}
         for req_obj in self._list:
             obj['dependencies'].append(req_obj.get_by_dict())
-        text = yaml.dump(obj)
+        text = yaml_io.dump(obj)
         with open(self.full_path, 'w') as file:
             file.write(text)
 
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+import os
+import json
+import hashlib
+import tempfile
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from rdbox_app_market import yaml_io
+from rdbox_app_market.github import GithubRepos, ReferenceGithubRepos
+from rdbox_app_market.conversion_cache import ConversionCache
+from rdbox_app_market.image_arch import ImageArch, ImageArchResolver
+from rdbox_app_market.settings import Settings
+
+from logging import getLogger
+r_logger = getLogger('rdbox_cli')
+r_print = getLogger('rdbox_cli').getChild("stdout")
+
+
+class _IndexLoader(yaml_io.SafeLoader):
+    """SafeLoader that keeps timestamps (like 'created' in index.yaml) as they are written."""
+    pass
+
+
+_IndexLoader.yaml_implicit_resolvers = {
+    first: [(tag, regexp) for tag, regexp in resolvers if tag != 'tag:yaml.org,2002:timestamp']
+    for first, resolvers in yaml_io.SafeLoader.yaml_implicit_resolvers.items()
+}
+
+
+class ChangePlan(object):
+    """ This instance plans which charts have to be processed again.
+
+    The upstream commit of each source repository is recorded in the destination (master) repository.
+    On the next run, the charts changed since then (git diff --name-only) and the charts that depend on them
+    through requirements.yaml are preprocessed and converted again.
+    The architectures of the images of each chart are recorded too. A chart whose images gained or lost an architecture
+    (like an arm64 variant pushed to the registry) is converted again, even without an upstream change.
+    The other charts that were published previously are carried over from the destination repositories.
+    """
+
+    STATE_FILE = '.upstream_commits.yaml'
+
+    def __init__(self, dst_repo_ghpage: GithubRepos, settings: Settings):
+        """ constructor
+
+        Args:
+            dst_repo_ghpage (GithubRepos or AcquisitionTask): The output destination GitHub repository. (gh-pages) It is waited for in load().
+            settings (Settings): settings
+        """
+        self.rdbox_gh_repo = dst_repo_ghpage
+        self.settings = settings
+        self.fingerprint = self.build_fingerprint(settings)
+        self.previous_commits = {}
+        self.processed_commits = {}
+        self.previous_image_archs = {}
+        self.image_archs = {}
+        self.images_by_module = {}
+        self.index = None
+        self.published = set()
+        self.converted = set()
+        self.dirty = set()
+        self.existing = set()
+        self.requirements_by_repo = {}
+        self.changed_by_repo = {}
+
+    @classmethod
+    def build_fingerprint(cls, settings: Settings) -> str:
+        """Settings that change the result of the conversion. If they change, everything is processed again.
+
+        Args:
+            settings (Settings): settings
+
+        Returns:
+            str: Hex string.
+        """
+        material = {
+            'converter_version': ConversionCache.CONVERTER_VERSION,
+            'kubernetes': settings.kubernetes._asdict(),
+            'registry': {'enabled': settings.registry.enabled, 'dockerhub_api': settings.registry.dockerhub_api},
+        }
+        return hashlib.sha256(json.dumps(material, sort_keys=True).encode()).hexdigest()
+
+    @classmethod
+    def build_image_arch_record(cls, image_archs: Dict[Tuple[str, str], ImageArch]) -> List[list]:
+        """The architectures of the images of a chart, as recorded in the state. (Like ConversionCache.build_key)
+
+        Args:
+            image_archs (Dict[Tuple[str, str], ImageArch]): ImageArch mapped by the key. (See ImageArchResolver.build_key)
+
+        Returns:
+            List[list]: Sorted [repository, tag, found, architectures].
+        """
+        return sorted([repository, tag, image_arch.found, list(image_arch.architectures)] for (repository, tag), image_arch in image_archs.items())
+
+    @classmethod
+    def build_state_key(cls, repo: ReferenceGithubRepos) -> str:
+        return '{url}#{branch}:{from_top}'.format(url=repo.get_url(), branch=repo.get_branch(), from_top=repo.get_specific_dir_from_top())
+
+    def get_dirty_module_names(self) -> Set[str]:
+        return self.dirty
+
+    def get_rdbox_gh_repo(self) -> GithubRepos:
+        if hasattr(self.rdbox_gh_repo, 'result'):
+            self.rdbox_gh_repo = self.rdbox_gh_repo.result()
+        return self.rdbox_gh_repo
+
+    def load(self, dst_repo: GithubRepos) -> None:
+        """Read the state recorded by the previous run.
+
+        Args:
+            dst_repo (GithubRepos): The output destination GitHub repository. (master)
+        """
+        self.converted = set(dst_repo.list_dirs_at_head(dst_repo.get_specific_dir_from_top()))
+        text = self.get_rdbox_gh_repo().show_file_at_head(os.path.join(self.get_rdbox_gh_repo().get_specific_dir_from_top(), 'index.yaml'))
+        if text is not None:
+            self.index = yaml_io.safe_load(text, Loader=_IndexLoader) or {}
+            self.published = set(self.index.get('entries', {}).keys())
+        text = dst_repo.show_file_at_head(self.__get_state_path(dst_repo))
+        if text is None or self.index is None:
+            return
+        state = yaml_io.safe_load(text) or {}
+        if state.get('fingerprint') != self.fingerprint:
+            r_print.info('Settings have been changed. All charts are processed.')
+            return
+        self.previous_commits = state.get('repositories', {})
+        self.previous_image_archs = state.get('image_archs', {})
+
+    def save(self, dst_repo: GithubRepos, converted_module_names: Iterable[str] = ()) -> None:
+        """Record the upstream commits processed in this run, and the architectures of the images of the published charts.
+
+        Args:
+            dst_repo (GithubRepos): The output destination GitHub repository. (master)
+            converted_module_names (Iterable[str], optional): Charts converted in this run. Defaults to ().
+        """
+        converted = set(converted_module_names) & set(self.images_by_module.keys())
+        # They are resolved by the conversion already. (Remembered by the resolver)
+        image_archs = dict(self.image_archs)
+        image_archs.update(self.__resolve_image_archs(converted))
+        module_names = (converted | self.get_carried_over_module_names(converted_module_names)) & set(image_archs.keys())
+        state = {'fingerprint': self.fingerprint, 'repositories': self.processed_commits,
+                 'image_archs': {module_name: image_archs[module_name] for module_name in sorted(module_names)}}
+        path = os.path.join(dst_repo.get_dirpath(), self.__get_state_path(dst_repo))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(yaml_io.dump(state))
+
+    def add(self, repo: ReferenceGithubRepos, requirements: Dict[str, List[str]], images: Dict[str, List[Tuple[str, Any]]] = None) -> None:
+        """Add a source repository to the plan. (It can be done as soon as the repository is acquired)
+
+        The images of the charts that are not changed upstream are looked up here. (See ImageArchResolver.prefetch)
+
+        Args:
+            repo (ReferenceGithubRepos): Git repository to reference.
+            requirements (Dict[str, List[str]]): Names of the dependencies, mapped by module name.
+            images (Dict[str, List[Tuple[str, Any]]], optional): The images (repo_uri and tag) looked up by the conversion, mapped by module name. Defaults to None (not looked up).
+        """
+        self.requirements_by_repo[repo] = requirements
+        self.existing |= set(requirements.keys())
+        self.processed_commits[self.build_state_key(repo)] = repo.get_head_commit()
+        if images is not None:
+            self.images_by_module.update(images)
+        changed_in_repo = self.__get_changed_module_names(repo)
+        if changed_in_repo is None:
+            changed_in_repo = set(requirements.keys())
+        elif images is not None:
+            changed_in_repo |= self.__get_arch_changed_module_names((set(requirements.keys()) & self.published) - changed_in_repo)
+        self.changed_by_repo[repo] = changed_in_repo
+
+    def get_selection(self) -> Dict[ReferenceGithubRepos, Set[str]]:
+        """Select the charts to be processed among the repositories added so far.
+
+        A repository added later can add charts to the selection of the earlier ones. (Through the dependencies)
+
+        Returns:
+            Dict[ReferenceGithubRepos, Set[str]]: Module names to be preprocessed, for each repository.
+        """
+        changed = set().union(*self.changed_by_repo.values())
+        # Charts that were converted but not published (or published under another name) are processed again.
+        changed |= (self.converted - self.published) & self.existing
+        # Charts that depend on the changed ones.
+        self.dirty = set(changed)
+        is_updated = True
+        while is_updated:
+            is_updated = False
+            for requirements in self.requirements_by_repo.values():
+                for module_name, dependencies in requirements.items():
+                    if module_name not in self.dirty and len(self.dirty.intersection(dependencies)) > 0:
+                        self.dirty.add(module_name)
+                        is_updated = True
+        # The dependencies are needed to verify the charts. (They can be in other repositories.)
+        dependencies_by_name = {}
+        for requirements in self.requirements_by_repo.values():
+            for module_name, dependencies in requirements.items():
+                dependencies_by_name.setdefault(module_name, set()).update(dependencies)
+        selected = self.dirty & self.existing
+        stack = list(selected)
+        while len(stack) > 0:
+            for dependency in dependencies_by_name.get(stack.pop(), []):
+                if dependency in self.existing and dependency not in selected:
+                    selected.add(dependency)
+                    stack.append(dependency)
+        selection = {}
+        for repo, requirements in self.requirements_by_repo.items():
+            selection[repo] = set(requirements.keys()) & selected
+        return selection
+
+    def select(self, src_repos: List[ReferenceGithubRepos], requirements_by_repo: Dict[ReferenceGithubRepos, Dict[str, List[str]]]) -> Dict[ReferenceGithubRepos, Set[str]]:
+        """Select the charts to be processed in this run.
+
+        Args:
+            src_repos (List[ReferenceGithubRepos]): Git repositories to reference.
+            requirements_by_repo (Dict[ReferenceGithubRepos, Dict[str, List[str]]]): Names of the dependencies, mapped by module name, for each repository.
+
+        Returns:
+            Dict[ReferenceGithubRepos, Set[str]]: Module names to be preprocessed, for each repository.
+        """
+        for repo in src_repos:
+            self.add(repo, requirements_by_repo[repo])
+        selection = self.get_selection()
+        self.report()
+        return selection
+
+    def report(self) -> None:
+        r_print.info('Changed(PLAN): {num} of {all} charts'.format(num=len(self.dirty & self.existing), all=len(self.existing)))
+        r_logger.debug(sorted(self.dirty & self.existing))
+
+    def get_carried_over_module_names(self, converted_module_names: Iterable[str] = ()) -> Set[str]:
+        """Get the charts published previously and not changed.
+
+        Args:
+            converted_module_names (Iterable[str], optional): Charts converted in this run. They are not carried over. Defaults to ().
+
+        Returns:
+            Set[str]: Module names.
+        """
+        return (self.published & self.existing) - self.dirty - set(converted_module_names)
+
+    def carry_over(self, dst_repo_master: GithubRepos, converted_module_names: Iterable[str] = ()) -> str:
+        """Restore the charts carried over in the destination repositories.
+
+        - master: The converted chart directory.
+        - gh-pages: The packaged tgz and the entry of index.yaml.
+
+        Args:
+            dst_repo_master (GithubRepos): The output destination GitHub repository. (master)
+            converted_module_names (Iterable[str], optional): Charts converted in this run. Defaults to ().
+
+        Returns:
+            str: Path of index.yaml that only has the carried over entries. (to be merged) None if nothing is carried over.
+        """
+        module_names = sorted(self.get_carried_over_module_names(converted_module_names))
+        if len(module_names) == 0:
+            return None
+        from_top = dst_repo_master.get_specific_dir_from_top()
+        dst_repo_master.restore_from_head([os.path.join(from_top, module_name) for module_name in module_names])
+        index = dict(self.index)
+        index['entries'] = {module_name: self.index['entries'][module_name] for module_name in module_names}
+        from_top = self.get_rdbox_gh_repo().get_specific_dir_from_top()
+        tgz_paths = []
+        for versions in index['entries'].values():
+            for version in versions:
+                for url in version.get('urls', []):
+                    tgz_paths.append(os.path.join(from_top, os.path.basename(url)))
+        self.get_rdbox_gh_repo().restore_from_head(tgz_paths)
+        for module_name in module_names:
+            r_print.info('CarryOver: ' + module_name)
+        fd, path = tempfile.mkstemp(suffix='.yaml')
+        with os.fdopen(fd, 'w') as file:
+            file.write(yaml_io.dump(index))
+        return path
+
+    def __get_changed_module_names(self, repo: ReferenceGithubRepos):
+        since_commit = self.previous_commits.get(self.build_state_key(repo))
+        if since_commit is None:
+            return None
+        changed_paths = repo.get_changed_paths(since_commit)
+        if changed_paths is None:
+            r_logger.warning('Unavailable commit {commit} of {url}'.format(commit=since_commit, url=repo.get_url()))
+            return None
+        from_top = repo.get_specific_dir_from_top()
+        module_names = set()
+        for path in changed_paths:
+            if from_top != '':
+                path = os.path.relpath(path, from_top)
+            parts = path.split('/')
+            if len(parts) > 1:
+                module_names.add(parts[0])
+        return module_names
+
+    def __get_arch_changed_module_names(self, module_names):
+        self.image_archs.update(self.__resolve_image_archs(module_names))
+        arch_changed = set()
+        for module_name in sorted(module_names):
+            if self.image_archs.get(module_name) != self.previous_image_archs.get(module_name):
+                r_print.info('ArchChanged: ' + module_name)
+                arch_changed.add(module_name)
+        return arch_changed
+
+    def __resolve_image_archs(self, module_names):
+        images_by_module = {module_name: self.images_by_module[module_name] for module_name in module_names if module_name in self.images_by_module}
+        if len(images_by_module) == 0:
+            return {}
+        resolved = ImageArchResolver.get_instance(self.settings).prefetch(images_by_module, self.settings.dockerhub.max_concurrent_requests)
+        return {module_name: self.build_image_arch_record(image_archs) for module_name, image_archs in resolved.items()}
+
+    def __get_state_path(self, dst_repo):
+        return os.path.join(dst_repo.get_specific_dir_from_top(), self.STATE_FILE)
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""Features of the charts in a directory, and the rules that reject charts by them.
+
+The filters of ChartInSpecificDir.preprocessing are RejectionRules. They run per chart, cheapest first,
+and stop at the first rule that rejects the chart. The features are read from the files only when a rule asks for them,
+and each file is read once. (ChartFeatures)
+"""
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+from logging import getLogger
+r_print = getLogger('rdbox_cli').getChild("stdout")
+
+
+class ChartFeatures(object):
+    # Features of README.md. (Read together)
+    README_MD = ('deprecated_at_head', 'tldr', 'bitnami')
+    # Features of values.yaml. (The parsed document is shared)
+    VALUES_YAML = ('active_nodeSelector', 'commentout_nodeSelector', 'expected_structure_for_imagetag', 'storageClass', 'ingress_shape')
+    NAMES = ('module_name',) + VALUES_YAML + README_MD + ('library_chart', 'requirements')
+
+    def __init__(self, helm_module):
+        """Features of a chart. The values are those of the methods of HelmModule. (None is kept as it is)
+
+        - active_nodeSelector: has_active_nodeSelector
+        - commentout_nodeSelector: has_commentout_nodeSelector
+        - expected_structure_for_imagetag: has_expected_structure_for_imagetag (None if no image)
+        - storageClass: values.yaml has storageClass (or commented out one)
+        - ingress_shape: FilterOfIngress.SHAPE_* (None if values.yaml can not be parsed)
+        - deprecated_at_head, tldr, bitnami: is_contain_*_string (None if README.md can not be read)
+        - library_chart: Chart.yaml has "type: library"
+        - requirements: Names in requirements.yaml
+
+        Args:
+            helm_module (HelmModule): The chart.
+        """
+        self.helm_module = helm_module
+        self.features = {'module_name': helm_module.get_module_name()}
+        self.modifications = []
+
+    @classmethod
+    def scan(cls, helm_module) -> 'ChartFeatures':
+        """Read all features of the chart.
+
+        Args:
+            helm_module (HelmModule): The chart.
+
+        Returns:
+            ChartFeatures: The features.
+        """
+        features = cls(helm_module)
+        for name in cls.NAMES:
+            features.get(name)
+        return features
+
+    def get_helm_module(self):
+        return self.helm_module
+
+    def get_module_name(self) -> str:
+        return self.features['module_name']
+
+    def get(self, name: str):
+        """Get a feature. It is read at the first call.
+
+        Args:
+            name (str): One of NAMES
+
+        Returns:
+            Any: The value.
+        """
+        if name not in self.features:
+            self.__read(name)
+        return self.features[name]
+
+    def __read(self, name):
+        helm_module = self.helm_module
+        if name in self.README_MD:
+            self.features.update(zip(self.README_MD, helm_module.get_ReadmeMd().get_flags()))
+        elif name == 'active_nodeSelector':
+            self.features[name] = helm_module.get_ValuesYaml().has_active_nodeSelector()
+        elif name == 'commentout_nodeSelector':
+            self.features[name] = helm_module.get_ValuesYaml().has_commentout_nodeSelector()
+        elif name == 'expected_structure_for_imagetag':
+            self.features[name] = helm_module.get_ValuesYaml().has_expected_structure_for_imagetag()
+        elif name == 'storageClass':
+            self.features[name] = helm_module.get_ValuesYaml().has_storageClass()
+        elif name == 'ingress_shape':
+            self.features[name] = helm_module.get_ValuesYaml().get_ingress_shape()
+        elif name == 'library_chart':
+            self.features[name] = helm_module.is_library_chart()
+        elif name == 'requirements':
+            self.features[name] = tuple(req_obj.get_name() for req_obj in helm_module.get_RequirementObject_list())
+        else:
+            raise KeyError(name)
+
+    def forget_values_yaml(self) -> None:
+        """Forget the features of values.yaml. (After it is changed)"""
+        for name in self.VALUES_YAML:
+            self.features.pop(name, None)
+
+    def add_modification(self, what: str) -> None:
+        self.modifications.append(what)
+
+    def get_modifications(self) -> List[str]:
+        """Get what the rules modified in the chart. (in order)
+
+        Returns:
+            List[str]: like 'nodeSelector' (for "Modify(nodeSelector)")
+        """
+        return self.modifications
+
+    def is_bitnami_common(self) -> bool:
+        """The "common" chart of bitnami. (Special support for bitnami: it is a library and kept as it is)"""
+        return self.get_module_name() == 'common' and bool(self.get('bitnami'))
+
+    def to_dict(self) -> dict:
+        """Get the features read so far.
+
+        Returns:
+            dict: The features. (in the order of NAMES)
+        """
+        return {name: self.features[name] for name in self.NAMES if name in self.features}
+
+
+class ChartFeatureIndex(object):
+    def __init__(self, helm_modules: dict):
+        """Features of charts mapped by module name. (See ChartFeatures)
+
+        Args:
+            helm_modules (Dict[str, HelmModule]): HelmModule() mapped to a module_name.
+        """
+        self.rows = {module_name: ChartFeatures(helm_module) for module_name, helm_module in helm_modules.items()}
+
+    @classmethod
+    def build(cls, helm_modules: dict, max_workers: int = 1) -> 'ChartFeatureIndex':
+        """Read all features of the charts in parallel. (For inspection. The rules read only what they need)
+
+        Args:
+            helm_modules (Dict[str, HelmModule]): HelmModule() mapped to a module_name.
+            max_workers (int, optional): Number of threads. Defaults to 1.
+
+        Returns:
+            ChartFeatureIndex: The index.
+        """
+        index = cls(helm_modules)
+        index.map(lambda row: [row.get(name) for name in ChartFeatures.NAMES], index.rows.keys(), max_workers)
+        return index
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, module_name):
+        return module_name in self.rows
+
+    def get(self, module_name: str) -> ChartFeatures:
+        return self.rows[module_name]
+
+    def map(self, func, module_names: Iterable[str], max_workers: int = 1) -> list:
+        """Apply the function to the rows of the charts in parallel. (The rows of different charts are independent)
+
+        Args:
+            func (Callable[[ChartFeatures], Any]): The function.
+            module_names (Iterable[str]): The charts.
+            max_workers (int, optional): Number of threads. Defaults to 1.
+
+        Returns:
+            list: The results. (in the order of module_names)
+        """
+        rows = [self.rows[module_name] for module_name in module_names]
+        if len(rows) == 0:
+            return []
+        if max_workers <= 1 or len(rows) == 1:
+            return [func(row) for row in rows]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(rows))) as executor:
+            return list(executor.map(func, rows))
+
+    def to_dict(self) -> Dict[str, dict]:
+        return {module_name: row.to_dict() for module_name, row in sorted(self.rows.items())}
+
+    def to_json(self) -> str:
+        """Dump the index for inspection. Only the features read so far are dumped.
+
+        Returns:
+            str: JSON text. (The rows are sorted by module name)
+        """
+        return json.dumps(self.to_dict(), indent=2)
+
+    def dump(self, path: str) -> None:
+        with open(path, 'w') as file:
+            file.write(self.to_json())
+
+
+class BaseRejectionRule(object):
+    # Shown as "Delete(REASON): module_name"
+    REASON = ''
+    # Relative cost of the check. The cheaper rules run first.
+    COST = 0
+
+    def get_reason(self) -> str:
+        return self.REASON
+
+    def get_cost(self) -> int:
+        return self.COST
+
+    def rejects(self, row: ChartFeatures) -> bool:
+        """Check the chart.
+
+        Args:
+            row (ChartFeatures): The features of the chart. (A rule may modify the chart, see ChartFeatures.add_modification)
+
+        Returns:
+            bool: True if the chart is rejected.
+        """
+        raise Exception
+
+
+class RuleOfDeprecate(BaseRejectionRule):
+    REASON = 'deprecate'
+    COST = 1
+
+    def rejects(self, row):
+        return bool(row.get('deprecated_at_head'))
+
+
+class RuleOfTldr(BaseRejectionRule):
+    REASON = 'TLDR'
+    COST = 1
+
+    def rejects(self, row):
+        # Special support for bitnami.
+        return not row.is_bitnami_common() and row.get('tldr') is False
+
+
+class RuleOfNodeSelector(BaseRejectionRule):
+    REASON = 'nodeSelector'
+    COST = 10
+
+    def rejects(self, row):
+        # Special support for bitnami.
+        if row.is_bitnami_common() or row.get('active_nodeSelector') is not False:
+            return False
+        # Bail out the commented out nodeSelector.
+        if row.get('commentout_nodeSelector'):
+            try:
+                row.get_helm_module().correct_commentout_nodeSelector()
+                row.add_modification('nodeSelector')
+                row.forget_values_yaml()
+                return False
+            except Exception:
+                pass
+        return True
+
+
+class RuleOfImageTag(BaseRejectionRule):
+    REASON = 'imageTag'
+    COST = 10
+
+    def rejects(self, row):
+        # Special support for bitnami.
+        return not row.is_bitnami_common() and row.get('expected_structure_for_imagetag') is False
+
+
+class RejectionRules(object):
+    def __init__(self, rules: Iterable[BaseRejectionRule] = ()):
+        """Rules that reject charts. They run cheapest first. (The registration order for the same cost)
+
+        Args:
+            rules (Iterable[BaseRejectionRule], optional): The rules. Defaults to ().
+        """
+        self.rules = []
+        for rule in rules:
+            self.register(rule)
+
+    @classmethod
+    def build_default(cls, check_tldr: bool) -> 'RejectionRules':
+        """The rules of the preprocessing.
+
+        Args:
+            check_tldr (bool): Reject the charts whose README.md has no TL;DR.
+
+        Returns:
+            RejectionRules: The rules.
+        """
+        rules = [RuleOfDeprecate()]
+        if check_tldr:
+            rules.append(RuleOfTldr())
+        # The commented out nodeSelector is corrected before the imageTag is checked.
+        rules.extend([RuleOfNodeSelector(), RuleOfImageTag()])
+        return cls(rules)
+
+    def register(self, rule: BaseRejectionRule) -> None:
+        self.rules.append(rule)
+        self.rules.sort(key=lambda r: r.get_cost())
+
+    def get_rules(self) -> List[BaseRejectionRule]:
+        return self.rules
+
+    def check(self, row: ChartFeatures) -> str:
+        """Run the rules until one rejects the chart.
+
+        Args:
+            row (ChartFeatures): The features of the chart.
+
+        Returns:
+            str: The reason of the rejection. None if the chart passed all rules.
+        """
+        for rule in self.rules:
+            if rule.rejects(row):
+                return rule.get_reason()
+        return None
+
+    def apply(self, feature_index: ChartFeatureIndex, module_names: Iterable[str], max_workers: int = 1) -> List[str]:
+        """Check the charts in parallel, then show the modifications and the rejections. (Modify(...), Delete(...))
+
+        Args:
+            feature_index (ChartFeatureIndex): The features of the charts.
+            module_names (Iterable[str]): The charts to be checked.
+            max_workers (int, optional): Number of threads. Defaults to 1.
+
+        Returns:
+            List[str]: The module names of the rejected charts.
+        """
+        module_names = list(module_names)
+        reasons = feature_index.map(self.check, module_names, max_workers)
+        rejections: List[Tuple[str, str]] = []
+        for module_name, reason in zip(module_names, reasons):
+            for what in feature_index.get(module_name).get_modifications():
+                r_print.info('Modify({what}): {module_name}'.format(what=what, module_name=module_name))
+            if reason is not None:
+                rejections.append((module_name, reason))
+        for module_name, reason in rejections:
+            r_print.info('Delete({reason}): {module_name}'.format(reason=reason, module_name=module_name))
+        return [module_name for module_name, _ in rejections]
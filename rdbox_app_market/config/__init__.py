@@ -10,12 +10,31 @@ DEFAULT_CONFIG_FILE = os.environ.get(
 
 class ConfigUtil(object):
     def __init__(self):
-        self.config = configparser.ConfigParser()
-        self.config.read(DEFAULT_CONFIG_FILE)
+        self.config = None
+
+    def get_config(self):
+        # The file is read at the first use, not at import. (The worker processes get rdbox_app_market.settings.Settings)
+        if self.config is None:
+            self.config = configparser.ConfigParser()
+            self.config.read(DEFAULT_CONFIG_FILE)
+        return self.config
 
 
 _util = ConfigUtil()
 
 
 def get(section, key):
-    return _util.config.get(section, key)
+    return _util.get_config().get(section, key)
+
+
+def getboolean(section, key):
+    return _util.get_config().getboolean(section, key)
+
+
+def read(path):
+    """Read another config file. Its values override the current ones.
+
+    Args:
+        path (str): Path of the config file.
+    """
+    _util.get_config().read(path)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+import os
+import glob
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+
+from rdbox_app_market.util import Util
+from rdbox_app_market.settings import Settings
+
+from logging import getLogger
+r_logger = getLogger('rdbox_cli')
+r_print = getLogger('rdbox_cli').getChild("stdout")
+
+
+class ConversionCache(object):
+    """A persistent, content-addressed cache of converted charts.
+
+    The key is built from the Git tree SHA of the chart directory, the tree SHAs of the dependency charts,
+    the converter version, the settings that affect the conversion and the architectures of the images.
+    (So an entry is not reused after the architectures are looked up again and changed. See [cache] arch_ttl_hours)
+    An entry holds the converted chart directory, the packaged tgz and the icon image.
+    """
+
+    # Increment this when the conversion result changes for the same input.
+    CONVERTER_VERSION = '2'
+
+    CHART_DIR = 'chart'
+    ICONS_DIR = 'icons'
+    META_FILE = 'meta.json'
+
+    def __init__(self, cache_dir, max_size_mb, max_age_days):
+        """ constructor
+
+        Args:
+            cache_dir (str): Directory where the entries are stored.
+            max_size_mb (float): Upper limit of the total size. The least recently used entries are evicted first.
+            max_age_days (float): Entries not used for this period are evicted.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size_mb * 1024 * 1024
+        self.max_age = max_age_days * 24 * 60 * 60
+
+    @classmethod
+    def from_settings(cls, settings: Settings):
+        return cls(settings.cache.conversion_dir, settings.cache.conversion_max_size_mb, settings.cache.conversion_max_age_days)
+
+    def get_cache_dir(self):
+        return self.cache_dir
+
+    def build_key(self, helm_module, annotation, is_manually_repo, repo_for_rdbox, settings: Settings, image_archs=None) -> str:
+        """Build the cache key of a chart before it is converted.
+
+        Args:
+            helm_module (HelmModule): The chart to be converted.
+            annotation (str): The classification of the chart. (isolations or dependons)
+            is_manually_repo (bool): Whether the chart is managed manually.
+            repo_for_rdbox (GithubRepos): Github repository (like gh-pages) for publishing RDBOX App Market
+            settings (Settings): settings ([kubernetes] and [registry] enabled are a part of the key)
+            image_archs (Dict[Tuple[str, str], ImageArch], optional): The architectures of the images of the chart. Defaults to None.
+
+        Returns:
+            str: Hex string of the key. None if the chart directory is empty.
+        """
+        tree = Util.git_tree_hash(helm_module.get_module_dir_path())
+        if tree is None:
+            return None
+        dependencies = {}
+        for req_obj in helm_module.get_RequirementObject_list():
+            dep_path = os.path.join(os.path.dirname(helm_module.get_module_dir_path()), req_obj.get_name())
+            dependencies[req_obj.get_name()] = Util.git_tree_hash(dep_path) if os.path.isdir(dep_path) else None
+        material = {
+            'tree': tree,
+            'dependencies': dependencies,
+            'converter_version': self.CONVERTER_VERSION,
+            'annotation': annotation,
+            'is_manually_repo': is_manually_repo,
+            'url_of_pages': repo_for_rdbox.get_url_of_pages(),
+            'kubernetes': settings.kubernetes._asdict(),
+            'registry': settings.registry.enabled,
+            'image_archs': sorted([repository, tag, image_arch.found, list(image_arch.architectures)]
+                                  for (repository, tag), image_arch in (image_archs or {}).items()),
+        }
+        return hashlib.sha256(json.dumps(material, sort_keys=True).encode()).hexdigest()
+
+    def restore(self, key, module_dir_path, dest_dir_path, dir_to_save_icon) -> str:
+        """Reuse the previously converted chart.
+
+        Args:
+            key (str): The cache key.
+            module_dir_path (str): The chart directory. It is replaced with the converted one.
+            dest_dir_path (str): Directory where the packaged tgz is placed.
+            dir_to_save_icon (str): Directory where the icon image is placed.
+
+        Returns:
+            str: Path of the packaged tgz. None if not cached.
+        """
+        entry_path = self.__get_entry_path(key)
+        meta_path = os.path.join(entry_path, self.META_FILE)
+        try:
+            with open(meta_path) as file:
+                meta = json.load(file)
+            shutil.rmtree(module_dir_path)
+            shutil.copytree(os.path.join(entry_path, self.CHART_DIR), module_dir_path, symlinks=True)
+            tgz_path = os.path.join(dest_dir_path, meta['tgz'])
+            shutil.copyfile(os.path.join(entry_path, meta['tgz']), tgz_path)
+            for icon in glob.glob(os.path.join(entry_path, self.ICONS_DIR, '*')):
+                os.makedirs(dir_to_save_icon, exist_ok=True)
+                shutil.copyfile(icon, os.path.join(dir_to_save_icon, os.path.basename(icon)))
+            os.utime(meta_path)
+            return tgz_path
+        except FileNotFoundError:
+            return None
+
+    def store(self, key, module_dir_path, tgz_path, icon_paths=[]) -> None:
+        """Save a converted chart.
+
+        Args:
+            key (str): The cache key built before the conversion.
+            module_dir_path (str): The converted chart directory.
+            tgz_path (str): Path of the packaged tgz.
+            icon_paths (list[str], optional): Paths of the icon images. Defaults to [].
+        """
+        entry_path = self.__get_entry_path(key)
+        if os.path.isdir(entry_path):
+            return
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        tmp_path = tempfile.mkdtemp(dir=os.path.dirname(entry_path))
+        try:
+            shutil.copytree(module_dir_path, os.path.join(tmp_path, self.CHART_DIR), symlinks=True)
+            shutil.copyfile(tgz_path, os.path.join(tmp_path, os.path.basename(tgz_path)))
+            os.makedirs(os.path.join(tmp_path, self.ICONS_DIR))
+            for icon in icon_paths:
+                shutil.copyfile(icon, os.path.join(tmp_path, self.ICONS_DIR, os.path.basename(icon)))
+            with open(os.path.join(tmp_path, self.META_FILE), 'w') as file:
+                json.dump({'tgz': os.path.basename(tgz_path)}, file)
+            # Another worker may have stored the same key meanwhile.
+            os.rename(tmp_path, entry_path)
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def evict(self) -> list:
+        """Remove entries that are too old, then the least recently used ones until the total size fits.
+
+        Returns:
+            list[str]: Keys of the removed entries.
+        """
+        entries = []
+        for meta_path in glob.glob(os.path.join(self.cache_dir, '*', '*', self.META_FILE)):
+            entry_path = os.path.dirname(meta_path)
+            size = 0
+            for root, _, files in os.walk(entry_path):
+                for name in files:
+                    size += os.path.getsize(os.path.join(root, name))
+            entries.append((os.path.getmtime(meta_path), size, entry_path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        now = time.time()
+        removed = []
+        for mtime, size, entry_path in entries:
+            if now - mtime <= self.max_age and total <= self.max_size:
+                break
+            shutil.rmtree(entry_path, ignore_errors=True)
+            total -= size
+            removed.append(os.path.basename(entry_path))
+        if len(removed) > 0:
+            r_logger.debug('Evicted {num} conversion cache entries.'.format(num=len(removed)))
+        return removed
+
+    def __get_entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+import os
+import fcntl
+import shutil
+import threading
+from git import Git, Repo
+
+from logging import getLogger
+r_logger = getLogger('rdbox_cli')
+r_print = getLogger('rdbox_cli').getChild("stdout")
+
+
+class GitMirrorError(Exception):
+    pass
+
+
+class GitMirror(object):
+    """A persistent clone of a referenced Git repository that is updated incrementally.
+
+    The first run clones the tracked branch. Later runs only fetch the tracked branch and reset the working tree to it.
+    The mirror is guarded by an exclusive file lock while it is in use, so concurrent runs do not corrupt it.
+    If the mirror is damaged, it is thrown away and cloned again.
+
+    When sparse directories are given, the mirror is a partial clone (--filter=blob:none)
+    and only those directories are materialized by a cone mode sparse-checkout.
+
+    The git commands that use the network are killed after the timeout, so a hung clone or fetch does not block the run.
+    """
+
+    LOCK_SUFFIX = '.lock'
+
+    def __init__(self, url, branch, mirror_path, sparse_dirs=[], timeout=None):
+        """ constructor
+
+        Args:
+            url (str): Accessible Git addresses
+            branch (str): Git branch name
+            mirror_path (str): Directory where the mirror is stored persistently.
+            sparse_dirs (list[str], optional): Directories to be checked out. All directories if empty. Defaults to [].
+            timeout (float, optional): Seconds after which the clone or fetch is killed. Defaults to None (no limit).
+        """
+        self.url = url
+        self.branch = branch
+        self.mirror_path = mirror_path
+        self.sparse_dirs = list(sparse_dirs)
+        self.timeout = timeout
+        self.lock_path = mirror_path.rstrip(os.sep) + self.LOCK_SUFFIX
+        self.lock_file = None
+        self.repo = None
+
+    def get_mirror_path(self):
+        return self.mirror_path
+
+    def get_repo(self):
+        return self.repo
+
+    def get_sparse_dirs(self):
+        return self.sparse_dirs
+
+    def acquire(self) -> Repo:
+        """Lock the mirror and bring it up to date with the tracked branch.
+
+        Returns:
+            Repo: The updated repository.
+        """
+        self.__lock()
+        try:
+            self.repo = self.__update()
+        except Exception:
+            self.__unlock()
+            raise
+        r_logger.debug("Branch Info")
+        r_logger.debug(self.repo.head.commit.hexsha)
+        r_logger.debug(self.repo.head.commit.message)
+        return self.repo
+
+    def add_sparse_dirs(self, sparse_dirs) -> None:
+        """Materialize more directories in the acquired mirror.
+
+        Args:
+            sparse_dirs (list[str]): Directories to be checked out. All directories if empty.
+        """
+        if len(self.sparse_dirs) == 0:
+            return
+        if len(sparse_dirs) == 0:
+            self.sparse_dirs = []
+            self.repo.git.sparse_checkout('disable')
+            return
+        new_dirs = [d for d in sparse_dirs if d not in self.sparse_dirs]
+        if len(new_dirs) > 0:
+            self.sparse_dirs.extend(new_dirs)
+            self.repo.git.sparse_checkout('add', *new_dirs)
+
+    def release(self) -> None:
+        """Unlock the mirror.
+        """
+        if self.repo is not None:
+            self.repo.close()
+            self.repo = None
+            self.__unlock()
+
+    def __update(self):
+        if os.path.isdir(self.mirror_path):
+            try:
+                return self.__fetch()
+            except Exception:
+                import traceback
+                r_logger.warning(traceback.format_exc())
+                r_print.info('Reclone(damaged mirror): ' + self.url)
+        return self.__clone()
+
+    def __fetch(self):
+        repo = Repo(self.mirror_path)
+        try:
+            if repo.remote(name='origin').url != self.url:
+                raise GitMirrorError('The mirror refers to another URL. ' + repo.remote(name='origin').url)
+            repo.git.fetch('origin', '+refs/heads/{b}:refs/remotes/origin/{b}'.format(b=self.branch), depth=1, kill_after_timeout=self.timeout)
+            self.__apply_sparse_checkout(repo)
+            repo.git.checkout('-B', self.branch, 'origin/' + self.branch, force=True)
+            repo.git.reset('--hard', 'origin/' + self.branch)
+            repo.git.clean('-ffdx')
+        except Exception:
+            repo.close()
+            raise
+        return repo
+
+    def __clone(self):
+        try:
+            shutil.rmtree(self.mirror_path)
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(self.mirror_path), exist_ok=True)
+        # Not Repo.clone_from, because it runs git as a process that can not be killed after the timeout.
+        if len(self.sparse_dirs) == 0:
+            Git().clone('--', self.url, self.mirror_path, branch=self.branch, depth=1, kill_after_timeout=self.timeout)
+            return Repo(self.mirror_path)
+        Git().clone('--', self.url, self.mirror_path, branch=self.branch, depth=1, filter='blob:none', sparse=True, kill_after_timeout=self.timeout)
+        repo = Repo(self.mirror_path)
+        self.__apply_sparse_checkout(repo)
+        return repo
+
+    def __apply_sparse_checkout(self, repo):
+        if len(self.sparse_dirs) > 0:
+            repo.git.sparse_checkout('set', '--cone', *self.sparse_dirs)
+        elif self.__is_sparse_checkout(repo):
+            repo.git.sparse_checkout('disable')
+
+    def __is_sparse_checkout(self, repo):
+        # The setting may be in config.worktree, so ask git rather than reading .git/config.
+        return repo.git.config('--get', 'core.sparseCheckout', with_exceptions=False) == 'true'
+
+    def __lock(self):
+        os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+        self.lock_file = open(self.lock_path, 'w')
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+
+    def __unlock(self):
+        if self.lock_file is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.lock_file = None
+
+
+class CloneRegistry(object):
+    """Process-wide registry of acquired mirrors.
+
+    One upstream (url, branch) is cloned or fetched once per run.
+    Every ReferenceGithubRepos of the same upstream shares the checkout, and it is released when the last one is closed.
+    """
+
+    _lock = threading.Lock()
+    _entries = {}
+
+    class Entry(object):
+        def __init__(self, mirror):
+            self.mirror = mirror
+            self.count = 0
+            self.lock = threading.Lock()
+
+    @classmethod
+    def checkout(cls, url, branch, mirror_path, sparse_dirs=[], timeout=None) -> GitMirror:
+        """Get the shared mirror of (url, branch). It is acquired on the first call.
+
+        Args:
+            url (str): Accessible Git addresses
+            branch (str): Git branch name
+            mirror_path (str): Directory where the mirror is stored persistently.
+            sparse_dirs (list[str], optional): Directories to be checked out. All directories if empty. Defaults to [].
+            timeout (float, optional): Seconds after which the clone or fetch is killed. Defaults to None (no limit).
+
+        Returns:
+            GitMirror: The acquired mirror.
+        """
+        with cls._lock:
+            entry = cls._entries.get((url, branch))
+            if entry is None:
+                entry = CloneRegistry.Entry(GitMirror(url, branch, mirror_path, sparse_dirs, timeout))
+                cls._entries[(url, branch)] = entry
+            entry.count += 1
+        try:
+            with entry.lock:
+                if entry.mirror.get_repo() is None:
+                    entry.mirror.acquire()
+                else:
+                    entry.mirror.add_sparse_dirs(sparse_dirs)
+        except Exception:
+            cls.release(url, branch)
+            raise
+        return entry.mirror
+
+    @classmethod
+    def release(cls, url, branch) -> None:
+        """Give back the shared mirror of (url, branch). It is released by the last holder.
+
+        Args:
+            url (str): Accessible Git addresses
+            branch (str): Git branch name
+        """
+        with cls._lock:
+            entry = cls._entries.get((url, branch))
+            if entry is None:
+                return
+            entry.count -= 1
+            if entry.count > 0:
+                return
+            cls._entries.pop((url, branch))
+        with entry.lock:
+            entry.mirror.release()
+
+
+class WorktreeStore(object):
+    """One bare clone shared by the working trees of several branches. (git worktree)
+
+    The branches of the same repository (like master and gh-pages) are fetched into one object store,
+    and each branch is checked out into its own worktree that tracks origin/<branch>.
+    Since the branches live in one repository, they can be committed and pushed together.
+    """
+
+    _lock = threading.Lock()
+    _locks = {}
+
+    @classmethod
+    def add_worktree(cls, url, branch, store_path, worktree_path, timeout=None) -> Repo:
+        """Fetch a branch into the store and check it out into a worktree.
+
+        Args:
+            url (str): Accessible Git addresses
+            branch (str): Git branch name
+            store_path (str): Directory of the bare clone.
+            worktree_path (str): Directory where the branch is checked out. It is replaced if it exists.
+            timeout (float, optional): Seconds after which the fetch is killed. Defaults to None (no limit).
+
+        Returns:
+            Repo: The worktree.
+        """
+        with cls._lock:
+            lock = cls._locks.setdefault(store_path, threading.Lock())
+        # git does not allow concurrent shallow fetches into one repository.
+        with lock:
+            store = cls.__open(url, store_path)
+            try:
+                store.git.fetch('origin', '+refs/heads/{b}:refs/remotes/origin/{b}'.format(b=branch), depth=1, kill_after_timeout=timeout)
+                if os.path.exists(worktree_path):
+                    shutil.rmtree(worktree_path)
+                store.git.worktree('prune')
+                os.makedirs(os.path.dirname(worktree_path), exist_ok=True)
+                store.git.worktree('add', '--force', '--track', '-B', branch, worktree_path, 'origin/' + branch)
+            finally:
+                store.close()
+        return Repo(worktree_path)
+
+    @classmethod
+    def __open(cls, url, store_path):
+        if os.path.isdir(store_path):
+            try:
+                store = Repo(store_path)
+                if store.remote(name='origin').url == url:
+                    return store
+                store.close()
+            except Exception:
+                import traceback
+                r_logger.warning(traceback.format_exc())
+            shutil.rmtree(store_path)
+        os.makedirs(os.path.dirname(store_path), exist_ok=True)
+        store = Repo.init(store_path, bare=True)
+        store.create_remote('origin', url)
+        return store
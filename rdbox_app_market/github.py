@@ -1,15 +1,48 @@
 #!/usr/bin/env python3
 from http.client import InvalidURL
 import os
+import copy
+import time
 import shutil
 import glob
-from git import Repo
+from git import GitCommandError
+
+from rdbox_app_market.git_mirror import CloneRegistry, WorktreeStore
+from rdbox_app_market.settings import Settings
 
 from logging import getLogger
 r_logger = getLogger('rdbox_cli')
 r_print = getLogger('rdbox_cli').getChild("stdout")
 
 
+class PushResult(object):
+    """The result of GithubRepos.push_atomically.
+
+    The branches are updated all together or not at all.
+    """
+
+    def __init__(self, branches, is_success, attempts, message=''):
+        self.branches = branches
+        self.success = is_success
+        self.attempts = attempts
+        self.message = message
+
+    def __repr__(self):
+        return "<PushResult '%s' : success=%s, attempts=%d>" % (' '.join(self.branches), self.success, self.attempts)
+
+    def get_branches(self):
+        return self.branches
+
+    def is_success(self):
+        return self.success
+
+    def get_attempts(self):
+        return self.attempts
+
+    def get_message(self):
+        return self.message
+
+
 class GithubRepos(object):
 
     TOP_DIR = os.path.join('/tmp', '.original.charts')
@@ -26,6 +59,9 @@ class GithubRepos(object):
     def get_url(self):
         return self.url
 
+    def get_branch(self):
+        return self.branch
+
     def get_url_of_pages(self):
         url = 'https://{account}.github.io/{repo_name}/{from_top}'.format(
             account=self.get_account_name(),
@@ -42,6 +78,9 @@ class GithubRepos(object):
         if self.url.startswith('git'):
             base = self.url.split(':')[1]
             return base.split('/')[0]
+        if self.url.startswith('file'):
+            # file:///path/to/<account>/<repository>.git
+            return self.url.split('/')[-2]
 
     def get_repository_name(self):
         if self.url.startswith('https'):
@@ -49,6 +88,20 @@ class GithubRepos(object):
         if self.url.startswith('git'):
             base = self.url.split(':')[1]
             return base.split('/')[1].split('.')[0]
+        if self.url.startswith('file'):
+            return self.url.split('/')[-1].split('.')[0]
+
+    @classmethod
+    def is_valid_url(cls, url):
+        """Whether the url is an accessible Git address. (https, git or file (for local bare repositories))
+
+        Args:
+            url (str): Git address
+
+        Returns:
+            bool: True if valid.
+        """
+        return (url.startswith('https') or url.startswith('git') or url.startswith('file://')) and url.endswith('.git')
 
     def get_check_tldr(self):
         return self.check_tldr
@@ -64,17 +117,145 @@ class GithubRepos(object):
         origin = self.repo.remote(name='origin')
         origin.push()
 
+    @classmethod
+    def push_atomically(cls, repos_list, retries, backoff) -> PushResult:
+        """Push the branches of the repositories with one atomic push. (git push --atomic)
+
+        The repositories must be worktrees of the same clone. (see WorktreeStore)
+        If the push is rejected because the remote branches have moved, they are fetched and
+        the local commits are rebased onto them, then the push is retried.
+        Other failures (like authentication or network errors) are not retried.
+
+        Args:
+            repos_list (list[GithubRepos]): The repositories whose branches are pushed.
+            retries (int): Number of the retries. ([git] push_retries)
+            backoff (float): Seconds to wait before the first retry. It doubles for each retry. ([git] push_backoff)
+
+        Returns:
+            PushResult: The result.
+        """
+        if len(set(os.path.realpath(repos.repo.common_dir) for repos in repos_list)) != 1:
+            raise ValueError('The repositories are not worktrees of the same clone.')
+        branches = [repos.get_branch() for repos in repos_list]
+        refspecs = ['refs/heads/{b}:refs/heads/{b}'.format(b=branch) for branch in branches]
+        message = ''
+        for attempt in range(1, retries + 2):
+            try:
+                repos_list[0].repo.git.push('--atomic', '--porcelain', 'origin', *refspecs)
+                return PushResult(branches, True, attempt)
+            except GitCommandError as e:
+                message = str(e)
+                r_logger.warning(message)
+                if not cls.is_rejected_push(e.stdout or ''):
+                    return PushResult(branches, False, attempt, message)
+            if attempt > retries:
+                break
+            time.sleep(backoff * (2 ** (attempt - 1)))
+            try:
+                for repos in repos_list:
+                    repos.rebase_onto_remote()
+            except GitCommandError as e:
+                message = str(e)
+                r_logger.warning(message)
+                return PushResult(branches, False, attempt, message)
+        return PushResult(branches, False, retries + 1, message)
+
+    @classmethod
+    def is_rejected_push(cls, porcelain_output) -> bool:
+        """Whether the push was rejected because the remote branches have moved.
+
+        Args:
+            porcelain_output (str): The standard output of git push --porcelain. (like "!\t<refspec>\t[rejected] (fetch first)")
+
+        Returns:
+            bool: True if any branch was rejected as fetch first or non-fast-forward.
+        """
+        for line in porcelain_output.splitlines():
+            fields = line.split('\t')
+            if len(fields) >= 3 and fields[0] == '!' and fields[2].startswith('[rejected]'):
+                if '(fetch first)' in fields[2] or '(non-fast-forward)' in fields[2]:
+                    return True
+        return False
+
+    def rebase_onto_remote(self):
+        """Fetch the branch and rebase the local commits onto it. (It works in a shallow clone)
+
+        Raises:
+            GitCommandError: The rebase failed. (It is aborted)
+        """
+        base = self.repo.git.rev_parse('refs/remotes/origin/' + self.branch)
+        self.repo.git.fetch('origin', '+refs/heads/{b}:refs/remotes/origin/{b}'.format(b=self.branch), depth=1)
+        if self.repo.git.rev_parse('refs/remotes/origin/' + self.branch) == base:
+            return
+        try:
+            self.repo.git.rebase('--onto', 'refs/remotes/origin/' + self.branch, base, self.branch)
+        except GitCommandError:
+            self.repo.git.rebase('--abort', with_exceptions=False)
+            raise
+
     def is_manually_repo(self):
         raise Exception
 
+    def close(self):
+        pass
+
+    def get_head_commit(self):
+        return self.repo.head.commit.hexsha
+
+    def show_file_at_head(self, path_from_top):
+        """Get the content of a file as it is committed at HEAD. (Even if it is removed from the working tree.)
+
+        Args:
+            path_from_top (str): Path from the top of the repository.
+
+        Returns:
+            str: The content. None if it does not exist.
+        """
+        try:
+            return self.repo.git.show('HEAD:' + path_from_top)
+        except GitCommandError:
+            return None
+
+    def list_dirs_at_head(self, path_from_top):
+        """Get the names of the directories committed at HEAD under a directory.
+
+        Args:
+            path_from_top (str): Path from the top of the repository.
+
+        Returns:
+            list[str]: Directory names.
+        """
+        args = ['-d', '--name-only', 'HEAD']
+        if path_from_top != '':
+            args.append(path_from_top.rstrip('/') + '/')
+        try:
+            result = self.repo.git.ls_tree(*args)
+        except GitCommandError:
+            return []
+        return [os.path.basename(line) for line in result.splitlines()]
+
+    def restore_from_head(self, paths_from_top):
+        """Restore files or directories in the working tree as they are committed at HEAD. Paths that do not exist are ignored.
+
+        Args:
+            paths_from_top (list[str]): Paths from the top of the repository.
+        """
+        if len(paths_from_top) == 0:
+            return
+        existing = self.repo.git.ls_tree('--name-only', 'HEAD', '--', *paths_from_top).splitlines()
+        if len(existing) > 0:
+            self.repo.git.checkout('HEAD', '--', *existing)
+
 
 class ReferenceGithubRepos(GithubRepos):
     """A Git repository to reference when creating a helm chart for rdbox_app_market.
-    """
 
-    REPOS_DIR = os.path.join(GithubRepos.TOP_DIR, 'src')
+    The working tree is a persistent mirror (see GitMirror) stored outside of TOP_DIR.
+    In sparse checkout mode, only specific_dir_from_top is materialized.
+    Instances of the same url and branch share one checkout. (see CloneRegistry)
+    """
 
-    def __init__(self, url, branch, specific_dir_from_top='', check_tldr=False, priority=1):
+    def __init__(self, url, branch, settings: Settings, specific_dir_from_top='', check_tldr=False, priority=1):
         """ A Git repository to reference when creating a helm chart for rdbox_app_market.
 
         constructor
@@ -82,26 +263,30 @@ class ReferenceGithubRepos(GithubRepos):
         Args:
             url (str): Accessible Git addresses
             branch (str): Git branch name
+            settings (Settings): settings ([git] mirror_dir, sparse_checkout and acquisition_timeout)
             specific_dir_from_top (str, optional): Specify this if the helm chart is not in the top Git directory, but is stored under that directory. Defaults to ''.
             check_tldr (bool, optional): Whether or not to verify the helm install command following "TL;DR title".. Defaults to False.
             priority (int, optional): Specifies the priority of multiple referenced Git repositories when they exist. The higher the number, the higher the priority. Defaults to 1.
         """
-        if not ((url.startswith('https') or url.startswith('git')) and url.endswith('.git')):
+        if not self.is_valid_url(url):
             raise InvalidURL(url)
         self.url = url
         self.branch = branch
+        self.settings = settings
         self.specific_dir_from_top = specific_dir_from_top
-        self.repo_dir = os.path.join(self.REPOS_DIR, self.get_account_name(), self.get_repository_name())
+        self.repo_dir = os.path.join(self.get_mirror_dir(), self.get_account_name(), self.get_repository_name(), self.branch)
         self.check_tldr = check_tldr
         self.priority = priority
-        try:
-            shutil.rmtree(self.repo_dir)
-        except FileNotFoundError:
-            os.makedirs(self.repo_dir, exist_ok=True)
-        self.repo = Repo.clone_from(self.url, self.repo_dir, branch=self.branch, depth=1)
-        r_logger.debug("Branch Info")
-        r_logger.debug(self.repo.head.reference.commit.hexsha)
-        r_logger.debug(self.repo.head.reference.commit.message)
+        self.mirror = CloneRegistry.checkout(self.url, self.branch, self.repo_dir, self.get_sparse_dirs(), self.settings.git.acquisition_timeout)
+        self.repo = self.mirror.get_repo()
+
+    def get_mirror_dir(self):
+        return self.settings.git.mirror_dir
+
+    def get_sparse_dirs(self):
+        if self.specific_dir_from_top == '' or not self.settings.git.sparse_checkout:
+            return []
+        return [self.specific_dir_from_top]
 
     def is_manually_repo(self):
         ret = False
@@ -109,14 +294,45 @@ class ReferenceGithubRepos(GithubRepos):
             ret = True
         return ret
 
+    def get_changed_paths(self, since_commit):
+        """Get the paths changed under specific_dir_from_top between a commit and HEAD.
+
+        Args:
+            since_commit (str): The commit processed previously.
+
+        Returns:
+            list[str]: Paths from the top of the repository. None if the commit is not available.
+        """
+        try:
+            self.repo.git.cat_file('-e', since_commit + '^{commit}')
+        except GitCommandError:
+            try:
+                self.repo.git.fetch('origin', since_commit, depth=1, kill_after_timeout=self.settings.git.acquisition_timeout)
+            except GitCommandError:
+                return None
+        pathspec = self.specific_dir_from_top if self.specific_dir_from_top != '' else '.'
+        try:
+            result = self.repo.git.diff('--name-only', '--no-renames', since_commit, 'HEAD', '--', pathspec)
+        except GitCommandError:
+            return None
+        return result.splitlines()
+
+    def close(self):
+        if self.mirror is not None:
+            CloneRegistry.release(self.url, self.branch)
+            self.mirror = None
+
 
 class RdboxGithubRepos(GithubRepos):
     """ A Git repository for managing and distributing the helm chart for rdbox_app_market.
+
+    The branches of the same url share one bare clone (see WorktreeStore), and each branch is a worktree of it.
     """
 
     REPOS_DIR = os.path.join(GithubRepos.TOP_DIR, 'rdbox')
+    STORE_DIR = os.path.join(REPOS_DIR, '.store')
 
-    def __init__(self, url, branch, specific_dir_from_top='', check_tldr=False, priority=1):
+    def __init__(self, url, branch, settings: Settings, specific_dir_from_top='', check_tldr=False, priority=1):
         """ This instant is a Git repository for managing and distributing the helm chart for rdbox_app_market.
 
         constructor
@@ -124,25 +340,44 @@ class RdboxGithubRepos(GithubRepos):
         Args:
             url (str): Accessible Git addresses
             branch (str): Git branch name
+            settings (Settings): settings ([git] acquisition_timeout)
             specific_dir_from_top (str, optional): Specify this if the helm chart is not in the top Git directory, but is stored under that directory. Defaults to ''.
             check_tldr (bool, optional): Whether or not to verify the helm install command following "TL;DR title".. Defaults to False.
             priority (int, optional): Specifies the priority of multiple referenced Git repositories when they exist. The higher the number, the higher the priority. Defaults to 1.
         """
-        if not ((url.startswith('https') or url.startswith('git')) and url.endswith('.git')):
+        if not self.is_valid_url(url):
             raise InvalidURL(url)
         self.url = url
         self.branch = branch
+        self.settings = settings
         self.specific_dir_from_top = specific_dir_from_top
         self.repo_dir = os.path.join(self.REPOS_DIR, branch)
         self.check_tldr = check_tldr
         self.priority = priority
-        try:
-            shutil.rmtree(self.repo_dir)
-        except FileNotFoundError:
-            os.makedirs(self.repo_dir, exist_ok=True)
+        self.store_dir = os.path.join(self.STORE_DIR, self.get_account_name(), self.get_repository_name() + '.git')
         ###
-        self.repo = Repo.clone_from(self.url, self.repo_dir, branch=self.branch, depth=1)
+        self.repo = WorktreeStore.add_worktree(self.url, self.branch, self.store_dir, self.repo_dir, self.settings.git.acquisition_timeout)
         ###
+        self.__clean_specific_dir()
+
+    def get_store_dir(self):
+        return self.store_dir
+
+    def get_view(self, specific_dir_from_top):
+        """Get the same worktree with another specific_dir_from_top. (It is emptied like the constructor does.)
+
+        Args:
+            specific_dir_from_top (str): Directory where the helm charts are stored.
+
+        Returns:
+            RdboxGithubRepos: The instance sharing the worktree with this one.
+        """
+        view = copy.copy(self)
+        view.specific_dir_from_top = specific_dir_from_top
+        view.__clean_specific_dir()
+        return view
+
+    def __clean_specific_dir(self):
         try:
             for target in glob.glob(os.path.join(self.get_dirpath_with_prefix(), '*'), recursive=True):
                 if os.path.isfile(target):
@@ -1,21 +1,32 @@
 #!/usr/bin/env python3
 import os
 import shutil
-import yaml
 import subprocess
 
+from rdbox_app_market import yaml_io
+
 
 class HelmCommand(object):
     """Wrapped HELM command used by rdbox_app_market.
 
     Attributes:
-        helm (str): Full path of platform-specific helm commands.
+        helm (str): Full path of platform-specific helm commands. ([helm] command if it is set.)
     """
 
-    def __init__(self):
+    # The versions of the helm commands, asked once in a process. (See version)
+    _versions = {}
+
+    def __init__(self, command: str = ''):
+        """ constructor
+
+        Args:
+            command (str, optional): Full path of the helm command. ([helm] command) Defaults to '' (the platform default).
+        """
         import platform
         pf = platform.system()
-        if pf == 'Darwin':
+        if command != '':
+            self.helm = command
+        elif pf == 'Darwin':
             # By Brew
             self.helm = os.path.join('/usr', 'local', 'bin', 'helm')
         elif pf == 'Linux':
@@ -25,6 +36,20 @@ class HelmCommand(object):
             # Setuped PATH
             self.helm = 'helm'
 
+    def version(self) -> str:
+        """Get the version of the helm command. (`helm version --short`, asked once in a process)
+
+        Returns:
+            str: like v3.4.1+gc4e7485. '' if it can not be known.
+        """
+        if self.helm not in HelmCommand._versions:
+            try:
+                ret = subprocess.run([self.helm, 'version', '--short'], encoding='utf-8', stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                HelmCommand._versions[self.helm] = ret.stdout.strip() if ret.returncode == 0 else ''
+            except OSError:
+                HelmCommand._versions[self.helm] = ''
+        return HelmCommand._versions[self.helm]
+
     def dep_update(self, specific_dir_path, module_name):
         cmd_list = []
         module_dir_path = os.path.join(specific_dir_path, module_name)
@@ -57,7 +82,7 @@ class HelmCommand(object):
             if chart.startswith('\n#'):
                 chart_lines = chart.split('\n')
                 filename = chart_lines[1].split(' ')[2]
-                body = yaml.safe_load('\n'.join(chart_lines[2:]))
+                body = yaml_io.safe_load('\n'.join(chart_lines[2:]))
                 chart_map.setdefault(filename, body)
         return chart_map
 
@@ -77,13 +102,16 @@ class HelmCommand(object):
             path_of_generation_result = ret.stderr
         return path_of_generation_result
 
-    def repo_index(self, specific_dir_path):
+    def repo_index(self, specific_dir_path, merge_path=None):
         path_of_generation_result = ''
         cmd_list = []
         cmd_list.append(self.helm)
         cmd_list.append('repo')
         cmd_list.append('index')
         cmd_list.append(specific_dir_path)
+        if merge_path is not None:
+            cmd_list.append('--merge')
+            cmd_list.append(merge_path)
         ret = subprocess.run(cmd_list, encoding='utf-8', stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         if ret.returncode == 0:
             path_of_generation_result = os.path.join(specific_dir_path, 'index.yaml')
@@ -0,0 +1,776 @@
+#!/usr/bin/env python3
+"""Architectures of the container images.
+
+FilterOfNodeSelector asks whether an image has an ARM variant for every image of every chart.
+The images are looked up with the tags API of the Docker Hub (DockerhubTagsSource)
+or with the registry v2 API of any registry. (RegistryV2Source)
+Many charts share images, so the answers are remembered in the process (ImageArchResolver)
+and on disk across processes and runs. (ImageArchCache)
+The images of all charts are looked up concurrently before the conversion. (ImageArchResolver.prefetch)
+For offline runs, the answers of a run are exported to a snapshot file and resolved from it later. (ImageArchSnapshot)
+"""
+import os
+import json
+import time
+import hashlib
+import tempfile
+import re
+import threading
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rdbox_app_market.settings import Settings
+
+from logging import getLogger
+r_logger = getLogger('rdbox_cli')
+r_print = getLogger('rdbox_cli').getChild("stdout")
+
+
+class ImageArch(NamedTuple):
+    """Architectures of an image. (repository and tag)"""
+    # False if the registry does not know the image. (404)
+    found: bool
+    architectures: Tuple[str, ...]
+
+    def has_arm(self) -> bool:
+        return any(architecture.startswith('arm') for architecture in self.architectures)
+
+
+ImageArch.NOT_FOUND = ImageArch(False, ())
+
+
+class ImageArchCache(object):
+    """A persistent cache of ImageArch with a TTL.
+
+    An entry is a small JSON file named by the hash of the key. It is written to a temporary file and renamed,
+    so the worker processes can read and write the cache at the same time.
+    """
+
+    def __init__(self, cache_dir: str, ttl_hours: float, negative_ttl_hours: float):
+        """ constructor
+
+        Args:
+            cache_dir (str): Directory where the entries are stored.
+            ttl_hours (float): Entries of the found images are used for this period. (0 disables the cache)
+            negative_ttl_hours (float): Entries of the images not found (404) are used for this period. (0 disables them)
+        """
+        self.cache_dir = cache_dir
+        self.ttl = ttl_hours * 60 * 60
+        self.negative_ttl = negative_ttl_hours * 60 * 60
+
+    @classmethod
+    def from_settings(cls, settings: Settings):
+        return cls(settings.cache.arch_dir, settings.cache.arch_ttl_hours, settings.cache.arch_negative_ttl_hours)
+
+    def get_cache_dir(self):
+        return self.cache_dir
+
+    def get(self, repository: str, tag: str) -> Optional[ImageArch]:
+        """Get the entry of the image.
+
+        Args:
+            repository (str): like library/nginx
+            tag (str): tag
+
+        Returns:
+            ImageArch: The entry. None if it is not cached or expired.
+        """
+        try:
+            with open(self.__get_entry_path(repository, tag)) as file:
+                entry = json.load(file)
+            if entry['repository'] != repository or entry['tag'] != tag:
+                return None
+            image_arch = ImageArch(entry['found'], tuple(entry['architectures']))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        ttl = self.ttl if image_arch.found else self.negative_ttl
+        if time.time() - entry.get('stored_at', 0) > ttl:
+            return None
+        return image_arch
+
+    def put(self, repository: str, tag: str, image_arch: ImageArch) -> None:
+        """Store the entry of the image. (Nothing is stored if its TTL is 0)
+
+        Args:
+            repository (str): like library/nginx
+            tag (str): tag
+            image_arch (ImageArch): The entry.
+        """
+        if (self.ttl if image_arch.found else self.negative_ttl) <= 0:
+            return
+        entry_path = self.__get_entry_path(repository, tag)
+        entry = {'repository': repository, 'tag': tag, 'found': image_arch.found,
+                 'architectures': list(image_arch.architectures), 'stored_at': time.time()}
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path))
+            try:
+                with os.fdopen(fd, 'w') as file:
+                    json.dump(entry, file)
+                os.replace(tmp_path, entry_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        except OSError:
+            import traceback
+            r_logger.warning(traceback.format_exc())
+
+    def evict(self) -> int:
+        """Remove the expired entries.
+
+        Returns:
+            int: Number of the removed entries.
+        """
+        removed = 0
+        now = time.time()
+        max_ttl = max(self.ttl, self.negative_ttl)
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if now - os.path.getmtime(path) > max_ttl:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        if removed > 0:
+            r_logger.debug('Evicted {num} image arch cache entries.'.format(num=removed))
+        return removed
+
+    def __get_entry_path(self, repository, tag):
+        key = hashlib.sha256('{repository}:{tag}'.format(repository=repository, tag=tag).encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+
+class ImageArchSnapshotMiss(Exception):
+    pass
+
+
+class ImageArchSnapshot(object):
+    """The answers of a run, resolved without the network in a later run. (--arch-snapshot)
+
+    The file is a JSON list of the images, sorted by repository and tag, so the same answers make the same file.
+    """
+
+    VERSION = 1
+    # On a miss: assume amd64 only, fail the chart, or look it up as usual.
+    MISS_AMD64 = 'amd64'
+    MISS_FAIL = 'fail'
+    MISS_NETWORK = 'network'
+    MISS_POLICIES = (MISS_AMD64, MISS_FAIL, MISS_NETWORK)
+
+    def __init__(self, image_archs: Dict[Tuple[str, str], ImageArch], miss_policy: str = MISS_AMD64):
+        """ constructor
+
+        Args:
+            image_archs (Dict[Tuple[str, str], ImageArch]): ImageArch mapped by the key. (See ImageArchResolver.build_key)
+            miss_policy (str, optional): One of MISS_POLICIES. Defaults to MISS_AMD64.
+        """
+        self.image_archs = dict(image_archs)
+        self.miss_policy = miss_policy
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> Optional['ImageArchSnapshot']:
+        """Load [registry] snapshot.
+
+        Returns:
+            Optional[ImageArchSnapshot]: The snapshot. None if [registry] snapshot is empty.
+        """
+        if settings.registry.snapshot == '':
+            return None
+        return cls.load(settings.registry.snapshot, settings.registry.snapshot_miss)
+
+    @classmethod
+    def load(cls, path: str, miss_policy: str = MISS_AMD64) -> 'ImageArchSnapshot':
+        """Load the snapshot file.
+
+        Args:
+            path (str): Path of the snapshot file.
+            miss_policy (str, optional): One of MISS_POLICIES. Defaults to MISS_AMD64.
+
+        Raises:
+            ValueError: The file is not a snapshot.
+
+        Returns:
+            ImageArchSnapshot: The snapshot.
+        """
+        with open(path) as file:
+            obj = json.load(file)
+        if not isinstance(obj, dict) or obj.get('version') != cls.VERSION:
+            raise ValueError('{path} is not a snapshot of version {version}.'.format(path=path, version=cls.VERSION))
+        image_archs = {}
+        for image in obj.get('images', []):
+            image_archs[(image['repository'], image['tag'])] = ImageArch(image['found'], tuple(image['architectures']))
+        return cls(image_archs, miss_policy)
+
+    def __len__(self):
+        return len(self.image_archs)
+
+    def get_miss_policy(self) -> str:
+        return self.miss_policy
+
+    def get(self, repository: str, tag: str) -> Optional[ImageArch]:
+        return self.image_archs.get((repository, tag))
+
+    def miss(self, repository: str, tag: str) -> ImageArch:
+        """The answer for an image not in the snapshot. (Not for MISS_NETWORK)
+
+        Raises:
+            ImageArchSnapshotMiss: MISS_FAIL
+
+        Returns:
+            ImageArch: ImageArch.NOT_FOUND (amd64 is assumed) for MISS_AMD64
+        """
+        if self.miss_policy == self.MISS_FAIL:
+            raise ImageArchSnapshotMiss('{repository}:{tag} is not in the snapshot.'.format(repository=repository, tag=tag))
+        return ImageArch.NOT_FOUND
+
+    def to_dict(self) -> dict:
+        images = [{'repository': repository, 'tag': tag, 'found': image_arch.found, 'architectures': list(image_arch.architectures)}
+                  for (repository, tag), image_arch in sorted(self.image_archs.items())]
+        return {'version': self.VERSION, 'images': images}
+
+    def dump(self, path: str) -> None:
+        """Write the snapshot file. (Atomically)
+
+        Args:
+            path (str): Path of the snapshot file.
+        """
+        dir_path = os.path.dirname(os.path.abspath(path))
+        os.makedirs(dir_path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dir_path)
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(self.to_dict(), file, indent=2)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+
+class DockerhubClient(object):
+    """HTTP client of the Docker Hub (and the other registries), shared by threads.
+
+    - The connections are pooled. (Up to max_concurrency)
+    - Each request has a timeout.
+    - Connection errors, 429 and 5xx are retried with an exponential backoff.
+    - The rate limit is honored: While the server says no request remains (X-RateLimit-Remaining: 0, or 429),
+      no thread sends a request until the time it tells. (X-RateLimit-Reset or Retry-After)
+    """
+
+    def __init__(self, max_concurrency: int = 1, timeout: float = None, retries: int = 0, backoff: float = 0):
+        """ constructor
+
+        Args:
+            max_concurrency (int, optional): Number of pooled connections. Defaults to 1.
+            timeout (float, optional): Seconds to wait for the Docker Hub. Defaults to None (no timeout).
+            retries (int, optional): Number of retries. Defaults to 0.
+            backoff (float, optional): Seconds before the first retry. It doubles at each retry. Defaults to 0.
+        """
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.lock = threading.Lock()
+        self.resume_at = 0.0
+
+    @classmethod
+    def from_settings(cls, settings: Settings):
+        dockerhub = settings.dockerhub
+        return cls(dockerhub.max_concurrent_requests, dockerhub.timeout, dockerhub.retries, dockerhub.backoff)
+
+    def get(self, url: str, headers: Dict[str, str] = None) -> requests.Response:
+        """GET the url.
+
+        Args:
+            url (str): url
+            headers (Dict[str, str], optional): The request headers. Defaults to None.
+
+        Raises:
+            requests.RequestException: The last error after the retries.
+
+        Returns:
+            requests.Response: The response. (The last one after the retries)
+        """
+        for attempt in range(self.retries + 1):
+            self.__wait_for_rate_limit()
+            is_last = attempt == self.retries
+            try:
+                r = self.session.get(url, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if is_last:
+                    raise
+                time.sleep(self.backoff * (2 ** attempt))
+                continue
+            wait = self.__update_rate_limit(r)
+            if is_last or not (r.status_code == requests.codes.too_many_requests or r.status_code >= 500):
+                return r
+            if r.status_code != requests.codes.too_many_requests:
+                time.sleep(max(wait, self.backoff * (2 ** attempt)))
+        return r
+
+    def __wait_for_rate_limit(self):
+        with self.lock:
+            wait = self.resume_at - time.time()
+        if wait > 0:
+            r_logger.debug('Wait {sec:.1f} seconds for the rate limit.'.format(sec=wait))
+            time.sleep(wait)
+
+    def __update_rate_limit(self, r):
+        """Returns: float: Seconds to wait before the next request. (0 if not limited)"""
+        headers = r.headers
+        resume_at = 0.0
+        retry_after = self.__parse_number(headers.get('Retry-After'))
+        if r.status_code == requests.codes.too_many_requests:
+            resume_at = time.time() + (retry_after if retry_after is not None else max(self.backoff, 1.0))
+        # The registry of the Docker Hub sends RateLimit-Remaining. (without "X-")
+        remaining = self.__parse_number(headers.get('X-RateLimit-Remaining', headers.get('RateLimit-Remaining')))
+        reset = self.__parse_number(headers.get('X-RateLimit-Reset', headers.get('RateLimit-Reset')))
+        if remaining is not None and remaining <= 0 and reset is not None:
+            resume_at = max(resume_at, reset)
+        if resume_at > 0:
+            with self.lock:
+                self.resume_at = max(self.resume_at, resume_at)
+        return max(resume_at - time.time(), 0)
+
+    def __parse_number(self, value):
+        # like "100" or "100;w=21600"
+        if value is None:
+            return None
+        try:
+            return float(str(value).split(';')[0])
+        except ValueError:
+            return None
+
+
+class BaseArchSource(object):
+    """Where ImageArchResolver looks up the images of some registries."""
+
+    def supports(self, registry: str) -> bool:
+        """Check the registry.
+
+        Args:
+            registry (str): like docker.io or quay.io
+
+        Returns:
+            bool: True if the images of the registry are looked up here.
+        """
+        raise Exception
+
+    def fetch(self, registry: str, repository: str, tag: str) -> Optional[ImageArch]:
+        """Look up the image.
+
+        Args:
+            registry (str): like docker.io or quay.io
+            repository (str): like library/nginx or bitnami/nginx
+            tag (str): like 1.19
+
+        Returns:
+            Optional[ImageArch]: ImageArch.NOT_FOUND if the registry does not have the image. None for the other errors. (Not remembered)
+        """
+        raise Exception
+
+
+class DockerhubTagsSource(BaseArchSource):
+    """The tags API of the Docker Hub. (GET /v2/repositories/<repository>/tags/<tag>)"""
+
+    def __init__(self, url_of_dockerhub: str, client: DockerhubClient):
+        """ constructor
+
+        Args:
+            url_of_dockerhub (str): like https://hub.docker.com
+            client (DockerhubClient): The HTTP client.
+        """
+        self.url_of_dockerhub = url_of_dockerhub
+        self.client = client
+
+    def supports(self, registry):
+        return registry == ImageArchResolver.DOCKERHUB_REGISTRY
+
+    def build_url(self, repository: str, tag: str) -> str:
+        return '{base}/v2/repositories/{uri}/tags/{tag}'.format(base=self.url_of_dockerhub, uri=repository, tag=tag)
+
+    def fetch(self, registry, repository, tag):
+        r = self.client.get(self.build_url(repository, tag))
+        if r.status_code == requests.codes.ok:
+            data = r.json()
+            architectures = tuple(v.get('architecture') for v in data.get('images', []) if v.get('architecture') is not None)
+            return ImageArch(True, architectures)
+        if r.status_code == requests.codes.not_found:
+            return ImageArch.NOT_FOUND
+        r_logger.warning('{status} {url}'.format(status=r.status_code, url=r.url))
+        return None
+
+
+class RegistryV2Source(BaseArchSource):
+    """The registry v2 API. (GET /v2/<repository>/manifests/<tag>)
+
+    The manifest list (or OCI image index) has the architecture of each image, and it is much smaller than
+    the answer of the tags API. The architecture of a single image is in its config blob.
+    The anonymous token is requested as the registry tells. (401 and WWW-Authenticate: Bearer realm=...)
+    """
+
+    MANIFEST_TYPES = (
+        'application/vnd.docker.distribution.manifest.list.v2+json',
+        'application/vnd.oci.image.index.v1+json',
+        'application/vnd.docker.distribution.manifest.v2+json',
+        'application/vnd.oci.image.manifest.v1+json',
+    )
+    PATTERN_CHALLENGE_PARAM = re.compile(r'(\w+)="([^"]*)"')
+    # Seconds to use a token without expires_in.
+    DEFAULT_TOKEN_LIFETIME = 60
+
+    def __init__(self, client: DockerhubClient, dockerhub_url: str = 'https://registry-1.docker.io', plain_http_hosts: Iterable[str] = (),
+                 dockerhub: bool = True, others: bool = True):
+        """ constructor
+
+        Args:
+            client (DockerhubClient): The HTTP client.
+            dockerhub_url (str, optional): The registry of the Docker Hub. Defaults to 'https://registry-1.docker.io'.
+            plain_http_hosts (Iterable[str], optional): Hosts of the registries accessed with http://. Defaults to ().
+            dockerhub (bool, optional): Look up the images on the Docker Hub. Defaults to True.
+            others (bool, optional): Look up the images on the other registries. Defaults to True.
+        """
+        self.client = client
+        self.dockerhub_url = dockerhub_url
+        self.plain_http_hosts = frozenset(plain_http_hosts)
+        self.dockerhub = dockerhub
+        self.others = others
+        # (registry, repository) -> (token, expires_at). The threads share them.
+        self.tokens = {}
+
+    def supports(self, registry):
+        if registry == ImageArchResolver.DOCKERHUB_REGISTRY:
+            return self.dockerhub
+        return self.others
+
+    def get_base_url(self, registry: str) -> str:
+        """The URL of the registry.
+
+        Args:
+            registry (str): like docker.io, quay.io or localhost:5000
+
+        Returns:
+            str: like https://registry-1.docker.io, https://quay.io or http://localhost:5000
+        """
+        if registry == ImageArchResolver.DOCKERHUB_REGISTRY:
+            return self.dockerhub_url
+        scheme = 'http' if registry.split(':')[0] in self.plain_http_hosts else 'https'
+        return '{scheme}://{registry}'.format(scheme=scheme, registry=registry)
+
+    def fetch(self, registry, repository, tag):
+        base = self.get_base_url(registry)
+        r = self.__get(registry, repository, '{base}/v2/{repository}/manifests/{tag}'.format(base=base, repository=repository, tag=tag),
+                       {'Accept': ', '.join(self.MANIFEST_TYPES)})
+        # Unknown, or not pullable anonymously.
+        if r.status_code in (requests.codes.not_found, requests.codes.unauthorized, requests.codes.forbidden):
+            return ImageArch.NOT_FOUND
+        if r.status_code != requests.codes.ok:
+            r_logger.warning('{status} {url}'.format(status=r.status_code, url=r.url))
+            return None
+        manifest = r.json()
+        if 'manifests' in manifest:
+            architectures = [m.get('platform', {}).get('architecture') for m in manifest['manifests']]
+        elif 'config' in manifest:
+            digest = manifest['config'].get('digest')
+            r = self.__get(registry, repository, '{base}/v2/{repository}/blobs/{digest}'.format(base=base, repository=repository, digest=digest))
+            if r.status_code != requests.codes.ok:
+                r_logger.warning('{status} {url}'.format(status=r.status_code, url=r.url))
+                return None
+            architectures = [r.json().get('architecture')]
+        else:
+            # schema 1
+            architectures = [manifest.get('architecture')]
+        # "unknown" is the platform of the attestations.
+        architectures = [architecture for architecture in architectures if architecture not in (None, 'unknown')]
+        return ImageArch(True, tuple(sorted(set(architectures), key=architectures.index)))
+
+    def __get(self, registry, repository, url, headers=None):
+        headers = dict(headers or {})
+        token = self.__get_token(registry, repository)
+        if token is not None:
+            headers['Authorization'] = 'Bearer ' + token
+        r = self.client.get(url, headers)
+        if r.status_code == requests.codes.unauthorized:
+            challenge = r.headers.get('WWW-Authenticate', '')
+            if challenge.startswith('Bearer '):
+                token = self.__request_token(registry, repository, dict(self.PATTERN_CHALLENGE_PARAM.findall(challenge)))
+                if token is not None:
+                    headers['Authorization'] = 'Bearer ' + token
+                    r = self.client.get(url, headers)
+        return r
+
+    def __get_token(self, registry, repository):
+        token, expires_at = self.tokens.get((registry, repository), (None, 0))
+        if expires_at <= time.time():
+            return None
+        return token
+
+    def __request_token(self, registry, repository, params):
+        realm = params.pop('realm', None)
+        if realm is None:
+            return None
+        params.setdefault('scope', 'repository:{repository}:pull'.format(repository=repository))
+        r = self.client.get('{realm}?{query}'.format(realm=realm, query=urlencode(sorted(params.items()))))
+        if r.status_code != requests.codes.ok:
+            r_logger.warning('{status} {url}'.format(status=r.status_code, url=r.url))
+            return None
+        data = r.json()
+        token = data.get('token', data.get('access_token'))
+        if token is None:
+            return None
+        self.tokens[(registry, repository)] = (token, time.time() + float(data.get('expires_in', self.DEFAULT_TOKEN_LIFETIME)))
+        return token
+
+
+class ImageArchResolver(object):
+    """Look up the architectures of the images. (See BaseArchSource)
+
+    The answers are remembered in the process, and in the ImageArchCache if it is given.
+    Errors other than 404 are not remembered.
+    With an ImageArchSnapshot, the images are resolved from it first. (The misses follow its policy)
+    """
+
+    DOCKERHUB_REGISTRY = 'docker.io'
+    DOCKERHUB_ALIASES = ('docker.io', 'index.docker.io', 'registry-1.docker.io')
+
+    _instance = None
+    _instance_pid = None
+    _instance_settings = None
+
+    def __init__(self, url_of_dockerhub: str, cache: ImageArchCache = None, client: DockerhubClient = None, sources: Iterable[BaseArchSource] = None,
+                 snapshot: ImageArchSnapshot = None):
+        """ constructor
+
+        Args:
+            url_of_dockerhub (str): like https://hub.docker.com
+            cache (ImageArchCache, optional): The persistent cache. Defaults to None (only in the process).
+            client (DockerhubClient, optional): The HTTP client. Defaults to None (no timeout and no retry).
+            sources (Iterable[BaseArchSource], optional): The first one that supports the registry is used. Defaults to None (only the tags API of the Docker Hub).
+            snapshot (ImageArchSnapshot, optional): Resolve the images from it first. Defaults to None.
+        """
+        self.url_of_dockerhub = url_of_dockerhub
+        self.cache = cache
+        self.client = client if client is not None else DockerhubClient()
+        if sources is None:
+            sources = [DockerhubTagsSource(url_of_dockerhub, self.client)]
+        self.sources = list(sources)
+        self.snapshot = snapshot
+        self.memo = {}
+
+    @classmethod
+    def get_instance(cls, settings: Settings) -> 'ImageArchResolver':
+        """Get the resolver of this process for the settings. (Like Util.get_http_session)
+
+        Args:
+            settings (Settings): settings ([dockerhub], [registry] and [cache] arch_*)
+
+        Returns:
+            ImageArchResolver: The resolver.
+        """
+        if cls._instance is None or cls._instance_pid != os.getpid() or cls._instance_settings != settings:
+            client = DockerhubClient.from_settings(settings)
+            cls._instance = cls(settings.dockerhub.url, ImageArchCache.from_settings(settings), client, cls.build_sources(settings, client),
+                                ImageArchSnapshot.from_settings(settings))
+            cls._instance_pid = os.getpid()
+            cls._instance_settings = settings
+        return cls._instance
+
+    @classmethod
+    def build_sources(cls, settings: Settings, client: DockerhubClient) -> List[BaseArchSource]:
+        """The sources for the settings.
+
+        Args:
+            settings (Settings): settings ([dockerhub] url and [registry])
+            client (DockerhubClient): The HTTP client.
+
+        Returns:
+            List[BaseArchSource]: The sources.
+        """
+        registry = settings.registry
+        sources = []
+        if registry.dockerhub_api == 'hub':
+            sources.append(DockerhubTagsSource(settings.dockerhub.url, client))
+        sources.append(RegistryV2Source(client, registry.dockerhub_url, registry.plain_http.split(),
+                                        dockerhub=registry.dockerhub_api == 'registry', others=registry.enabled))
+        return sources
+
+    def get_cache(self) -> ImageArchCache:
+        return self.cache
+
+    def get_sources(self) -> List[BaseArchSource]:
+        return self.sources
+
+    @classmethod
+    def split_registry(cls, repo_uri: str) -> Tuple[str, str]:
+        """Split the registry from the repository. (Like docker pull)
+
+        Args:
+            repo_uri (str): like nginx, bitnami/nginx or quay.io/bitnami/nginx
+
+        Returns:
+            Tuple[str, str]: like ('docker.io', 'library/nginx'), ('docker.io', 'bitnami/nginx') or ('quay.io', 'bitnami/nginx')
+        """
+        registry, separator, repository = repo_uri.partition('/')
+        if separator == '' or not ('.' in registry or ':' in registry or registry == 'localhost'):
+            registry, repository = cls.DOCKERHUB_REGISTRY, repo_uri
+        elif registry in cls.DOCKERHUB_ALIASES:
+            registry = cls.DOCKERHUB_REGISTRY
+        # The repository of an official image is in "library".
+        if registry == cls.DOCKERHUB_REGISTRY and '/' not in repository:
+            repository = 'library' + '/' + repository
+        return registry, repository
+
+    @classmethod
+    def normalize_repository(cls, repo_uri: str) -> str:
+        """The repository with the registry. (Without the registry for the Docker Hub)
+
+        Args:
+            repo_uri (str): like nginx, bitnami/nginx or quay.io/bitnami/nginx
+
+        Returns:
+            str: like library/nginx, bitnami/nginx or quay.io/bitnami/nginx
+        """
+        registry, repository = cls.split_registry(repo_uri)
+        if registry == cls.DOCKERHUB_REGISTRY:
+            return repository
+        return registry + '/' + repository
+
+    def supports(self, repo_uri: str) -> bool:
+        """Check whether the image can be looked up.
+
+        Args:
+            repo_uri (str): like nginx, bitnami/nginx or quay.io/bitnami/nginx
+
+        Returns:
+            bool: True if a source supports the registry of the image.
+        """
+        return self.__find_source(self.split_registry(repo_uri)[0]) is not None
+
+    @classmethod
+    def build_key(cls, repo_uri: str, tag) -> Tuple[str, str]:
+        """The key of an image. (repository and tag)
+
+        Args:
+            repo_uri (str): like nginx, bitnami/nginx or quay.io/bitnami/nginx
+            tag (Any): The tag in values.yaml. (It is formatted as a string, like before)
+
+        Returns:
+            Tuple[str, str]: like ('library/nginx', '1.19')
+        """
+        return cls.normalize_repository(repo_uri), '{tag}'.format(tag=tag)
+
+    def resolve(self, repo_uri: str, tag) -> ImageArch:
+        """Get the architectures of the image.
+
+        Args:
+            repo_uri (str): like nginx, bitnami/nginx or quay.io/bitnami/nginx
+            tag (Any): The tag in values.yaml. (It is formatted as a string, like before)
+
+        Returns:
+            ImageArch: The architectures. ImageArch.NOT_FOUND if the registry does not have the image, or no source supports it.
+
+        Raises:
+            ImageArchSnapshotMiss: The image is not in the snapshot. (ImageArchSnapshot.MISS_FAIL)
+        """
+        key = self.build_key(repo_uri, tag)
+        repository, tag = key
+        if key in self.memo:
+            return self.memo[key]
+        if self.snapshot is not None:
+            image_arch = self.snapshot.get(repository, tag)
+            if image_arch is not None:
+                self.memo[key] = image_arch
+                return image_arch
+            if self.snapshot.get_miss_policy() != ImageArchSnapshot.MISS_NETWORK:
+                return self.snapshot.miss(repository, tag)
+        registry, repository_in_registry = self.split_registry(repository)
+        source = self.__find_source(registry)
+        if source is None:
+            return ImageArch.NOT_FOUND
+        image_arch = None
+        if self.cache is not None:
+            image_arch = self.cache.get(repository, tag)
+        if image_arch is None:
+            image_arch = source.fetch(registry, repository_in_registry, tag)
+            if image_arch is None:
+                return ImageArch.NOT_FOUND
+            if self.cache is not None:
+                self.cache.put(repository, tag, image_arch)
+        self.memo[key] = image_arch
+        return image_arch
+
+    def preload(self, image_archs: Dict[Tuple[str, str], ImageArch]) -> None:
+        """Remember the answers resolved in another process. (See prefetch)
+
+        Args:
+            image_archs (Dict[Tuple[str, str], ImageArch]): ImageArch mapped by the key. (See build_key)
+        """
+        self.memo.update(image_archs)
+
+    def prefetch(self, images_by_module: Dict[str, Iterable[Tuple[str, object]]], max_workers: int = 1) -> Dict[str, Dict[Tuple[str, str], ImageArch]]:
+        """Resolve the images of the charts concurrently. Each image is resolved once.
+
+        The errors are logged, and the images are left to be resolved again by the conversion.
+
+        Args:
+            images_by_module (Dict[str, Iterable[Tuple[str, Any]]]): The images (repo_uri and tag) mapped by module name.
+            max_workers (int, optional): Number of threads. Defaults to 1.
+
+        Returns:
+            Dict[str, Dict[Tuple[str, str], ImageArch]]: The resolved ImageArch of each chart. (For preload)
+        """
+        keys_by_module = {module_name: [self.build_key(repo_uri, tag) for repo_uri, tag in images]
+                          for module_name, images in images_by_module.items()}
+        # Unique, in the order of the charts.
+        keys = list(dict.fromkeys(key for module_keys in keys_by_module.values() for key in module_keys))
+        resolved = {}
+        if len(keys) > 0:
+            with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(keys)))) as executor:
+                for key, image_arch in zip(keys, executor.map(self.__resolve_quietly, keys)):
+                    if image_arch is not None:
+                        resolved[key] = image_arch
+            r_logger.debug('Prefetched {num}/{all} images.'.format(num=len(resolved), all=len(keys)))
+        return {module_name: {key: resolved[key] for key in module_keys if key in resolved}
+                for module_name, module_keys in keys_by_module.items()}
+
+    def export_snapshot(self, path: str) -> int:
+        """Write the answers remembered in this process to a snapshot file. (See ImageArchSnapshot)
+
+        Args:
+            path (str): Path of the snapshot file.
+
+        Returns:
+            int: Number of the images.
+        """
+        snapshot = ImageArchSnapshot(self.memo)
+        snapshot.dump(path)
+        return len(snapshot)
+
+    def __resolve_quietly(self, key):
+        try:
+            image_arch = self.resolve(*key)
+        except ImageArchSnapshotMiss as e:
+            r_logger.warning(str(e))
+            return None
+        except Exception:
+            import traceback
+            r_logger.warning(traceback.format_exc())
+            return None
+        # Not remembered. (Like an error other than 404)
+        if key not in self.memo:
+            return None
+        return image_arch
+
+    def __find_source(self, registry):
+        for source in self.sources:
+            if source.supports(registry):
+                return source
+        return None
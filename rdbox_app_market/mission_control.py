@@ -1,25 +1,56 @@
 #!/usr/bin/env python3
 import os
 import shutil
+from multiprocessing import Pool
+from typing import List
 
 from logging import getLogger
 
 from rdbox_app_market.github import GithubRepos, RdboxGithubRepos, ReferenceGithubRepos
-from rdbox_app_market.app_market import Collector, Publisher
+from rdbox_app_market.app_market import Collector, Publisher, ChartInSpecificDir
+from rdbox_app_market.acquisition import RepositoryAcquisition, AcquisitionTask
+from rdbox_app_market.conversion_cache import ConversionCache
+from rdbox_app_market.change_plan import ChangePlan
+from rdbox_app_market.image_arch import ImageArchResolver
+from rdbox_app_market.settings import Settings
 
 r_logger = getLogger('rdbox_cli')
 r_print = getLogger('rdbox_cli').getChild("stdout")
 
 
 class MissionControl(object):
+
+    DST_URL = 'git@github.com:rdbox-intec/rdbox_app_market.git'
+    SPECIFIC_DIR_FROM_TOP = None
+
     @classmethod
-    def launch(cls, exec_publish: bool):
-        raise Exception
+    def launch(cls, exec_publish: bool, settings: Settings, use_cache: bool = True, use_change_plan: bool = True):
+        return MissionControl.launch_all([cls], exec_publish, settings, use_cache, use_change_plan)
 
+    @classmethod
+    def submit_src_repos(cls, acquisition: RepositoryAcquisition, settings: Settings) -> List[AcquisitionTask]:
+        raise Exception
 
-class VendorMissionControl(MissionControl):
     @classmethod
-    def launch(cls, exec_publish: bool):
+    def launch_all(cls, mission_controls: list, exec_publish: bool, settings: Settings, use_cache: bool = True, use_change_plan: bool = True,
+                   export_arch_snapshot: str = None, dump_features: str = None):
+        """Run the missions in one process.
+
+        They share the destination clones, the process pool and the caches.
+        Each branch of the destination repository is committed (and pushed) once, after all missions.
+
+        Args:
+            mission_controls (list[type]): MissionControl subclasses. (VendorMissionControl, RDBOXMissionControl)
+            exec_publish (bool): Do you want to publish it?
+            settings (Settings): settings (Loaded once and passed to everything in the run)
+            use_cache (bool, optional): Reuse the charts converted in previous runs. Defaults to True.
+            use_change_plan (bool, optional): Only process the charts changed since the previous run. Defaults to True.
+            export_arch_snapshot (str, optional): Path to export the architectures of the images looked up in this run. Defaults to None.
+            dump_features (str, optional): Path to dump the features of the collected charts as JSON. (See get_features_path) Defaults to None.
+
+        Returns:
+            bool: Whether all missions succeeded. (Nothing is committed if any of them failed)
+        """
         #########################
         top_dir_path = GithubRepos.TOP_DIR
         try:
@@ -27,95 +58,177 @@ class VendorMissionControl(MissionControl):
         except FileNotFoundError:
             os.makedirs(top_dir_path, exist_ok=True)
         #########################
+        acquisition = RepositoryAcquisition.from_settings(settings)
+        pool = None
         try:
             # ----------------- #
-            src_repos = []
-            src_repos.append(ReferenceGithubRepos(
-                'https://github.com/bitnami/charts.git',
-                'master',
-                specific_dir_from_top='bitnami',
-                check_tldr=True,
-                priority=999))
-            src_repos.append(ReferenceGithubRepos(
-                'https://github.com/helm/charts.git',
-                'master',
-                specific_dir_from_top='stable',
-                check_tldr=False,
-                priority=500))
-            src_repos.append(ReferenceGithubRepos(
-                'https://github.com/helm/charts.git',
-                'master',
-                specific_dir_from_top='incubator',
-                check_tldr=False,
-                priority=499))
+            src_tasks_list = [mission_control.submit_src_repos(acquisition, settings) for mission_control in mission_controls]
             #####################
-            dst_repo_master = RdboxGithubRepos(
-                'git@github.com:rdbox-intec/rdbox_app_market.git',
+            dst_task_master = acquisition.submit(
+                RdboxGithubRepos,
+                cls.DST_URL,
                 'master',
-                specific_dir_from_top='bot-gen',
+                settings=settings,
+                specific_dir_from_top=mission_controls[0].SPECIFIC_DIR_FROM_TOP,
                 check_tldr=False,
                 priority=999)
-            # ----------------- #
-            collector = Collector(src_repos, dst_repo_master)
-            isolations_collect_result, dependons_collect_result = collector.work()
-            # ----------------- #
-            dst_repo_ghpage = RdboxGithubRepos(
-                'git@github.com:rdbox-intec/rdbox_app_market.git',
+            dst_task_ghpage = acquisition.submit(
+                RdboxGithubRepos,
+                cls.DST_URL,
                 'gh-pages',
-                specific_dir_from_top='bot-gen',
+                settings=settings,
+                specific_dir_from_top=mission_controls[0].SPECIFIC_DIR_FROM_TOP,
                 check_tldr=False,
                 priority=999)
+            conversion_cache = cls.build_conversion_cache(use_cache, settings)
+            # The source repositories are still acquired while these are waited for.
+            dst_master = dst_task_master.result()
+            dst_ghpage = dst_task_ghpage.result()
             # ----------------- #
-            publisher = Publisher(isolations_collect_result, dependons_collect_result, dst_repo_ghpage)
-            _ = publisher.work(exec_publish)
-            return True
+            for index, (mission_control, src_tasks) in enumerate(zip(mission_controls, src_tasks_list)):
+                if index > 0:
+                    dst_master = dst_master.get_view(mission_control.SPECIFIC_DIR_FROM_TOP)
+                    dst_ghpage = dst_ghpage.get_view(mission_control.SPECIFIC_DIR_FROM_TOP)
+                change_plan = cls.build_change_plan(use_change_plan, dst_ghpage, settings)
+                features_path = cls.get_features_path(dump_features, mission_control, len(mission_controls))
+                collector = Collector(acquisition.as_completed(src_tasks), dst_master, settings, change_plan, features_path)
+                isolations_collect_result, dependons_collect_result = collector.work()
+                # ----------------- #
+                if pool is None:
+                    pool = Pool(ChartInSpecificDir.get_number_of_processes(settings))
+                publisher = Publisher(isolations_collect_result, dependons_collect_result, dst_ghpage, settings, conversion_cache, change_plan, pool)
+                _ = publisher.work(exec_publish, exec_commit=False)
+            # ----------------- #
+            if export_arch_snapshot is not None:
+                cls.export_arch_snapshot(export_arch_snapshot, settings)
+            return cls.commit_and_push(dst_master, dst_ghpage, exec_publish, settings)
         except Exception:
             import traceback
             r_logger.error(traceback.format_exc())
             return False
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            acquisition.close()
 
-
-class RDBOXMissionControl(MissionControl):
     @classmethod
-    def launch(cls, exec_publish: bool):
-        #########################
-        top_dir_path = GithubRepos.TOP_DIR
-        try:
-            shutil.rmtree(top_dir_path)
-        except FileNotFoundError:
-            os.makedirs(top_dir_path, exist_ok=True)
-        #########################
-        try:
-            # ----------------- #
-            src_repos = []
-            src_repos.append(ReferenceGithubRepos(
-                'https://github.com/rdbox-intec/helm_chart_for_rdbox.git',
-                'master',
-                specific_dir_from_top='rdbox',
-                check_tldr=False,
-                priority=999))
-            #####################
-            dst_repo_master = RdboxGithubRepos(
-                'git@github.com:rdbox-intec/rdbox_app_market.git',
-                'master',
-                specific_dir_from_top='manually',
-                check_tldr=False,
-                priority=999)
-            # ----------------- #
-            collector = Collector(src_repos, dst_repo_master)
-            isolations_collect_result, dependons_collect_result = collector.work()
-            # ----------------- #
-            dst_repo_ghpage = RdboxGithubRepos(
-                'git@github.com:rdbox-intec/rdbox_app_market.git',
-                'gh-pages',
-                specific_dir_from_top='manually',
-                check_tldr=False,
-                priority=999)
-            # ----------------- #
-            publisher = Publisher(isolations_collect_result, dependons_collect_result, dst_repo_ghpage)
-            _ = publisher.work(exec_publish)
+    def commit_and_push(cls, dst_master: RdboxGithubRepos, dst_ghpage: RdboxGithubRepos, exec_publish: bool, settings: Settings) -> bool:
+        """Commit both branches, then push them with one atomic push.
+
+        Args:
+            dst_master (RdboxGithubRepos): The output destination GitHub repository. (master)
+            dst_ghpage (RdboxGithubRepos): The output destination GitHub repository. (gh-pages)
+            exec_publish (bool): Do you want to publish it?
+            settings (Settings): settings ([git] push_retries and push_backoff)
+
+        Returns:
+            bool: False if the push failed. (Neither branch is updated)
+        """
+        # for gh-pages
+        dst_ghpage.commit()
+        r_print.info('commit gh-pages')
+        # for master
+        dst_master.commit()
+        r_print.info('commit master')
+        if not exec_publish:
             return True
-        except Exception:
-            import traceback
-            r_logger.error(traceback.format_exc())
+        result = GithubRepos.push_atomically([dst_ghpage, dst_master], settings.git.push_retries, settings.git.push_backoff)
+        if not result.is_success():
+            r_print.info('PushERR({attempts} attempts): origin {branches}'.format(attempts=result.get_attempts(), branches=' '.join(result.get_branches())))
+            r_logger.error(result.get_message())
             return False
+        r_print.info('push origin {branches}'.format(branches=' '.join(result.get_branches())))
+        return True
+
+    @classmethod
+    def export_arch_snapshot(cls, path: str, settings: Settings) -> None:
+        """Export the architectures of the images prefetched in this run. (See ImageArchSnapshot)
+
+        Args:
+            path (str): Path of the snapshot file.
+            settings (Settings): settings
+        """
+        num = ImageArchResolver.get_instance(settings).export_snapshot(path)
+        r_print.info('export arch snapshot ({num} images): {path}'.format(num=num, path=path))
+
+    @classmethod
+    def get_features_path(cls, path: str, mission_control: type, number_of_missions: int) -> str:
+        """Get the path to dump the features of the charts of a mission.
+
+        Args:
+            path (str): The path given by the user. (None if not dumped)
+            mission_control (type): MissionControl subclass.
+            number_of_missions (int): Number of the missions in the run.
+
+        Returns:
+            str: The path. With several missions, SPECIFIC_DIR_FROM_TOP is added. (like features.bot-gen.json)
+        """
+        if path is None or number_of_missions == 1:
+            return path
+        root, ext = os.path.splitext(path)
+        return '{root}.{from_top}{ext}'.format(root=root, from_top=mission_control.SPECIFIC_DIR_FROM_TOP, ext=ext)
+
+    @classmethod
+    def build_conversion_cache(cls, use_cache: bool, settings: Settings):
+        if use_cache:
+            return ConversionCache.from_settings(settings)
+        return None
+
+    @classmethod
+    def build_change_plan(cls, use_change_plan: bool, dst_ghpage: RdboxGithubRepos, settings: Settings):
+        if use_change_plan:
+            return ChangePlan(dst_ghpage, settings)
+        return None
+
+
+class VendorMissionControl(MissionControl):
+
+    SPECIFIC_DIR_FROM_TOP = 'bot-gen'
+
+    @classmethod
+    def submit_src_repos(cls, acquisition: RepositoryAcquisition, settings: Settings) -> List[AcquisitionTask]:
+        src_tasks = []
+        src_tasks.append(acquisition.submit(
+            ReferenceGithubRepos,
+            'https://github.com/bitnami/charts.git',
+            'master',
+            settings=settings,
+            specific_dir_from_top='bitnami',
+            check_tldr=True,
+            priority=999))
+        src_tasks.append(acquisition.submit(
+            ReferenceGithubRepos,
+            'https://github.com/helm/charts.git',
+            'master',
+            settings=settings,
+            specific_dir_from_top='stable',
+            check_tldr=False,
+            priority=500))
+        src_tasks.append(acquisition.submit(
+            ReferenceGithubRepos,
+            'https://github.com/helm/charts.git',
+            'master',
+            settings=settings,
+            specific_dir_from_top='incubator',
+            check_tldr=False,
+            priority=499))
+        return src_tasks
+
+
+class RDBOXMissionControl(MissionControl):
+
+    SPECIFIC_DIR_FROM_TOP = 'manually'
+
+    @classmethod
+    def submit_src_repos(cls, acquisition: RepositoryAcquisition, settings: Settings) -> List[AcquisitionTask]:
+        src_tasks = []
+        src_tasks.append(acquisition.submit(
+            ReferenceGithubRepos,
+            'https://github.com/rdbox-intec/helm_chart_for_rdbox.git',
+            'master',
+            settings=settings,
+            specific_dir_from_top='rdbox',
+            check_tldr=False,
+            priority=999))
+        return src_tasks
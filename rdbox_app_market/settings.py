@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""Settings of rdbox_app_market.
+
+The values of rdbox_app_market.conf are converted to their types and validated once (Settings.from_config),
+then the immutable Settings is passed to the classes that use it. (Collector, Publisher, ChartInSpecificDir, the filters of values.yaml, ...)
+It is a tuple of plain values, so it is sent to the worker processes with the charts.
+"""
+import os
+import logging
+import configparser
+from typing import NamedTuple, get_type_hints
+
+import rdbox_app_market.config
+
+
+class SettingsError(Exception):
+    pass
+
+
+class RdboxSettings(NamedTuple):
+    maximum_cpu_usage: float
+    log_path: str
+    log_level: str
+    out_level: str
+
+
+class KubernetesSettings(NamedTuple):
+    common_domain: str
+    common_cert: str
+    common_storage: str
+
+
+class DockerhubSettings(NamedTuple):
+    url: str
+    max_concurrent_requests: int
+    timeout: float
+    retries: int
+    backoff: float
+
+
+class RegistrySettings(NamedTuple):
+    # Look up the images on the other registries (quay.io, gcr.io, ...) with the registry v2 API.
+    enabled: bool
+    # The API for the images on the Docker Hub. hub ([dockerhub] url) or registry (dockerhub_url)
+    dockerhub_api: str
+    dockerhub_url: str
+    # Hosts of the registries accessed with http://. (Separated by spaces)
+    plain_http: str
+    # Resolve the images from this snapshot file. (See --arch-snapshot) Empty for none.
+    snapshot: str
+    # On a miss of the snapshot: amd64, fail or network
+    snapshot_miss: str
+
+
+class HelmSettings(NamedTuple):
+    # Full path of the helm command. The platform default if empty.
+    command: str
+
+
+class GitSettings(NamedTuple):
+    mirror_dir: str
+    sparse_checkout: bool
+    max_concurrent_acquisitions: int
+    acquisition_timeout: float
+    push_retries: int
+    push_backoff: float
+
+
+class CacheSettings(NamedTuple):
+    conversion_dir: str
+    conversion_max_size_mb: float
+    conversion_max_age_days: float
+    arch_dir: str
+    arch_ttl_hours: float
+    arch_negative_ttl_hours: float
+    template_dir: str
+    template_max_age_days: float
+
+
+class Settings(NamedTuple):
+    """All sections of rdbox_app_market.conf. (settings.kubernetes.common_domain is [kubernetes] common_domain)"""
+    rdbox: RdboxSettings
+    kubernetes: KubernetesSettings
+    dockerhub: DockerhubSettings
+    registry: RegistrySettings
+    helm: HelmSettings
+    git: GitSettings
+    cache: CacheSettings
+
+    @classmethod
+    def from_config(cls) -> 'Settings':
+        """Load the settings from rdbox_app_market.config. (rdbox_app_market.conf and the files read after it)
+
+        Raises:
+            SettingsError: A value is missing or invalid.
+
+        Returns:
+            Settings: The validated settings.
+        """
+        sections = {}
+        for section, section_class in get_type_hints(cls).items():
+            values = {}
+            for key, value_type in get_type_hints(section_class).items():
+                try:
+                    if value_type is bool:
+                        values[key] = rdbox_app_market.config.getboolean(section, key)
+                    else:
+                        values[key] = value_type(rdbox_app_market.config.get(section, key))
+                except (configparser.Error, ValueError) as e:
+                    raise SettingsError('[{section}] {key}: {e}'.format(section=section, key=key, e=e))
+            sections[section] = section_class(**values)
+        settings = cls(**sections)
+        settings.validate()
+        return settings
+
+    def validate(self):
+        """Check the values that can be converted but are not usable.
+
+        Raises:
+            SettingsError: A value is invalid.
+        """
+        errors = []
+        if self.rdbox.maximum_cpu_usage <= 0:
+            errors.append('[rdbox] maximum_cpu_usage must be positive.')
+        for key in ['log_level', 'out_level']:
+            if not isinstance(logging.getLevelName(getattr(self.rdbox, key)), int):
+                errors.append('[rdbox] {key} is not a level of logging.'.format(key=key))
+        for key, value in self.kubernetes._asdict().items():
+            if value == '':
+                errors.append('[kubernetes] {key} is empty.'.format(key=key))
+        if not self.dockerhub.url.startswith(('http://', 'https://')):
+            errors.append('[dockerhub] url must start with http:// or https://.')
+        for key in ['max_concurrent_requests', 'timeout']:
+            if getattr(self.dockerhub, key) <= 0:
+                errors.append('[dockerhub] {key} must be positive.'.format(key=key))
+        for key in ['retries', 'backoff']:
+            if getattr(self.dockerhub, key) < 0:
+                errors.append('[dockerhub] {key} must not be negative.'.format(key=key))
+        if self.registry.dockerhub_api not in ('hub', 'registry'):
+            errors.append('[registry] dockerhub_api must be hub or registry.')
+        if not self.registry.dockerhub_url.startswith(('http://', 'https://')):
+            errors.append('[registry] dockerhub_url must start with http:// or https://.')
+        if self.registry.snapshot_miss not in ('amd64', 'fail', 'network'):
+            errors.append('[registry] snapshot_miss must be amd64, fail or network.')
+        if self.registry.snapshot != '' and not os.path.isfile(self.registry.snapshot):
+            errors.append('[registry] snapshot {path} does not exist.'.format(path=self.registry.snapshot))
+        for key in ['max_concurrent_acquisitions', 'acquisition_timeout']:
+            if getattr(self.git, key) <= 0:
+                errors.append('[git] {key} must be positive.'.format(key=key))
+        for key in ['push_retries', 'push_backoff']:
+            if getattr(self.git, key) < 0:
+                errors.append('[git] {key} must not be negative.'.format(key=key))
+        for key in ['conversion_max_size_mb', 'conversion_max_age_days', 'arch_ttl_hours', 'arch_negative_ttl_hours', 'template_max_age_days']:
+            if getattr(self.cache, key) < 0:
+                errors.append('[cache] {key} must not be negative.'.format(key=key))
+        if len(errors) > 0:
+            raise SettingsError(' '.join(errors))
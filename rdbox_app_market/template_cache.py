@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import hashlib
+import tempfile
+from typing import Iterable, NamedTuple, Optional, Tuple
+
+from rdbox_app_market.util import Util
+from rdbox_app_market.settings import Settings
+
+from logging import getLogger
+r_logger = getLogger('rdbox_cli')
+
+
+class TemplateValidation(NamedTuple):
+    """The result of the verification of the manifests rendered by `helm template`."""
+    # False if the chart is rejected.
+    correct: bool
+    # The workloads for which nodeSelector is not specified. (Source file names)
+    offending_manifests: Tuple[str, ...]
+
+
+class TemplateValidationCache(object):
+    """A persistent, content-addressed cache of TemplateValidation.
+
+    The key is built from the Git tree SHA of the converted chart directory, the --set list, the helm version
+    and the classification of the chart, so an unchanged chart is not rendered again.
+    An entry is a small JSON file. It is written to a temporary file and renamed, like ImageArchCache.
+    """
+
+    # Increment this when the verification changes for the same manifests.
+    VALIDATOR_VERSION = '1'
+
+    def __init__(self, cache_dir: str, max_age_days: float):
+        """ constructor
+
+        Args:
+            cache_dir (str): Directory where the entries are stored.
+            max_age_days (float): Entries not used for this period are evicted. (0 disables the cache)
+        """
+        self.cache_dir = cache_dir
+        self.max_age = max_age_days * 24 * 60 * 60
+
+    @classmethod
+    def from_settings(cls, settings: Settings):
+        return cls(settings.cache.template_dir, settings.cache.template_max_age_days)
+
+    def get_cache_dir(self):
+        return self.cache_dir
+
+    def is_enabled(self) -> bool:
+        return self.max_age > 0
+
+    def build_key(self, module_dir_path: str, set_list: Iterable[str], helm_version: str, annotation: str) -> Optional[str]:
+        """Build the cache key of a converted chart.
+
+        Args:
+            module_dir_path (str): The converted chart directory.
+            set_list (Iterable[str]): The keys given to `helm template --set`.
+            helm_version (str): The version of the helm command. (See HelmCommand.version)
+            annotation (str): The classification of the chart. (isolations or dependons)
+
+        Returns:
+            Optional[str]: Hex string of the key. None if the cache is disabled or the chart directory is empty.
+        """
+        if not self.is_enabled():
+            return None
+        tree = Util.git_tree_hash(module_dir_path)
+        if tree is None:
+            return None
+        material = {
+            'tree': tree,
+            'set_list': list(set_list),
+            'helm_version': helm_version,
+            'annotation': annotation,
+            'validator_version': self.VALIDATOR_VERSION,
+        }
+        return hashlib.sha256(json.dumps(material, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[TemplateValidation]:
+        """Get the entry. Its mtime is updated, so it is not evicted while it is used.
+
+        Args:
+            key (str): The cache key.
+
+        Returns:
+            Optional[TemplateValidation]: The entry. None if it is not cached.
+        """
+        entry_path = self.__get_entry_path(key)
+        try:
+            with open(entry_path) as file:
+                entry = json.load(file)
+            if entry['key'] != key:
+                return None
+            validation = TemplateValidation(entry['correct'], tuple(entry['offending_manifests']))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return validation
+
+    def put(self, key: str, validation: TemplateValidation) -> None:
+        """Store the entry. (Continue even if it fails)
+
+        Args:
+            key (str): The cache key.
+            validation (TemplateValidation): The entry.
+        """
+        entry_path = self.__get_entry_path(key)
+        entry = {'key': key, 'correct': validation.correct, 'offending_manifests': list(validation.offending_manifests)}
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path))
+            try:
+                with os.fdopen(fd, 'w') as file:
+                    json.dump(entry, file)
+                os.replace(tmp_path, entry_path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+        except OSError:
+            import traceback
+            r_logger.warning(traceback.format_exc())
+
+    def evict(self) -> int:
+        """Remove the entries not used for max_age_days.
+
+        Returns:
+            int: Number of the removed entries.
+        """
+        removed = 0
+        now = time.time()
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    if now - os.path.getmtime(path) > self.max_age:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    pass
+        if removed > 0:
+            r_logger.debug('Evicted {num} template validation cache entries.'.format(num=removed))
+        return removed
+
+    def __get_entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
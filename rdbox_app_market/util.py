@@ -1,9 +1,35 @@
 #!/usr/bin/env python3
+import os
+import hashlib
+import requests
+from typing import Any, Dict, Iterable, List, Tuple
+
 
 class Util(object):
+
+    _http_session = None
+    _http_session_pid = None
+
+    @classmethod
+    def get_http_session(cls) -> requests.Session:
+        """Get the HTTP session of this process. Its connections are reused by later requests.
+
+        A forked worker process does not inherit the session of its parent. It makes its own.
+
+        Returns:
+            requests.Session: HTTP session.
+        """
+        if cls._http_session is None or cls._http_session_pid != os.getpid():
+            cls._http_session = requests.Session()
+            cls._http_session_pid = os.getpid()
+        return cls._http_session
+
     @classmethod
     def has_key_recursion(cls, obj: dict, key: str) -> any:
-        """Returns the value of the first key found in the dictionary. (No recursive search is performed.)
+        """Returns the value of the first key found in the dictionary.
+
+        Each dict is checked for the key before its values are searched. (No recursion, it stops at the first one found)
+        A key whose value is None hides the other keys in the same dict and below it.
 
         Args:
             obj (dict): target
@@ -14,11 +40,19 @@ class Util(object):
         """
         if key in obj:
             return obj[key]
-        for k, v in obj.items():
-            if isinstance(v, dict):
-                item = cls.has_key_recursion(v, key)
-                if item is not None:
-                    return item
+        stack = [iter(obj.values())]
+        while len(stack) > 0:
+            for v in stack[-1]:
+                if isinstance(v, dict):
+                    if key in v:
+                        if v[key] is not None:
+                            return v[key]
+                        continue
+                    stack.append(iter(v.values()))
+                    break
+            else:
+                stack.pop()
+        return None
 
     @classmethod
     def has_key_recursion_full(cls, obj: dict, key: str, now=['_']) -> dict:
@@ -44,16 +78,116 @@ class Util(object):
         Returns:
             dict: A dict that is key for layer info string and this value(any type)
         """
+        return cls.to_dotted_dict(cls.find_keys(obj, [key], tuple(now))[key])
+
+    @classmethod
+    def find_keys(cls, obj: dict, keys: Iterable[str], root: Tuple[str, ...] = ('_',)) -> Dict[str, List[Tuple[Tuple[str, ...], Any]]]:
+        """Find every occurrence of the keys in one traversal of the dict object. (No recursion)
+
+        The path of an occurrence is the tuple of the keys of the dicts that hold it. (root first)
+        One tuple is made for each dict, and it is shared by the occurrences in it.
+        The occurrences of a key are in the order of has_key_recursion_full,
+        and the key is not searched again inside its own value. (The other keys are)
+
+        find_keys({'one': {'two': 'three'}, 'two': {'one': 1}}, ['one', 'two'])
+        >>> {'one': [(('_',), {'two': 'three'}), (('_', 'two'), 1)], 'two': [(('_', 'one'), 'three'), (('_',), {'one': 1})]}
+
+        Args:
+            obj (dict): target
+            keys (Iterable[str]): keys
+            root (Tuple[str, ...], optional): The path of obj. Defaults to ('_',).
+
+        Returns:
+            Dict[str, List[Tuple[Tuple[str, ...], Any]]]: The occurrences (the path and the value) of each key.
+        """
+        occurrences = {key: [] for key in keys}
+        no_blocked = frozenset()
+        # (path, items of the dict, keys that are not searched in the dict)
+        stack = [(root, iter(obj.items()), no_blocked)]
+        while len(stack) > 0:
+            path, items, blocked = stack[-1]
+            for k, v in items:
+                found = k in occurrences and k not in blocked
+                if found:
+                    occurrences[k].append((path, v))
+                if isinstance(v, dict):
+                    blocked_in_v = blocked | {k} if found else blocked
+                    if len(blocked_in_v) < len(occurrences):
+                        stack.append((path + (k,), iter(v.items()), blocked_in_v))
+                        break
+            else:
+                stack.pop()
+        return occurrences
+
+    @classmethod
+    def to_dotted_dict(cls, occurrences: List[Tuple[Tuple[str, ...], Any]]) -> Dict[str, Any]:
+        """Map the occurrences found by find_keys by the dot-separated path. (The first one wins, like has_key_recursion_full)
+
+        Args:
+            occurrences (List[Tuple[Tuple[str, ...], Any]]): The occurrences of a key.
+
+        Returns:
+            Dict[str, Any]: The values mapped by the dot-separated path.
+        """
         fields_found = {}
-        for k, v in obj.items():
-            if k == key:
-                keyword = '.'.join(now)
-                fields_found.setdefault(keyword, v)
-            elif isinstance(v, dict):
-                _now = []
-                _now.extend(now)
-                _now.append(k)
-                results = cls.has_key_recursion_full(v, key, _now)
-                for struct, result in results.items():
-                    fields_found.setdefault(struct, result)
+        for path, value in occurrences:
+            fields_found.setdefault('.'.join(path), value)
         return fields_found
+
+    @classmethod
+    def first_of_occurrences(cls, occurrences: List[Tuple[Tuple[str, ...], Any]]) -> Any:
+        """Get the value has_key_recursion returns, from the occurrences found by find_keys.
+
+        Args:
+            occurrences (List[Tuple[Tuple[str, ...], Any]]): The occurrences of a key.
+
+        Returns:
+            Any: The value. None if not found.
+        """
+        # has_key_recursion does not search below a dict that has the key.
+        paths = set(path for path, _ in occurrences)
+        for path, value in occurrences:
+            if value is not None and not any(path[:i] in paths for i in range(1, len(path))):
+                return value
+        return None
+
+    @classmethod
+    def git_tree_hash(cls, dir_path: str) -> str:
+        """Calculates the Git tree object name (SHA-1) of a directory without using Git.
+
+        The result is identical to `git rev-parse HEAD:<dir>` for a committed directory.
+        Empty directories are ignored, as in Git.
+
+        Args:
+            dir_path (str): target directory
+
+        Returns:
+            str: Hex string of the tree SHA-1. None if the directory holds no files.
+        """
+        entries = []
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                if entry.name == '.git':
+                    continue
+                if entry.is_symlink():
+                    data = os.readlink(entry.path).encode()
+                    entries.append((entry.name, b'120000', cls.__git_object_hash(b'blob', data)))
+                elif entry.is_dir():
+                    tree = cls.git_tree_hash(entry.path)
+                    if tree is not None:
+                        entries.append((entry.name + '/', b'40000', bytes.fromhex(tree)))
+                elif entry.is_file():
+                    with open(entry.path, 'rb') as file:
+                        data = file.read()
+                    mode = b'100755' if os.access(entry.path, os.X_OK) else b'100644'
+                    entries.append((entry.name, mode, cls.__git_object_hash(b'blob', data)))
+        if len(entries) == 0:
+            return None
+        body = b''
+        for name, mode, sha in sorted(entries, key=lambda e: e[0].encode()):
+            body += mode + b' ' + name.rstrip('/').encode() + b'\0' + sha
+        return cls.__git_object_hash(b'tree', body).hex()
+
+    @classmethod
+    def __git_object_hash(cls, kind: bytes, data: bytes) -> bytes:
+        return hashlib.sha1(kind + b' ' + str(len(data)).encode() + b'\0' + data).digest()
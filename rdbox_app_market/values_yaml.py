@@ -1,28 +1,50 @@
 #!/usr/bin/env python3
 import os
-import requests
-import yaml
+import stat
+import difflib
+import tempfile
 import re
-from typing import Dict, List, Tuple
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Union
 from logging import getLogger
 
-import rdbox_app_market.config
+from rdbox_app_market import yaml_io
 from rdbox_app_market.util import Util
+from rdbox_app_market.settings import Settings
+from rdbox_app_market.image_arch import ImageArchResolver
 
 r_logger = getLogger('rdbox_cli')
 r_print = getLogger('rdbox_cli').getChild("stdout")
 
 
 class ValuesYaml(object):
-    def __init__(self, module_dir_path: str, module_name: str):
+    def __init__(self, module_dir_path: str, module_name: str, settings: Settings):
         self.module_name = module_name
+        self.settings = settings
         self.full_path = os.path.join(module_dir_path, 'values.yaml')
+        self.document = None
+
+    def __getstate__(self):
+        # The document is not sent to the worker processes. It is read again from values.yaml.
+        state = self.__dict__.copy()
+        state['document'] = None
+        return state
+
+    def get_document(self) -> 'ValuesYamlDocument':
+        """Get the in-memory document of values.yaml.
+
+        It is read at the first call, and replaced only when values.yaml is written by this instance.
+
+        Returns:
+            ValuesYamlDocument: The document of values.yaml.
+        """
+        if self.document is None:
+            self.document = ValuesYamlDocument(self.readlines())
+        return self.document
 
     def has_active_nodeSelector(self) -> bool:
         try:
-            lines = self.readlines()
-            obj_values = yaml.safe_load(''.join(lines))
-            if Util.has_key_recursion(obj_values, 'nodeSelector') is None:
+            if self.get_document().get_features().get_first('nodeSelector') is None:
                 return False
             else:
                 return True
@@ -33,7 +55,7 @@ class ValuesYaml(object):
 
     def has_commentout_nodeSelector(self) -> bool:
         try:
-            lines = self.readlines()
+            lines = self.get_document().get_lines()
             l_XXX_i = [i for i, line in enumerate(lines) if '# nodeSelector: ' in line]
             if len(l_XXX_i) > 0:
                 return True
@@ -46,13 +68,8 @@ class ValuesYaml(object):
 
     def correct_commentout_nodeSelector(self):
         try:
-            is_changed = False
-            file_text = ''.join(self.readlines())
-            write_text = file_text.replace('# nodeSelector: ', 'nodeSelector: {} #')
-            if file_text != write_text:
-                self.write_text(write_text)
-                is_changed = True
-            return write_text, is_changed
+            result = self.rewrite([StageOfCommentoutNodeSelector()])
+            return result.get_file_text(), result.is_changed()
         except Exception as e:
             import traceback
             r_logger.warning(traceback.format_exc())
@@ -60,9 +77,7 @@ class ValuesYaml(object):
 
     def has_expected_structure_for_imagetag(self):
         try:
-            lines = self.readlines()
-            values_yaml_obj = yaml.safe_load(''.join(lines))
-            values_yaml_obj = Util.has_key_recursion(values_yaml_obj, 'image')
+            values_yaml_obj = self.get_document().get_features().get_first('image')
             if values_yaml_obj is not None:
                 if ('repository' in values_yaml_obj or 'name' in values_yaml_obj) and ('tag' in values_yaml_obj):
                     return True
@@ -74,33 +89,87 @@ class ValuesYaml(object):
             return False
 
     def specify_nodeSelector_for_rdbox(self):
-        file_text = ""
-        lines = self.readlines()
-        flt = FilterOfNodeSelector(self.module_name, lines)
-        file_text, is_changed = flt.filter()
-        multi_arch_dict = flt.get_multi_arch_dict(lines)
-        if is_changed:
-            self.write_text(file_text)
-        return file_text, is_changed, multi_arch_dict
+        stage = StageOfNodeSelector()
+        result = self.rewrite([stage])
+        return result.get_file_text(), result.is_changed(), stage.get_multi_arch_dict()
+
+    def has_storageClass(self) -> bool:
+        try:
+            return self.get_document().get_line_table().has_key_or_commented_key('storageClass')
+        except Exception:
+            import traceback
+            r_logger.warning(traceback.format_exc())
+            return False
+
+    def get_images_to_look_up(self) -> List[Tuple[str, Any]]:
+        """Get the images whose architectures are looked up by the conversion. (See ImageArchResolver.prefetch)
+
+        Returns:
+            List[Tuple[str, Any]]: URI of a repository and the tag. [] if values.yaml can not be parsed.
+        """
+        try:
+            document = self.get_document()
+            images = FilterOfNodeSelector.get_images_to_look_up(document.get_line_table(), document.get_features(), self.settings)
+            return [(repo_uri, image_dict.get('tag')) for _, image_dict, repo_uri in images]
+        except Exception:
+            import traceback
+            r_logger.warning(traceback.format_exc())
+            return []
+
+    def get_ingress_shape(self) -> str:
+        """Get the shape of the ingressTags. (See FilterOfIngress.get_shape)
+
+        Returns:
+            str: The shape. None if values.yaml can not be parsed.
+        """
+        try:
+            document = self.get_document()
+            return FilterOfIngress(self.module_name, self.settings, document.get_lines(), document).get_shape()
+        except Exception:
+            import traceback
+            r_logger.warning(traceback.format_exc())
+            return None
 
     def specify_storageClass_for_rdbox(self):
-        file_text = ''
-        lines = self.readlines()
-        flt = FilterOfStorageClass(self.module_name, lines)
-        file_text, is_changed = flt.filter()
-        if is_changed:
-            self.write_text(file_text)
-        return file_text, is_changed
+        result = self.rewrite([StageOfStorageClass()])
+        return result.get_file_text(), result.is_changed()
 
     def specify_ingress_for_rdbox(self):
-        file_text = ""
-        lines = self.readlines()
-        flt = FilterOfIngress(self.module_name, lines)
-        lines, is_changed = flt.filter()
-        file_text = ''.join(lines)
-        if is_changed:
-            self.write_text(file_text)
-        return file_text, is_changed
+        result = self.rewrite([StageOfIngress()])
+        return result.get_file_text(), result.is_changed()
+
+    def specify_all_for_rdbox(self, dry_run: bool = False) -> 'ValuesYamlRewriteResult':
+        """Specify storageClass, ingress and nodeSelector for RDBOX in one pass.
+
+        Only the nodeSelector is required. If storageClass or ingress fails, it is skipped.
+
+        Args:
+            dry_run (bool, optional): Do not write values.yaml. Defaults to False.
+
+        Returns:
+            ValuesYamlRewriteResult: The result. (The multi-arch dict is in the stage of nodeSelector)
+        """
+        stages = [StageOfStorageClass(is_required=False), StageOfIngress(is_required=False), StageOfNodeSelector()]
+        return self.rewrite(stages, dry_run)
+
+    def rewrite(self, stages: List['BaseStageOfValuesYaml'], dry_run: bool = False) -> 'ValuesYamlRewriteResult':
+        """Run the stages over the document in order, and write values.yaml once if it is changed.
+
+        Args:
+            stages (List[BaseStageOfValuesYaml]): The stages.
+            dry_run (bool, optional): Do not write values.yaml, only report the result. (See ValuesYamlRewriteResult.get_diff) Defaults to False.
+
+        Raises:
+            Exception: A required stage failed. (Nothing is written)
+
+        Returns:
+            ValuesYamlRewriteResult: The result.
+        """
+        document = self.get_document()
+        result = ValuesYamlPipeline(self.module_name, self.settings, stages).run(document)
+        if result.is_changed() and not dry_run:
+            self.__save(result.get_document().get_lines())
+        return result
 
     def readlines(self):
         lines = []
@@ -108,100 +177,458 @@ class ValuesYaml(object):
             lines = file.readlines()
         return lines
 
-    def write_text(self, file_text):
-        with open(self.full_path, 'w') as file:
-            file.write(file_text)
+    def write_text(self, file_text: Union[str, Iterable[str]]):
+        """Write values.yaml atomically.
+
+        The lines are streamed to a temporary file in the same directory, and it replaces values.yaml at the end.
+        values.yaml is never left half-written, and the mode of values.yaml is kept.
+
+        Args:
+            file_text (Union[str, Iterable[str]]): The text, or the lines. (ex. FilterOfNodeSelector.iter_lines())
+        """
+        if isinstance(file_text, str):
+            file_text = [file_text]
+        dir_path = os.path.dirname(self.full_path)
+        try:
+            mode = stat.S_IMODE(os.stat(self.full_path).st_mode)
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        fd, tmp_path = tempfile.mkstemp(prefix='.values.yaml.', dir=dir_path)
+        try:
+            with os.fdopen(fd, 'w') as file:
+                file.writelines(file_text)
+            os.chmod(tmp_path, mode)
+            os.replace(tmp_path, self.full_path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def __save(self, lines):
+        self.write_text(lines)
+        self.document = ValuesYamlDocument(lines)
+
+
+class ValuesYamlDocument(object):
+    def __init__(self, lines: List[str]):
+        """values.yaml in memory
+
+        The parsed object and the indent info are derived lazily from the lines, and only once.
+        The lines are the only copy of the text. (get_text joins them at each call)
+        Do not modify the lines. (Copy them before editing)
+
+        Args:
+            lines (list): A list of values.yaml divided by a new line
+        """
+        self.lines = lines
+        self.obj = None
+        self.is_parsed = False
+        self.parse_error = None
+        self.line_table = None
+        self.features = None
+
+    def get_lines(self) -> List[str]:
+        return self.lines
+
+    def get_text(self) -> str:
+        return ''.join(self.lines)
+
+    def get_obj(self):
+        """Get the object parsed by yaml_io.safe_load.
+
+        Raises:
+            yaml_io.YAMLError: values.yaml is not valid YAML. (The same error is raised again at the next call)
+
+        Returns:
+            Any: The parsed object. (Do not modify it)
+        """
+        if not self.is_parsed:
+            try:
+                self.obj = yaml_io.safe_load(self.get_text())
+            except yaml_io.YAMLError as e:
+                self.parse_error = e
+            self.is_parsed = True
+        if self.parse_error is not None:
+            raise self.parse_error
+        return self.obj
+
+    def get_line_table(self) -> 'LineTable':
+        if self.line_table is None:
+            self.line_table = LineTable(self.lines)
+        return self.line_table
+
+    def get_features(self) -> 'ValuesYamlFeatures':
+        """Get the keys of the parsed object that the checks and the filters look for. (See ValuesYamlFeatures)
+
+        Raises:
+            yaml_io.YAMLError: values.yaml is not valid YAML.
+
+        Returns:
+            ValuesYamlFeatures: The keys found in one traversal of the parsed object.
+        """
+        if self.features is None:
+            self.features = ValuesYamlFeatures(self.get_obj())
+        return self.features
+
+    def get_indent_info(self) -> Tuple[List[int], int]:
+        """Get the indent of each line and the unit of the indent. (See IndentList)
+
+        Returns:
+            List[int]: The indent of each line. (-1 means a line to be ignored)
+            int: The unit of the indent.
+        """
+        line_table = self.get_line_table()
+        return line_table.get_indent_list(), line_table.get_unit_indent_length()
+
+
+class ValuesYamlFeatures(object):
+    KEYS = ('image', 'ingress', 'nodeSelector')
+
+    def __init__(self, obj_values):
+        """The occurrences of KEYS in the object parsed from values.yaml.
+
+        All of them are found in one traversal. (Util.find_keys)
+        The paths stay tuples until the dot-separated form is asked for.
+
+        Args:
+            obj_values (Any): The object parsed from values.yaml. (It must be a dict)
+        """
+        self.occurrences = Util.find_keys(obj_values, self.KEYS)
+        self.dicts = {}
+
+    def get_occurrences(self, key: str) -> List[Tuple[Tuple[str, ...], Any]]:
+        """Get the occurrences of the key.
+
+        Args:
+            key (str): One of KEYS
+
+        Returns:
+            List[Tuple[Tuple[str, ...], Any]]: The path (The keys from the top layer "_") and the value of each occurrence.
+        """
+        return self.occurrences[key]
+
+    def get_dicts(self, key: str) -> Dict[str, Any]:
+        """Get the values of the key by the layer. (Same as Util.has_key_recursion_full)
+
+        Args:
+            key (str): One of KEYS
+
+        Returns:
+            Dict[str, Any]: key is Dot-separated characters indicate a layer. (Do not modify it)
+        """
+        if key not in self.dicts:
+            self.dicts[key] = Util.to_dotted_dict(self.occurrences[key])
+        return self.dicts[key]
+
+    def get_first(self, key: str) -> Any:
+        """Get the value of the first key found. (Same as Util.has_key_recursion)
+
+        Args:
+            key (str): One of KEYS
+
+        Returns:
+            Any: The value. None if not found.
+        """
+        return Util.first_of_occurrences(self.occurrences[key])
+
+
+class ValuesYamlPipeline(object):
+    def __init__(self, module_name: str, settings: Settings, stages: List['BaseStageOfValuesYaml']):
+        """Stages that rewrite values.yaml one after another, on the lines in memory.
+
+        Args:
+            module_name (str): module name
+            settings (Settings): The settings given to the stages.
+            stages (List[BaseStageOfValuesYaml]): The stages.
+        """
+        self.module_name = module_name
+        self.settings = settings
+        self.stages = stages
+
+    def run(self, document: ValuesYamlDocument) -> 'ValuesYamlRewriteResult':
+        """Run the stages.
+
+        Each stage gets the document of the previous stage's output.
+        The document is made again only after a stage changed the lines, and it is parsed only if a later stage needs it.
+
+        Args:
+            document (ValuesYamlDocument): The document to be rewritten. (It is not modified)
+
+        Raises:
+            Exception: A required stage failed.
+
+        Returns:
+            ValuesYamlRewriteResult: The result.
+        """
+        original_document = document
+        changed_stage_names = []
+        failed_stage_names = []
+        for stage in self.stages:
+            try:
+                lines, is_changed = stage.apply(self.module_name, self.settings, document)
+            except Exception:
+                if stage.is_required():
+                    raise
+                import traceback
+                r_logger.warning(traceback.format_exc())
+                failed_stage_names.append(stage.get_name())
+                continue
+            if is_changed:
+                changed_stage_names.append(stage.get_name())
+                document = ValuesYamlDocument(lines)
+        return ValuesYamlRewriteResult(self.stages, original_document, document, changed_stage_names, failed_stage_names)
+
+
+class ValuesYamlRewriteResult(object):
+    def __init__(self, stages: List['BaseStageOfValuesYaml'], original_document: ValuesYamlDocument, document: ValuesYamlDocument,
+                 changed_stage_names: List[str], failed_stage_names: List[str]):
+        self.stages = stages
+        self.original_document = original_document
+        self.document = document
+        self.changed_stage_names = changed_stage_names
+        self.failed_stage_names = failed_stage_names
+
+    def get_stage(self, name: str) -> 'BaseStageOfValuesYaml':
+        for stage in self.stages:
+            if stage.get_name() == name:
+                return stage
+        return None
+
+    def get_document(self):
+        return self.document
+
+    def get_file_text(self):
+        return self.document.get_text()
+
+    def get_changed_stage_names(self):
+        return self.changed_stage_names
+
+    def get_failed_stage_names(self):
+        return self.failed_stage_names
+
+    def is_changed(self):
+        return len(self.changed_stage_names) > 0
+
+    def get_diff(self, filename: str = 'values.yaml') -> str:
+        """Get the changes as a unified diff.
+
+        Args:
+            filename (str, optional): The name shown in the header. Defaults to 'values.yaml'.
+
+        Returns:
+            str: The unified diff. (Empty if nothing is changed)
+        """
+        return ''.join(difflib.unified_diff(self.original_document.get_lines(), self.document.get_lines(),
+                                            fromfile='a/' + filename, tofile='b/' + filename))
+
+
+class BaseStageOfValuesYaml(object):
+    NAME = ''
+
+    def __init__(self, is_required: bool = True):
+        """A stage of ValuesYamlPipeline.
+
+        Args:
+            is_required (bool, optional): If it fails, the pipeline fails. Otherwise the stage is skipped. Defaults to True.
+        """
+        self.required = is_required
+
+    def get_name(self):
+        return self.NAME
+
+    def is_required(self):
+        return self.required
+
+    def apply(self, module_name: str, settings: Settings, document: ValuesYamlDocument) -> Tuple[List[str], bool]:
+        """Rewrite the document.
+
+        Args:
+            module_name (str): module name
+            settings (Settings): settings
+            document (ValuesYamlDocument): The output of the previous stage. (Do not modify it)
+
+        Returns:
+            List[str]: The lines after the stage
+            bool: Changed or not
+        """
+        raise Exception
+
+
+class StageOfCommentoutNodeSelector(BaseStageOfValuesYaml):
+    NAME = 'commentout_nodeSelector'
+
+    def apply(self, module_name, settings, document):
+        lines = [line.replace('# nodeSelector: ', 'nodeSelector: {} #') for line in document.get_lines()]
+        return lines, lines != document.get_lines()
+
+
+class StageOfStorageClass(BaseStageOfValuesYaml):
+    NAME = 'storageClass'
+
+    def apply(self, module_name, settings, document):
+        flt = FilterOfStorageClass(module_name, settings, document.get_lines(), document)
+        return flt.filter_lines()
+
+
+class StageOfIngress(BaseStageOfValuesYaml):
+    NAME = 'ingress'
+
+    def apply(self, module_name, settings, document):
+        # The filter edits the list in place.
+        flt = FilterOfIngress(module_name, settings, list(document.get_lines()), document)
+        return flt.filter()
+
+
+class StageOfNodeSelector(BaseStageOfValuesYaml):
+    NAME = 'nodeSelector'
+
+    def __init__(self, is_required: bool = True):
+        super().__init__(is_required)
+        self.multi_arch_dict = {}
+
+    def get_multi_arch_dict(self) -> Dict[str, str]:
+        return self.multi_arch_dict
+
+    def apply(self, module_name, settings, document):
+        flt = FilterOfNodeSelector(module_name, settings, document.get_lines(), document)
+        lines, is_changed = flt.filter_lines()
+        self.multi_arch_dict = flt.multi_arch_dict
+        return lines, is_changed
 
 
 class FilterOfStorageClass(object):
-    def __init__(self, module_name: str, lines: List[str]):
+    def __init__(self, module_name: str, settings: Settings, lines: List[str], document: ValuesYamlDocument = None):
         """Filter of storageClass
 
         Args:
             module_name (str): module name
+            settings (Settings): settings ([kubernetes] common_storage)
             lines (list): A list of values.yaml divided by a new line
+            document (ValuesYamlDocument, optional): The document of the lines. Defaults to None.
         """
         self.module_name = module_name
+        self.settings = settings
         self.lines = lines
+        self.document = document
 
     def filter(self):
-        file_text = ''
+        lines, is_changed = self.filter_lines()
+        return ''.join(lines), is_changed
+
+    def filter_lines(self) -> Tuple[List[str], bool]:
+        """Filter the lines.
+
+        Returns:
+            List[str]: The lines after the filter. (The lines given to the constructor if it is not changed)
+            bool: Changed or not
+        """
         try:
-            # Validation #
             if not self.__has_storageClass_tag_with_lines(self.lines):
-                return ''.join(self.lines), False
-            if self.__has_global_tag_with_lines(self.lines):
-                # global setting
-                not_find_storageClass_in_global, file_text = self.__edit_storageClass_in_global_tag(self.lines)
-                if not_find_storageClass_in_global:
-                    # If editing the global tag fails, edit the Separate Setting.
-                    file_text = self.__edit_storageClass_of_the_separate(self.lines)
-            else:
-                # Separate Setting
-                file_text = self.__edit_storageClass_of_the_separate(self.lines)
-            return file_text, True
+                return self.lines, False
+            return list(self.iter_lines()), True
         except Exception:
             import traceback
             r_logger.warning(traceback.format_exc())
-            return ''.join(self.lines), False
+            return self.lines, False
+
+    def iter_lines(self) -> Iterator[str]:
+        """Yield the lines after the filter, one by one. (See ValuesYaml.write_text)
+
+        Unlike filter_lines, an error is raised in the middle of the lines.
+
+        Yields:
+            str: A line after the filter.
+        """
+        if not self.__has_storageClass_tag_with_lines(self.lines):
+            yield from self.lines
+        elif self.__has_global_tag_with_lines(self.lines) and self.__has_storageClass_in_every_global_tag(self.lines):
+            # global setting
+            yield from self.__edit_storageClass_in_global_tag(self.lines)
+        else:
+            # Separate Setting
+            # (If editing the global tag fails, edit the Separate Setting.)
+            yield from self.__edit_storageClass_of_the_separate(self.lines)
+
+    PATTERN_COMMENTED_GLOBAL = re.compile(r'^#\sglobal:')
+    PATTERN_STORAGECLASS_WITH_VALUE = re.compile(r'^\s*#*\s*storageClass:\s[\-\_\/\"\'a-zA-Z0-9]+')
+    PATTERN_STORAGECLASS_TO_BE_REMOVED = re.compile(r'(^\s*)#*(\s*)(storageClass:\s[\[\]\.\_\-\"\'\/a-zA-Z0-9]*\n)')
 
     def __has_global_tag_with_lines(self, lines):
-        return self.__has_regex_tag_with_lines(lines, r'^#\sglobal:') or self.__has_regex_tag_with_lines(lines, r'^global:')
+        line_table = self.__get_line_table(lines)
+        for i in range(len(line_table)):
+            if self.__is_global_tag(line_table, i):
+                return True
+        return False
 
     def __has_storageClass_tag_with_lines(self, lines):
-        return self.__has_regex_tag_with_lines(lines, r'^\s*#*\s*storageClass:')
+        return self.__get_line_table(lines).has_key_or_commented_key('storageClass')
+
+    def __is_global_tag(self, line_table, i):
+        # ^#\sglobal: or ^global:
+        if line_table.get_spaces(i) != 0:
+            return False
+        if line_table.get_key(i) == 'global':
+            return True
+        return line_table.get_commented_key(i) == 'global' and self.PATTERN_COMMENTED_GLOBAL.match(line_table.get_lines()[i]) is not None
+
+    def __has_storageClass_in_every_global_tag(self, lines):
+        line_table = self.__get_line_table(lines)
+        is_indent_of_global_tag = False
+        for i in range(len(line_table)):
+            if self.__is_global_tag(line_table, i):
+                is_indent_of_global_tag = True
+            elif is_indent_of_global_tag:
+                if line_table.is_key_or_commented_key(i, 'storageClass'):
+                    is_indent_of_global_tag = False
+                elif line_table.is_kind_of(i, LineTable.BLANK) or (line_table.get_spaces(i) == 0 and line_table.is_kind_of(i, LineTable.PLAIN_KEY)):
+                    # not find in global tag.
+                    return False
+        return True
 
     def __edit_storageClass_in_global_tag(self, lines):
-        file_text = ''
-        not_find_storageClass_in_global = False
+        # Every global tag has storageClass. (See __has_storageClass_in_every_global_tag)
         _, indent_unit = self.__get_indent_info(lines)
+        line_table = self.__get_line_table(lines)
         is_indent_of_global_tag = False
-        raw_global_tag = ''     # ex. global: or # global:
-        text_in_global_tag = ''
+        lines_in_global_tag = []
         for i, line in enumerate(lines):
-            if re.match(r'^#\sglobal:', line) or re.match(r'^global:', line):
-                raw_global_tag = line
+            if self.__is_global_tag(line_table, i):
                 is_indent_of_global_tag = True
             else:
                 if is_indent_of_global_tag:
-                    if re.match(r'^\s*#*\s*storageClass:', line):
+                    if line_table.is_key_or_commented_key(i, 'storageClass'):
                         # find in global tag.
-                        text_in_global_tag = 'global:\n' + text_in_global_tag
-                        storageClass = rdbox_app_market.config.get('kubernetes', 'common_storage')
-                        text_in_global_tag += ' ' * indent_unit + 'storageClass: ' + storageClass + '\n'
-                        is_indent_of_global_tag = False
-                        file_text += text_in_global_tag
-                        continue
-                    if re.match(r'^\s*\n', line) or re.match(r'^[0-9a-zA-Z]*:', line):
-                        # not find in global tag.
-                        text_in_global_tag = raw_global_tag + text_in_global_tag + line
+                        storageClass = self.settings.kubernetes.common_storage
+                        lines_in_global_tag = ['global:\n'] + lines_in_global_tag
+                        lines_in_global_tag.append(' ' * indent_unit + 'storageClass: ' + storageClass + '\n')
+                        yield from lines_in_global_tag
                         is_indent_of_global_tag = False
-                        file_text += text_in_global_tag
-                        not_find_storageClass_in_global = True
                         continue
-                    text_in_global_tag += line
+                    lines_in_global_tag.append(line)
                 else:
-                    file_text += line
-        return not_find_storageClass_in_global, file_text
+                    yield line
 
     def __edit_storageClass_of_the_separate(self, lines):
         indent_list, _ = self.__get_indent_info(lines)
-        file_text = ''
+        line_table = self.__get_line_table(lines)
         for i, line in enumerate(lines):
-            if re.match(r'^\s*#*\s*storageClass:\s[\-\_\/\"\'a-zA-Z0-9]+', line):
+            if line_table.is_key_or_commented_key(i, 'storageClass') and self.PATTERN_STORAGECLASS_WITH_VALUE.match(line):
                 indent_of_backward, indent_of_forward = self.__get_indent_of_back_and_forward(indent_list, i)
-                storageClass = rdbox_app_market.config.get('kubernetes', 'common_storage')
+                storageClass = self.settings.kubernetes.common_storage
                 if indent_of_backward == indent_of_forward:
-                    file_text = file_text + ' ' * indent_of_backward + 'storageClass: ' + storageClass + '\n'
+                    yield ' ' * indent_of_backward + 'storageClass: ' + storageClass + '\n'
                 else:
-                    line_indent = re.sub(r'(^\s*)#*(\s*)(storageClass:\s[\[\]\.\_\-\"\'\/a-zA-Z0-9]*\n)', r'\1', line)
+                    line_indent = self.PATTERN_STORAGECLASS_TO_BE_REMOVED.sub(r'\1', line)
                     if len(line_indent) == indent_of_backward or len(line_indent) == indent_of_forward:
-                        file_text = file_text + line_indent + 'storageClass: ' + storageClass + '\n'
+                        yield line_indent + 'storageClass: ' + storageClass + '\n'
                     else:
-                        file_text += line
+                        yield line
             else:
-                file_text += line
-        return file_text
+                yield line
 
     def __get_indent_of_back_and_forward(self, indent_list, now_processing_line):
         indent_of_backward = 0
@@ -216,57 +643,77 @@ class FilterOfStorageClass(object):
                 break
         return indent_of_backward, indent_of_forward
 
-    def __has_regex_tag_with_lines(self, lines, regex):
-        result = False
-        for line in lines:
-            if re.match(regex, line):
-                result = True
-                break
-        return result
+    def __get_line_table(self, lines):
+        if self.document is None or lines is not self.document.get_lines():
+            self.document = ValuesYamlDocument(lines)
+        return self.document.get_line_table()
 
     def __get_indent_info(self, lines):
-        il = IndentList()
-        for line in lines:
-            il.add_with_line_of_text(line)
-        return il.to_list(), il.get_unit_indent_length()
+        line_table = self.__get_line_table(lines)
+        return line_table.get_indent_list(), line_table.get_unit_indent_length()
 
 
 class FilterOfIngress(object):
-    def __init__(self, module_name: str, lines: List[str]):
+    SHAPE_NONE = 'none'                 # No ingressTag
+    SHAPE_NO_HOSTS = 'no_hosts'         # An ingressTag has no hosts
+    SHAPE_STR_HOSTS = 'str_hosts'       # hosts: ['chart-example.local']
+    SHAPE_DICT_HOSTS = 'dict_hosts'     # hosts: [{'name': 'chart-example.local', 'path': '/', ...}]
+    SHAPE_UNSUPPORTED = 'unsupported'
+
+    def __init__(self, module_name: str, settings: Settings, lines: List[str], document: ValuesYamlDocument = None):
         """Filter of ingress
 
         Args:
             module_name (str): module name
+            settings (Settings): settings ([kubernetes] common_domain and common_cert)
             lines (list): A list of values.yaml divided by a new line
+            document (ValuesYamlDocument, optional): The document parsed from the lines. Defaults to None.
         """
         self.module_name = module_name
+        self.settings = settings
         self.lines = lines
-        self.ingress_dicts = Util.has_key_recursion_full(yaml.safe_load('\n'.join(lines)), 'ingress')
+        if document is None:
+            document = ValuesYamlDocument(lines)
+        self.ingress_dicts = document.get_features().get_dicts('ingress')
 
-    def filter(self) -> Tuple[List[str], bool]:
-        """Edit the ingressTag.
+    def get_shape(self) -> str:
+        """Classify the ingressTags. The filter edits only SHAPE_STR_HOSTS and SHAPE_DICT_HOSTS.
 
         Returns:
-            List[str]: After editing values.yaml
-            bool: Changed or not (True means already changed)
+            str: SHAPE_NONE, SHAPE_NO_HOSTS, SHAPE_STR_HOSTS, SHAPE_DICT_HOSTS or SHAPE_UNSUPPORTED
         """
-        flt: BaseFilterOfIngress
         # Validation
         if len(self.ingress_dicts.keys()) == 0:
-            return self.lines, False
+            return self.SHAPE_NONE
         if not self.__has_key_of_hosts_with(self.ingress_dicts):
-            return self.lines, False
+            return self.SHAPE_NO_HOSTS
         # Select
         if self.__has_str_value_of_hosts(self.ingress_dicts):
             # Validation
             if not self.__passed_str_hosts_ingress(self.ingress_dicts):
-                return self.lines, False
-            flt = FilterOfStrHostsIngress(self.module_name, self.lines, self.ingress_dicts)
+                return self.SHAPE_UNSUPPORTED
+            return self.SHAPE_STR_HOSTS
         elif self.__has_dict_value_of_hosts(self.ingress_dicts):
             # Validation
             if not self.__passed_dict_hosts_ingress(self.ingress_dicts):
-                return self.lines, False
-            flt = FilterOfDictHostsIngress(self.module_name, self.lines, self.ingress_dicts)
+                return self.SHAPE_UNSUPPORTED
+            return self.SHAPE_DICT_HOSTS
+        else:
+            return self.SHAPE_UNSUPPORTED
+
+    def filter(self) -> Tuple[List[str], bool]:
+        """Edit the ingressTag.
+
+        Returns:
+            List[str]: After editing values.yaml
+            bool: Changed or not (True means already changed)
+        """
+        flt: BaseFilterOfIngress
+        shape = self.get_shape()
+        if shape == self.SHAPE_STR_HOSTS:
+            flt = FilterOfStrHostsIngress(self.module_name, self.settings, self.lines, self.ingress_dicts)
+        elif shape == self.SHAPE_DICT_HOSTS:
+            flt = FilterOfDictHostsIngress(self.module_name, self.settings, self.lines, self.ingress_dicts)
         else:
             return self.lines, False
         # Execute
@@ -369,11 +816,30 @@ class FilterOfIngress(object):
 
 
 class BaseFilterOfIngress(object):
-    def __init__(self, module_name: str, lines: list, ingress_dicts: dict):
+    PATTERN_ENABLED = re.compile(r'^\s*enabled:')
+    PATTERN_COMMENT = re.compile(r'^\s*#+')
+    PATTERN_COMMENTED_ITEM = re.compile(r'^\s*#+\s*[\.\_\-\"\'\/a-zA-Z0-9]+:\s[\.\_\-\"\'\/a-zA-Z0-9]+')
+    PATTERN_COMMENTED_ITEM_TO_BE_UNCOMMENTED = re.compile(r'^\s*#+\s*([\.\_\-\"\'\/a-zA-Z0-9]+:\s[\.\_\-\"\'\/a-zA-Z0-9]+)')
+    PATTERN_ANNOTATIONS = re.compile(r'^\s*#*\s*annotations:')
+    PATTERN_CERTMANAGER = re.compile(r'^\s*certManager:')
+    PATTERN_NAME = re.compile(r'^\s*-*\s*name:')
+    PATTERN_NAME_TO_BE_REPLACED = re.compile(r'(^\s*-*\s*)(name:\s[\.\_\-\"\'\/a-zA-Z0-9]*\n)')
+    PATTERN_ITEM_TLS = re.compile(r'^\s*-*\s*tls:')
+    PATTERN_ITEM_TLS_TO_BE_REPLACED = re.compile(r'(^\s*-*\s*)(tls:\s[\.\_\-\"\'\/a-zA-Z0-9]*\n)')
+    PATTERN_TLSSECRET = re.compile(r'^\s*-*\s*tlsSecret:')
+    PATTERN_TLSSECRET_TO_BE_REPLACED = re.compile(r'(^\s*-*\s*)(tlsSecret:\s[\.\_\-\"\'\/a-zA-Z0-9]*\n)')
+    PATTERN_TLSHOSTS = re.compile(r'^\s*#*-*\s*tlsHosts:')
+    PATTERN_TLSHOSTS_TO_BE_REPLACED = re.compile(r'(^\s*-*\s*)(tlsHosts:\s[\[\]\.\_\-\"\'\/a-zA-Z0-9]*\n)')
+    PATTERN_HOSTS = re.compile(r'^\s*hosts:')
+    PATTERN_TLS = re.compile(r'^\s*tls:')
+
+    def __init__(self, module_name: str, settings: Settings, lines: list, ingress_dicts: dict):
         self.module_name = module_name
+        self.settings = settings
         self.lines = lines
         self.ingress_dicts = ingress_dicts
         self.indent_unit = 2
+        self.indent_index = None
 
     def filter(self) -> List[str]:
         raise Exception
@@ -388,8 +854,8 @@ class BaseFilterOfIngress(object):
 
     def filter_enabled(self):
         for index, line, now_indent, _ in self.generator():
-            if re.match(r'^\s*enabled:', line):
-                self.lines[index] = ' ' * now_indent + 'enabled: true' + '\n'
+            if self.PATTERN_ENABLED.match(line):
+                self.lines_replace(index, ' ' * now_indent + 'enabled: true' + '\n')
 
     def filter_annotations(self):
         need_to_uncomment_q = False
@@ -397,18 +863,17 @@ class BaseFilterOfIngress(object):
         indent_uncomment = 0
         for index, line, now_indent, structure in self.generator():
             if need_to_uncomment_q:
-                if re.match(r'^\s*#+', line):
-                    if re.match(r'^\s*#+\s*[\.\_\-\"\'\/a-zA-Z0-9]+:\s[\.\_\-\"\'\/a-zA-Z0-9]+', line):
-                        self.lines[index] = indent_uncomment + re.sub(r'^\s*#+\s*([\.\_\-\"\'\/a-zA-Z0-9]+:\s[\.\_\-\"\'\/a-zA-Z0-9]+)', r'\1', line)
+                if self.PATTERN_COMMENT.match(line):
+                    if self.PATTERN_COMMENTED_ITEM.match(line):
+                        self.lines_replace(index, indent_uncomment + self.PATTERN_COMMENTED_ITEM_TO_BE_UNCOMMENTED.sub(r'\1', line))
                         count_uncomment += 1
                 else:
                     if count_uncomment == 0:
-                        self.lines.insert(index, indent_uncomment + 'kubernetes.io/ingress.class: nginx' + '\n')
-                        self.lines.insert(index, indent_uncomment + 'kubernetes.io/tls-acme: \'true\'' + '\n')
-                        self.__update_lines_info()
+                        self.lines_insert(index, indent_uncomment + 'kubernetes.io/ingress.class: nginx' + '\n')
+                        self.lines_insert(index, indent_uncomment + 'kubernetes.io/tls-acme: \'true\'' + '\n')
                     need_to_uncomment_q = False
                     count_uncomment = 0
-            if re.match(r'^\s*#*\s*annotations:', line):
+            if self.PATTERN_ANNOTATIONS.match(line):
                 need_to_uncomment_q = True
                 target_line = line
                 if now_indent < 0:
@@ -419,43 +884,47 @@ class BaseFilterOfIngress(object):
                     indent_uncomment = ' ' * now_indent + ' ' * self.indent_unit
                 annotations_item = self.ingress_dicts.get('.'.join(structure.parent())).get('annotations', None)
                 if annotations_item is None:
-                    self.lines[index] = target_line
+                    self.lines_replace(index, target_line)
                     continue
                 if len(annotations_item) == 0:
-                    self.lines[index] = ' ' * now_indent + 'annotations:' + '\n'
+                    self.lines_replace(index, ' ' * now_indent + 'annotations:' + '\n')
                     continue
                 elif len(annotations_item) > 0:
-                    self.lines[index] = target_line
+                    self.lines_replace(index, target_line)
                     continue
             else:
                 continue
 
     def lines_insert(self, index, content):
-        self.lines.insert(index, content)
+        self.__get_indent_index().insert(index, content)
         self.__update_lines_info()
 
+    def lines_replace(self, index, content):
+        self.__get_indent_index().replace(index, content)
+
     def build_hostname(self, structure):
         hostname = '-'.join(structure.get_struct()[1:-1])
         if hostname == '':
-            hostname = self.module_name + '.' + rdbox_app_market.config.get('kubernetes', 'common_domain')
+            hostname = self.module_name + '.' + self.settings.kubernetes.common_domain
         else:
-            hostname = hostname + '-' + self.module_name + '.' + rdbox_app_market.config.get('kubernetes', 'common_domain')
+            hostname = hostname + '-' + self.module_name + '.' + self.settings.kubernetes.common_domain
         return hostname
 
-    def __get_indent_info(self):
-        il = IndentList()
-        for line in self.lines:
-            il.add_with_line_of_text(line)
-        return il.to_list(), il.get_unit_indent_length()
+    def __get_indent_index(self):
+        if self.indent_index is None:
+            self.indent_index = IndentIndex(self.lines)
+        return self.indent_index
 
     def __update_lines_info(self):
-        self.indent_list, self.indent_unit = self.__get_indent_info()
+        indent_index = self.__get_indent_index()
+        indent_index.refresh()
+        self.indent_list, self.indent_unit = indent_index.to_list(), indent_index.get_unit_indent_length()
         self.structure = Structure(self.indent_unit)
 
 
 class FilterOfDictHostsIngress(BaseFilterOfIngress):
-    def __init__(self, module_name: str, lines: list, ingress_dicts: dict):
-        super().__init__(module_name, lines, ingress_dicts)
+    def __init__(self, module_name: str, settings: Settings, lines: list, ingress_dicts: dict):
+        super().__init__(module_name, settings, lines, ingress_dicts)
 
     def filter(self):
         self.filter_enabled()
@@ -469,57 +938,57 @@ class FilterOfDictHostsIngress(BaseFilterOfIngress):
 
     def filter_certManager(self):
         for index, line, now_indent, _ in self.generator():
-            if re.match(r'^\s*certManager:', line):
-                self.lines[index] = ' ' * now_indent + 'certManager: true' + '\n'
+            if self.PATTERN_CERTMANAGER.match(line):
+                self.lines_replace(index, ' ' * now_indent + 'certManager: true' + '\n')
 
     # section of .ingress.hosts
     def filter_name(self):
         for index, line, _, structure in self.generator():
-            if re.match(r'^\s*-*\s*name:', line):
+            if self.PATTERN_NAME.match(line):
                 hostname = self.build_hostname(structure)
-                self.lines[index] = re.sub(r'(^\s*-*\s*)(name:\s[\.\_\-\"\'\/a-zA-Z0-9]*\n)', r'\1', line) + 'name: ' + hostname + '\n'
+                self.lines_replace(index, self.PATTERN_NAME_TO_BE_REPLACED.sub(r'\1', line) + 'name: ' + hostname + '\n')
 
     def filter_tls(self):
         for index, line, _, _ in self.generator():
-            if re.match(r'^\s*-*\s*tls:', line):
-                self.lines[index] = re.sub(r'(^\s*-*\s*)(tls:\s[\.\_\-\"\'\/a-zA-Z0-9]*\n)', r'\1', line) + 'tls: true' + '\n'
+            if self.PATTERN_ITEM_TLS.match(line):
+                self.lines_replace(index, self.PATTERN_ITEM_TLS_TO_BE_REPLACED.sub(r'\1', line) + 'tls: true' + '\n')
 
     def filter_tlsSecret(self):
         for index, line, _, _ in self.generator():
-            if re.match(r'^\s*-*\s*tlsSecret:', line):
-                self.lines[index] = re.sub(r'(^\s*-*\s*)(tlsSecret:\s[\.\_\-\"\'\/a-zA-Z0-9]*\n)', r'\1', line) + 'tlsSecret: ' + rdbox_app_market.config.get('kubernetes', 'common_cert') + '\n'
+            if self.PATTERN_TLSSECRET.match(line):
+                self.lines_replace(index, self.PATTERN_TLSSECRET_TO_BE_REPLACED.sub(r'\1', line) + 'tlsSecret: ' + self.settings.kubernetes.common_cert + '\n')
 
     def filter_tlsHosts(self):
         need_to_skip_next = []
         target_data = ''
         for index, line, _, structure in self.generator():
             if len(need_to_skip_next) > 0:
-                if re.match(r'^\s*#+', line):
-                    self.lines[index] = line
+                if self.PATTERN_COMMENT.match(line):
+                    self.lines_replace(index, line)
                 else:
-                    self.lines[index] = '#' + line
+                    self.lines_replace(index, '#' + line)
                     need_to_skip_next.pop()
                     if len(need_to_skip_next) == 0:
                         self.lines_insert(index + 1, target_data)
-            if re.match(r'^\s*#*-*\s*tlsHosts:', line):
+            if self.PATTERN_TLSHOSTS.match(line):
                 hosts_item = self.ingress_dicts.get('.'.join(structure.parent())).get('hosts', [{}])[0].get('tlsHosts', None)
                 if hosts_item is None:
-                    self.lines[index] = line
+                    self.lines_replace(index, line)
                     continue
                 if len(hosts_item) == 0:
-                    self.lines[index] = re.sub(r'(^\s*-*\s*)(tlsHosts:\s[\[\]\.\_\-\"\'\/a-zA-Z0-9]*\n)', r'\1', line) + 'tlsHosts:' + '\n'
-                    self.lines_insert(index + 1, re.sub(r'(^\s*-*\s*)(tlsHosts:\s[\[\]\.\_\-\"\'\/a-zA-Z0-9]*\n)', r'\1', line) + ' ' * self.indent_unit + '- ' + '"*.' + rdbox_app_market.config.get('kubernetes', 'common_domain') + '"' + '\n')
+                    self.lines_replace(index, self.PATTERN_TLSHOSTS_TO_BE_REPLACED.sub(r'\1', line) + 'tlsHosts:' + '\n')
+                    self.lines_insert(index + 1, self.PATTERN_TLSHOSTS_TO_BE_REPLACED.sub(r'\1', line) + ' ' * self.indent_unit + '- ' + '"*.' + self.settings.kubernetes.common_domain + '"' + '\n')
                 elif len(hosts_item) > 0:
-                    self.lines[index] = re.sub(r'(^\s*-*\s*)(tlsHosts:\s[\[\]\.\_\-\"\'\/a-zA-Z0-9]*\n)', r'\1', line) + 'tlsHosts:' + '\n'
-                    target_data = re.sub(r'(^\s*-*\s*)(tlsHosts:\s[\[\]\.\_\-\"\'\/a-zA-Z0-9]*\n)', r'\1', line) + ' ' * self.indent_unit + '- ' + '"*.' + rdbox_app_market.config.get('kubernetes', 'common_domain') + '"' + '\n'
+                    self.lines_replace(index, self.PATTERN_TLSHOSTS_TO_BE_REPLACED.sub(r'\1', line) + 'tlsHosts:' + '\n')
+                    target_data = self.PATTERN_TLSHOSTS_TO_BE_REPLACED.sub(r'\1', line) + ' ' * self.indent_unit + '- ' + '"*.' + self.settings.kubernetes.common_domain + '"' + '\n'
                     need_to_skip_next = range(len(hosts_item))
             else:
                 continue
 
 
 class FilterOfStrHostsIngress(BaseFilterOfIngress):
-    def __init__(self, module_name: str, lines: list, ingress_dicts: dict):
-        super().__init__(module_name, lines, ingress_dicts)
+    def __init__(self, module_name: str, settings: Settings, lines: list, ingress_dicts: dict):
+        super().__init__(module_name, settings, lines, ingress_dicts)
 
     def filter(self):
         self.filter_enabled()
@@ -533,25 +1002,25 @@ class FilterOfStrHostsIngress(BaseFilterOfIngress):
         target_data = ''
         for index, line, now_indent, structure in self.generator():
             if len(need_to_skip_next) > 0:
-                if re.match(r'^\s*#+', line):
-                    self.lines[index] = line
+                if self.PATTERN_COMMENT.match(line):
+                    self.lines_replace(index, line)
                 else:
-                    self.lines[index] = '#' + line
+                    self.lines_replace(index, '#' + line)
                     need_to_skip_next.pop()
                     if len(need_to_skip_next) == 0:
                         self.lines_insert(index + 1, target_data)
-            if re.match(r'^\s*hosts:', line):
+            if self.PATTERN_HOSTS.match(line):
                 hostname = self.build_hostname(structure)
                 hosts_item = self.ingress_dicts.get('.'.join(structure.parent())).get('hosts', None)
                 if hosts_item is None:
-                    self.lines[index] = line
+                    self.lines_replace(index, line)
                     self.lines_insert(index + 1, ' ' * now_indent + ' ' * self.indent_unit + '- ' + hostname + '\n')
                     continue
                 if len(hosts_item) == 0:
-                    self.lines[index] = ' ' * now_indent + 'hosts:' + '\n'
+                    self.lines_replace(index, ' ' * now_indent + 'hosts:' + '\n')
                     self.lines_insert(index + 1, ' ' * now_indent + ' ' * self.indent_unit + '- ' + hostname + '\n')
                 elif len(hosts_item) > 0:
-                    self.lines[index] = line
+                    self.lines_replace(index, line)
                     target_data = ' ' * now_indent + ' ' * self.indent_unit + '- ' + hostname + '\n'
                     need_to_skip_next = list(range(len(hosts_item)))
             else:
@@ -559,110 +1028,152 @@ class FilterOfStrHostsIngress(BaseFilterOfIngress):
 
     def filter_tls(self):
         for index, line, now_indent, structure in self.generator():
-            if re.match(r'^\s*tls:', line):
+            if self.PATTERN_TLS.match(line):
                 tls_item = self.ingress_dicts.get('.'.join(structure.parent())).get('tls', None)
-                hosts_item = '*.' + rdbox_app_market.config.get('kubernetes', 'common_domain')
+                hosts_item = '*.' + self.settings.kubernetes.common_domain
                 if tls_item is None:
-                    self.lines[index] = line
-                    content = yaml.dump([{'secretName': rdbox_app_market.config.get('kubernetes', 'common_cert'), 'hosts': [hosts_item]}], indent=self.indent_unit)
+                    self.lines_replace(index, line)
+                    content = yaml_io.dump([{'secretName': self.settings.kubernetes.common_cert, 'hosts': [hosts_item]}], indent=self.indent_unit)
                     for i, text in enumerate(content.split('\n')):
                         if text != '':
                             self.lines_insert(index + i + 1, ' ' * now_indent + ' ' * self.indent_unit + text + '\n')
                     continue
                 if len(tls_item) == 0:
-                    self.lines[index] = ' ' * now_indent + 'tls:' + '\n'
-                    content = yaml.dump([{'secretName': rdbox_app_market.config.get('kubernetes', 'common_cert'), 'hosts': [hosts_item]}], indent=self.indent_unit)
+                    self.lines_replace(index, ' ' * now_indent + 'tls:' + '\n')
+                    content = yaml_io.dump([{'secretName': self.settings.kubernetes.common_cert, 'hosts': [hosts_item]}], indent=self.indent_unit)
                     for i, text in enumerate(content.split('\n')):
                         if text != '':
                             self.lines_insert(index + i + 1, ' ' * now_indent + ' ' * self.indent_unit + text + '\n')
                     continue
                 elif len(tls_item) > 0:
-                    self.lines[index] = line
+                    self.lines_replace(index, line)
                     continue
             else:
                 continue
 
 
 class FilterOfNodeSelector(object):
-    def __init__(self, module_name: str, lines: List[str]):
-        """Filter of ingress
+    def __init__(self, module_name: str, settings: Settings, lines: List[str], document: ValuesYamlDocument = None):
+        """Filter of nodeSelector
 
         Args:
             module_name (str): module name
+            settings (Settings): settings ([dockerhub] and [registry])
             lines (list): A list of values.yaml divided by a new line
+            document (ValuesYamlDocument, optional): The document parsed from the lines. Defaults to None.
         """
         self.module_name = module_name
+        self.settings = settings
         self.lines = lines
+        if document is None:
+            document = ValuesYamlDocument(lines)
+        self.document = document
         self.node_selector_indent = 0
         self.is_nodeSelector_in_processing = False
         self.original_nodeSelector_text = ''
-        self.multi_arch_dict = self.get_multi_arch_dict(lines)
+        self.multi_arch_dict = self.get_multi_arch_dict(lines, document.get_features())
 
-    def get_multi_arch_dict(self, lines: List[str]) -> Dict[str, str]:
+    def get_multi_arch_dict(self, lines: List[str], features: ValuesYamlFeatures = None) -> Dict[str, str]:
         """Get a dict of images that support multi-architectures.
 
-        The dockerhub allows you to get the architecture of the image with a REST API.
+        The registries allow you to get the architecture of the image with a REST API. (See ImageArchResolver)
 
         Args:
             lines (List[str]): A list of values.yaml divided by a new line
+            features (ValuesYamlFeatures, optional): The features of the lines. Defaults to None. (Parse the lines)
 
         Returns:
-            Dict[str, str]: key is Dot-separated characters indicate a layer. value is URI of a repository on the dockerhub.
+            Dict[str, str]: key is Dot-separated characters indicate a layer. value is URI of a repository.
         """
         multi_arch_dict = {}
-        obj_values = yaml.safe_load('\n'.join(lines))
-        node_selector_list = [i for i, line in enumerate(lines) if re.match(r'^\s*nodeSelector:', line)]
-        image_list = [i for i, line in enumerate(lines) if re.match(r'^\s*image:', line)]
-        if len(node_selector_list) == len(image_list):
-            all_image_list = Util.has_key_recursion_full(obj_values, 'image')
-            for struct, image_dict in all_image_list.items():
-                repo_uri = image_dict.get('repository', image_dict.get('name', ''))
-                if self.__is_hosted_on_dockerhub(repo_uri):
-                    url = self.__build_url_of_dockerhub(image_dict, repo_uri)
-                    if self.__has_multiarch_image(url):
-                        multi_arch_dict.setdefault(struct, repo_uri)
+        if features is None:
+            features = ValuesYamlDocument(lines).get_features()
+        for struct, image_dict, repo_uri in self.get_images_to_look_up(self.__get_line_table(lines), features, self.settings):
+            if self.__has_multiarch_image(image_dict, repo_uri):
+                multi_arch_dict.setdefault(struct, repo_uri)
         return multi_arch_dict
 
+    @classmethod
+    def get_images_to_look_up(cls, line_table: 'LineTable', features: ValuesYamlFeatures, settings: Settings) -> List[Tuple[str, dict, str]]:
+        """Get the images whose architectures are looked up. (See get_multi_arch_dict)
+
+        They are looked up only if each image has a nodeSelector, and its registry is supported. (See ImageArchResolver.supports)
+
+        Args:
+            line_table (LineTable): The line table of values.yaml
+            features (ValuesYamlFeatures): The features of values.yaml
+            settings (Settings): settings ([registry])
+
+        Returns:
+            List[Tuple[str, dict, str]]: Dot-separated layer, the image dict and URI of a repository.
+        """
+        images = []
+        if line_table.count_key('nodeSelector') == line_table.count_key('image'):
+            resolver = ImageArchResolver.get_instance(settings)
+            for struct, image_dict in features.get_dicts('image').items():
+                repo_uri = image_dict.get('repository', image_dict.get('name', ''))
+                if resolver.supports(repo_uri):
+                    images.append((struct, image_dict, repo_uri))
+        return images
+
     def is_processing(self):
         return self.is_nodeSelector_in_processing
 
     def filter(self):
-        file_text = ''
-        self.indent_list, self.indent_unit = self.__get_indent_info(self.lines)
-        structure = Structure(self.indent_unit)
-        for i, line in enumerate(self.lines):
+        lines, is_changed = self.filter_lines()
+        return ''.join(lines), is_changed
+
+    def filter_lines(self) -> Tuple[List[str], bool]:
+        """Filter the lines.
+
+        Returns:
+            List[str]: The lines after the filter.
+            bool: Changed or not
+        """
+        return list(self.iter_lines()), True
+
+    def iter_lines(self) -> Iterator[str]:
+        """Yield the lines after the filter, one by one. (See ValuesYaml.write_text)
+
+        Yields:
+            str: A line after the filter.
+        """
+        line_table = self.__get_line_table(self.lines)
+        self.indent_list, self.indent_unit = line_table.get_indent_list(), line_table.get_unit_indent_length()
+        for i in range(len(line_table)):
             now_indent = self.indent_list[i]
-            now_struct_str = structure.update(line, now_indent)
             if self.is_nodeSelector_in_processing:
-                if structure.get_struct()[-1] == 'nodeSelector':
-                    now_struct_str = '.'.join(structure.get_struct()[:-1])
-                is_multi_arch = now_struct_str in self.multi_arch_dict
-                file_text += self.__filter(line, now_indent, is_multi_arch)
+                path = line_table.get_path(i)
+                if path[-1] == 'nodeSelector':
+                    path = path[:-1]
+                is_multi_arch = '.'.join(path) in self.multi_arch_dict
+                yield from self.__filter(line_table, i, now_indent, is_multi_arch)
             else:
-                file_text += self.__filter(line, now_indent)
-        return file_text, True
+                yield from self.__filter(line_table, i, now_indent)
 
-    def __filter(self, line, indent, is_multi_arch=False):
+    def __filter(self, line_table, i, indent, is_multi_arch=False):
         if self.is_nodeSelector_in_processing:
-            return self.__processing_of_block_elements(line, is_multi_arch)
+            return self.__processing_of_block_elements(line_table, i, is_multi_arch)
         else:
-            if self.__is_start_of_block_element(line, indent):
-                return ''
+            if self.__is_start_of_block_element(line_table, i, indent):
+                return []
             else:
-                return line
+                return [line_table.get_lines()[i]]
 
-    def __is_start_of_block_element(self, line, indent):
-        if re.match(r'^\s*nodeSelector:', line):
+    def __is_start_of_block_element(self, line_table, i, indent):
+        line = line_table.get_lines()[i]
+        if line_table.get_key(i) == 'nodeSelector':
             self.is_nodeSelector_in_processing = True
             self.original_nodeSelector_text += line
             self.node_selector_indent = indent
             return True
         return False
 
-    def __processing_of_block_elements(self, line, is_multi_arch=False):
-        file_text = ''
-        if re.match(r'^\s*\n', line) or re.match(r'^\s*[0-9a-zA-Z]*:', line) or re.match(r'^\s*#', line):
-            nodeSelector_obj = yaml.safe_load(self.original_nodeSelector_text)
+    def __processing_of_block_elements(self, line_table, i, is_multi_arch=False):
+        lines = []
+        line = line_table.get_lines()[i]
+        if line_table.is_kind_of(i, LineTable.BLANK | LineTable.PLAIN_KEY | LineTable.COMMENT):
+            nodeSelector_obj = yaml_io.safe_load(self.original_nodeSelector_text)
             if not isinstance(nodeSelector_obj.get('nodeSelector'), dict):
                 nodeSelector_obj = {'nodeSelector': {}}
             nodeSelector_obj.get('nodeSelector').setdefault('beta.kubernetes.io/os', 'linux')
@@ -671,50 +1182,28 @@ class FilterOfNodeSelector(object):
                 nodeSelector_obj.get('nodeSelector').setdefault('node.rdbox.com/location', 'hq')
             else:
                 pass
-            aligned_nodeSelector_text = yaml.dump(nodeSelector_obj, indent=self.indent_unit)
+            aligned_nodeSelector_text = yaml_io.dump(nodeSelector_obj, indent=self.indent_unit)
             for text in aligned_nodeSelector_text.split('\n'):
                 if text != '':
-                    file_text = file_text + ' ' * self.node_selector_indent + text + '\n'
+                    lines.append(' ' * self.node_selector_indent + text + '\n')
             self.__reset()
-            file_text += line
+            lines.append(line)
         else:
             self.original_nodeSelector_text += line
-        return file_text
+        return lines
 
     def __reset(self):
         self.is_nodeSelector_in_processing = False
         self.original_nodeSelector_text = ''
 
-    def __is_hosted_on_dockerhub(self, repo_url):
-        repo_url_list = repo_url.split('/')
-        if len(repo_url_list) <= 2:
-            return True
-        else:
-            return False
-
-    def __build_url_of_dockerhub(self, image_tag_dict, repo_uri):
-        uri = repo_uri
-        repo_url_list = repo_uri.split('/')
-        if len(repo_url_list) == 1:
-            uri = 'library' + '/' + repo_uri
-        url = 'https://hub.docker.com/v2/repositories/{uri}/tags/{tag}'.format(uri=uri, tag=image_tag_dict.get('tag'))
-        return url
-
-    def __has_multiarch_image(self, url):
-        has_arch_arm = False
-        r = requests.get(url)
-        if r.status_code == requests.codes.ok:
-            data = r.json()
-            for v in data.get('images', []):
-                if v.get('architecture').startswith('arm'):
-                    has_arch_arm = True
-        return has_arch_arm
+    def __has_multiarch_image(self, image_tag_dict, repo_uri):
+        # The answers are shared by the charts in this process, and by the runs. (See ImageArchResolver)
+        return ImageArchResolver.get_instance(self.settings).resolve(repo_uri, image_tag_dict.get('tag')).has_arm()
 
-    def __get_indent_info(self, lines):
-        il = IndentList()
-        for line in lines:
-            il.add_with_line_of_text(line)
-        return il.to_list(), il.get_unit_indent_length()
+    def __get_line_table(self, lines):
+        if lines is self.document.get_lines():
+            return self.document.get_line_table()
+        return LineTable(lines)
 
 
 class Structure(object):
@@ -728,6 +1217,10 @@ class Structure(object):
         return self.struct
 
     def update(self, line, now_indent):
+        self.update_struct(line, now_indent)
+        return self.to_str()
+
+    def update_struct(self, line, now_indent):
         if now_indent >= 0:
             if now_indent > self.prev_indent:
                 if self.prev_line_without_comment.strip().endswith(':'):
@@ -740,7 +1233,6 @@ class Structure(object):
                             self.struct.pop()
             self.prev_line_without_comment = line
             self.prev_indent = now_indent
-        return self.to_str()
 
     def to_str(self, sep='.'):
         return sep.join(self.struct)
@@ -754,8 +1246,8 @@ class IndentList(object):
         self.result_indent_list = []
         # Filter #
         self.filters = []
-        self.filters.append(FilterOfBlockElementForIndentList(r'^\s*[0-9a-zA-Z\-]{1,}: (\>|\|)(\-|\+|)'))  # Multi Line Element
-        self.filters.append(FilterOfBlockElementForIndentList(r'^\s*-'))                                   # List Element
+        self.filters.append(FilterOfBlockElementForIndentList(LineTable.BLOCK_SCALAR))  # Multi Line Element
+        self.filters.append(FilterOfBlockElementForIndentList(LineTable.LIST_ITEM))     # List Element
 
     def append(self, indent):
         self.result_indent_list.append(indent)
@@ -764,18 +1256,33 @@ class IndentList(object):
         return self.result_indent_list
 
     def add_with_line_of_text(self, line):
+        self.append(self.get_indent_of_line(line))
+
+    def get_indent_of_line(self, line):
+        """Get the indent of the next line. (-1 means a line to be ignored)
+
+        The state of the block elements is updated, so give the lines in order.
+        """
+        flags, _, raw_indent, _, _ = LineTable.classify(line)
+        return self.get_indent_of_classified_line(flags, raw_indent)
+
+    def get_indent_of_classified_line(self, flags, raw_indent):
+        """Same as get_indent_of_line, for a line classified by LineTable.classify."""
         # Validation #
-        if re.match(r'^\s*#', line) or re.match(r'^\s*\n', line):
-            self.append(-1)
-            return
-        # RAW Indent #
-        indent_length_of_processing_line = self.__get_indent_length_of_target(line)
+        if flags & (LineTable.COMMENT | LineTable.BLANK):
+            return -1
         # Filter #
         for filter in self.filters:
-            if filter.is_filterd(line, indent_length_of_processing_line):
-                self.append(-1)
-                return
-        self.append(indent_length_of_processing_line)
+            if filter.is_filterd(flags, raw_indent):
+                return -1
+        return raw_indent
+
+    def get_state(self):
+        return tuple(filter.get_state() for filter in self.filters)
+
+    def set_state(self, state):
+        for filter, filter_state in zip(self.filters, state):
+            filter.set_state(filter_state)
 
     def get_unit_indent_length(self):
         unit = 0
@@ -787,30 +1294,237 @@ class IndentList(object):
                 break
         return unit
 
-    def __get_indent_length_of_target(self, line):
-        indent_length = 0
-        head_str = re.split(r'[0-9a-zA-Z\-\"\']{1,}', line)
-        if head_str[0].startswith(' '):
-            indent_length = len(head_str[0])
+
+class LineTable(object):
+    """The classification of each line of values.yaml, made in one pass.
+
+    Each line is classified once with the precompiled patterns. (See classify)
+    The filters query this table instead of matching the lines again.
+    """
+
+    # Kind of line (bit flags) #
+    BLANK = 1           # ^\s*\n
+    COMMENT = 2         # ^\s*#
+    KEY = 4             # ^\s*KEY:
+    PLAIN_KEY = 8       # ^\s*[0-9a-zA-Z]*:
+    LIST_ITEM = 16      # ^\s*-
+    BLOCK_SCALAR = 32   # ^\s*KEY: | or ^\s*KEY: >
+
+    PATTERN_SPACES = re.compile(r'\s*')
+    PATTERN_KEY = re.compile(r'([^\s:#][^\s:]*|):')
+    PATTERN_COMMENTED_KEY = re.compile(r'#+\s*([^\s:#][^\s:]*|):')
+    PATTERN_PLAIN_KEY = re.compile(r'[0-9a-zA-Z]*')
+    PATTERN_BLOCK_SCALAR = re.compile(r'[0-9a-zA-Z\-]{1,}: (\>|\|)(\-|\+|)')
+    PATTERN_TOKEN = re.compile(r'[0-9a-zA-Z\-\"\']{1,}')
+
+    def __init__(self, lines: List[str]):
+        """ constructor
+
+        Args:
+            lines (list): A list of values.yaml divided by a new line
+        """
+        self.lines = lines
+        self.flags = array('B')
+        self.spaces = array('i')
+        self.indents = array('i')
+        self.keys = []
+        self.commented_keys = []
+        self.paths = None
+        il = IndentList()
+        for line in lines:
+            flags, spaces, raw_indent, key, commented_key = self.classify(line)
+            self.flags.append(flags)
+            self.spaces.append(spaces)
+            self.indents.append(il.get_indent_of_classified_line(flags, raw_indent))
+            self.keys.append(key)
+            self.commented_keys.append(commented_key)
+        self.indent_unit = 0
+        for indent in self.indents:
+            if indent > 0:
+                self.indent_unit = indent
+                break
+
+    @classmethod
+    def classify(cls, line: str) -> Tuple[int, int, int, str, str]:
+        """Classify a line.
+
+        Args:
+            line (str): A line of values.yaml
+
+        Returns:
+            int: Kind of line. (bit flags)
+            int: Length of the leading whitespaces.
+            int: Indent before the first token. (The raw indent of IndentList)
+            str: The key. (None if it is not a key)
+            str: The commented out key. (None if it is not a commented out key)
+        """
+        spaces = cls.PATTERN_SPACES.match(line).end()
+        flags = 0
+        key = None
+        commented_key = None
+        if '\n' in line[:spaces]:
+            flags |= cls.BLANK
+        if line.startswith('#', spaces):
+            flags |= cls.COMMENT
+            m = cls.PATTERN_COMMENTED_KEY.match(line, spaces)
+            if m is not None:
+                commented_key = m.group(1)
         else:
-            indent_length = 0
-        return indent_length
+            m = cls.PATTERN_KEY.match(line, spaces)
+            if m is not None:
+                key = m.group(1)
+                flags |= cls.KEY
+                if cls.PATTERN_PLAIN_KEY.fullmatch(key):
+                    flags |= cls.PLAIN_KEY
+            if line.startswith('-', spaces):
+                flags |= cls.LIST_ITEM
+            if cls.PATTERN_BLOCK_SCALAR.match(line, spaces):
+                flags |= cls.BLOCK_SCALAR
+        m = cls.PATTERN_TOKEN.search(line)
+        head = line if m is None else line[:m.start()]
+        raw_indent = len(head) if head.startswith(' ') else 0
+        return flags, spaces, raw_indent, key, commented_key
+
+    def __len__(self):
+        return len(self.lines)
+
+    def get_lines(self):
+        return self.lines
+
+    def is_kind_of(self, index: int, flags: int) -> bool:
+        return (self.flags[index] & flags) != 0
+
+    def get_spaces(self, index: int) -> int:
+        return self.spaces[index]
+
+    def get_key(self, index: int) -> str:
+        return self.keys[index]
+
+    def get_commented_key(self, index: int) -> str:
+        return self.commented_keys[index]
+
+    def is_key_or_commented_key(self, index: int, key: str) -> bool:
+        return self.keys[index] == key or self.commented_keys[index] == key
+
+    def count_key(self, key: str) -> int:
+        return self.keys.count(key)
+
+    def has_key_or_commented_key(self, key: str) -> bool:
+        return key in self.keys or key in self.commented_keys
+
+    def get_indent_list(self):
+        """The indent of each line. (The same as IndentList)"""
+        return self.indents
+
+    def get_unit_indent_length(self):
+        return self.indent_unit
+
+    def get_path(self, index: int) -> Tuple[str]:
+        """The structure of the line. (The same as Structure.get_struct)"""
+        if self.paths is None:
+            self.paths = []
+            structure = Structure(self.indent_unit)
+            path = ()
+            for line, indent in zip(self.lines, self.indents):
+                structure.update_struct(line, indent)
+                if len(path) != len(structure.get_struct()) or list(path) != structure.get_struct():
+                    path = tuple(structure.get_struct())
+                self.paths.append(path)
+        return self.paths[index]
+
+
+class IndentIndex(object):
+    def __init__(self, lines: List[str]):
+        """The indent of each line (See IndentList), kept up to date while the lines are edited.
+
+        After an edit, only the lines from the edited one are computed again,
+        until the state of IndentList is the same as before the edit.
+
+        Args:
+            lines (list): A list of values.yaml divided by a new line. (Edit it only with insert and replace)
+        """
+        self.lines = lines
+        self.indent_list = []
+        self.states = []            # the state of IndentList before each line
+        il = IndentList()
+        for line in lines:
+            self.states.append(il.get_state())
+            self.indent_list.append(il.get_indent_of_line(line))
+        self.final_state = il.get_state()
+        self.dirty_begin = None
+        self.dirty_end = None
+
+    def to_list(self):
+        return self.indent_list
+
+    def get_unit_indent_length(self):
+        unit = 0
+        for indent in self.indent_list:
+            if indent > 0:
+                unit = indent
+                break
+        return unit
+
+    def insert(self, index, line):
+        self.lines.insert(index, line)
+        self.indent_list.insert(index, -1)
+        self.states.insert(index, self.states[index] if index < len(self.states) else self.final_state)
+        if self.dirty_end is not None and self.dirty_end >= index:
+            self.dirty_end += 1
+        self.__mark(index)
+
+    def replace(self, index, line):
+        if self.lines[index] == line:
+            return
+        self.lines[index] = line
+        self.__mark(index)
+
+    def refresh(self):
+        """Compute the indent of the edited lines, and of the following lines affected by them."""
+        if self.dirty_begin is None:
+            return
+        il = IndentList()
+        il.set_state(self.states[self.dirty_begin])
+        for i in range(self.dirty_begin, len(self.lines)):
+            state = il.get_state()
+            if i > self.dirty_end and state == self.states[i]:
+                break
+            self.states[i] = state
+            self.indent_list[i] = il.get_indent_of_line(self.lines[i])
+        else:
+            self.final_state = il.get_state()
+        self.dirty_begin = None
+        self.dirty_end = None
+
+    def __mark(self, index):
+        if self.dirty_begin is None:
+            self.dirty_begin = index
+            self.dirty_end = index
+        else:
+            self.dirty_begin = min(self.dirty_begin, index)
+            self.dirty_end = max(self.dirty_end, index)
 
 
 class FilterOfBlockElementForIndentList(object):
-    def __init__(self, regex):
-        self.regex = regex
+    def __init__(self, flag):
+        self.flag = flag
         self.is_block_of_yaml_in_processing = False
         self.indent_length_of_block_of_yaml = -1
 
-    def is_filterd(self, line, indent_length_of_processing_line):
+    def get_state(self):
+        return self.is_block_of_yaml_in_processing, self.indent_length_of_block_of_yaml
+
+    def set_state(self, state):
+        self.is_block_of_yaml_in_processing, self.indent_length_of_block_of_yaml = state
+
+    def is_filterd(self, flags, indent_length_of_processing_line):
         if not self.is_block_of_yaml_in_processing:
-            if self.__is_start_of_block_element(line, indent_length_of_processing_line):
+            if self.__is_start_of_block_element(flags, indent_length_of_processing_line):
                 return True
         return self.__processing_of_block_elements(indent_length_of_processing_line)
 
-    def __is_start_of_block_element(self, line, indent_length_of_processing_line):
-        if re.match(self.regex, line):
+    def __is_start_of_block_element(self, flags, indent_length_of_processing_line):
+        if flags & self.flag:
             self.is_block_of_yaml_in_processing = True
             if self.indent_length_of_block_of_yaml == -1:
                 self.indent_length_of_block_of_yaml = indent_length_of_processing_line
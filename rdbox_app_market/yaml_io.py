@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""YAML of the package.
+
+Parse and emit YAML through this module instead of calling PyYAML directly.
+It uses the libyaml binding (CSafeLoader and CSafeDumper) when PyYAML is built with it,
+and the pure-Python SafeLoader and SafeDumper otherwise. Both produce the same objects and the same text.
+"""
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+    WITH_LIBYAML = True
+except ImportError:
+    from yaml import SafeLoader, SafeDumper
+    WITH_LIBYAML = False
+
+YAMLError = yaml.YAMLError
+
+
+def safe_load(stream, Loader=None):
+    """Parse the first document in a stream. (Like yaml.safe_load)
+
+    Args:
+        stream (str or file): YAML text, or a file opened to read it.
+        Loader (type, optional): A subclass of SafeLoader of this module. Defaults to None. (SafeLoader)
+
+    Returns:
+        Any: The parsed object.
+    """
+    return yaml.load(stream, Loader=Loader or SafeLoader)
+
+
+def dump(data, stream=None, **kwds):
+    """Serialize an object into YAML. (Like yaml.dump, for plain data: dict, list, str, int, float, bool and None)
+
+    Args:
+        data (Any): The object to serialize.
+        stream (file, optional): A file opened to write it. Defaults to None. (Return the text)
+        **kwds: The options of yaml.dump. (indent, default_flow_style, ...)
+
+    Returns:
+        str: The YAML text if stream is None.
+    """
+    if isinstance(data, (dict, list)):
+        return yaml.dump(data, stream, Dumper=SafeDumper, **kwds)
+    # libyaml omits the document end marker ('...') after a plain scalar at the top level.
+    return yaml.dump(data, stream, Dumper=yaml.SafeDumper, **kwds)
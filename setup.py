@@ -7,7 +7,7 @@ setup(
     author='Tatsuya Fukuta',
     author_email='info-rdbox@intec.co.jp',
     url='https://github.com/rdbox-intec',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
     entry_points="""
     [console_scripts]
     rdbox_app_market = rdbox_app_market.__main__:launch
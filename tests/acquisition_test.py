@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+import time
+import pytest
+
+from rdbox_app_market.acquisition import RepositoryAcquisition, RepositoryAcquisitionError
+
+
+class DummyRepos(object):
+    closed = []
+
+    def __init__(self, url, branch, wait=0.0):
+        time.sleep(wait)
+        if url == 'broken':
+            raise OSError('clone failed')
+        self.url = url
+        self.branch = branch
+
+    def close(self):
+        DummyRepos.closed.append(self.url)
+
+
+class TestRepositoryAcquisition(object):
+    def test_as_completed(self):
+        acquisition = RepositoryAcquisition(max_workers=2, timeout=10)
+        slow = acquisition.submit(DummyRepos, 'slow', 'master', wait=0.5)
+        fast = acquisition.submit(DummyRepos, 'fast', 'master')
+        urls = [repo.url for repo in acquisition.as_completed([slow, fast])]
+        assert urls == ['fast', 'slow']
+        assert fast.result().url == 'fast'
+        DummyRepos.closed = []
+        acquisition.close()
+        assert sorted(DummyRepos.closed) == ['fast', 'slow']
+
+    def test_error(self):
+        acquisition = RepositoryAcquisition(max_workers=2, timeout=10)
+        broken = acquisition.submit(DummyRepos, 'broken', 'master')
+        with pytest.raises(RepositoryAcquisitionError):
+            broken.result()
+        acquisition.close()
+
+    def test_timeout(self):
+        acquisition = RepositoryAcquisition(max_workers=1, timeout=0.1)
+        slow = acquisition.submit(DummyRepos, 'slow', 'master', wait=0.5)
+        queued = acquisition.submit(DummyRepos, 'queued', 'master')
+        with pytest.raises(RepositoryAcquisitionError) as e:
+            list(acquisition.as_completed([slow]))
+        assert 'Timed out' in str(e.value)
+        # The hung acquisition is not waited for, and the queued one is cancelled.
+        DummyRepos.closed = []
+        started_at = time.monotonic()
+        acquisition.close()
+        assert time.monotonic() - started_at < 0.3
+        assert queued.future.cancelled()
+        with pytest.raises(RepositoryAcquisitionError) as e:
+            queued.result()
+        assert 'Cancelled' in str(e.value)
+        # Closed when it is ready.
+        deadline = time.monotonic() + 5
+        while len(DummyRepos.closed) == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert DummyRepos.closed == ['slow']
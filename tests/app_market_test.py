@@ -1,5 +1,10 @@
 #!/usr/bin/env python3
-from rdbox_app_market.app_market import RequirementsYaml
+import json
+import pytest
+
+from rdbox_app_market.app_market import RequirementsYaml, ChartInSpecificDir, ChartInSpecificDirPackError, Collector
+from rdbox_app_market.change_plan import ChangePlan
+from rdbox_app_market.chart_features import ChartFeatures
 
 
 class TestRequirementObject(object):
@@ -16,3 +21,75 @@ class TestRequirementObject(object):
         print(data)
         out, _ = capfd.readouterr()
         assert out == "<RequirementObject 'postgresql' : '8.x.x' : 'https://charts.bitnami.com/bitnami' : 'postgresql.enabled' : 'None'>\n"
+
+
+class TestChartInSpecificDir(object):
+    def test_publish_pack_error(self, mocker, tmp_path, settings):
+        repo = mocker.Mock()
+        repo.get_dirpath_with_prefix.return_value = str(tmp_path)
+        gh_repo = mocker.Mock()
+        gh_repo.get_dirpath_with_prefix.return_value = str(tmp_path / 'gh-pages')
+        mocker.patch('rdbox_app_market.app_market.HelmCommand.repo_index').return_value = 'Error: no chart'
+        push = mocker.patch('rdbox_app_market.app_market.GithubRepos.push_atomically')
+        chart_in_specific_dir = ChartInSpecificDir(repo, settings)
+        # The caller commits, so it has to know.
+        with pytest.raises(ChartInSpecificDirPackError):
+            chart_in_specific_dir.publish(gh_repo, True, exec_commit=False)
+        # Logged, and nothing is committed.
+        assert chart_in_specific_dir.publish(gh_repo, True) == []
+        gh_repo.commit.assert_not_called()
+        repo.commit.assert_not_called()
+        push.assert_not_called()
+
+    def test_preprocessing_dump_features(self, mocker, tmp_path, settings):
+        module_dir = tmp_path / 'nginx'
+        module_dir.mkdir()
+        (module_dir / 'values.yaml').write_text('image:\n  repository: bitnami/nginx\n  tag: 1.19.2\nnodeSelector: {}\n')
+        (module_dir / 'Chart.yaml').write_text('apiVersion: v1\nname: nginx\nversion: 1.0.0\n')
+        (module_dir / 'README.md').write_text('# nginx\n\n## TL;DR;\n\n$ helm install my-release bitnami/nginx\n')
+        repo = mocker.Mock()
+        repo.get_dirpath_with_prefix.return_value = str(tmp_path)
+        repo.is_manually_repo.return_value = False
+        mocker.patch.object(ChartInSpecificDir, 'get_number_of_processes').return_value = 1
+        isolations, dependons = mocker.Mock(), mocker.Mock()
+        mocker.patch.object(ChartInSpecificDir, '_ChartInSpecificDir__split_module_by_dependencies').return_value = (isolations, dependons)
+        mocker.patch.object(ChartInSpecificDir, '_ChartInSpecificDir__excludes_unknown_dependencies').return_value = (isolations, dependons)
+        ChartInSpecificDir(repo, settings).preprocessing(features_path=str(tmp_path / 'features.json'))
+        # The rules reuse the dumped index.
+        feature_index = isolations._ChartInSpecificDir__get_invalid_key_list.call_args[0][0]
+        assert set(feature_index.get('nginx').to_dict()) == set(ChartFeatures.NAMES)
+        with open(str(tmp_path / 'features.json')) as file:
+            features = json.load(file)
+        assert set(features['nginx']) == set(ChartFeatures.NAMES)
+        assert features['nginx']['tldr'] is True
+
+
+class TestCollector(object):
+    def test_work_with_change_plan(self, mocker, settings):
+        stable = mocker.Mock()
+        stable.get_specific_dir_from_top.return_value = 'stable'
+        stable.get_changed_paths.return_value = []
+        bitnami = mocker.Mock()
+        bitnami.get_specific_dir_from_top.return_value = 'bitnami'
+        requirements = {stable: {'harbor': ['redis'], 'nginx': []}, bitnami: {'redis': []}}
+        events = []
+
+        def src_repos():
+            for repo in [stable, bitnami]:
+                events.append(('acquired', repo))
+                yield repo
+        mocker.patch('rdbox_app_market.app_market.ChartInSpecificDir').return_value.preprocessing.return_value = (None, None)
+        mocker.patch.object(Collector, '_Collector__scan', side_effect=lambda repo: (requirements[repo], None))
+        preprocess = mocker.patch.object(Collector, '_Collector__preprocess', side_effect=lambda repo, module_names: events.append(('preprocessed', repo, module_names)) or (None, None))
+        load = mocker.patch.object(ChangePlan, 'load')
+        plan = ChangePlan(None, settings)
+        # bitnami was not processed previously.
+        plan.previous_commits = {ChangePlan.build_state_key(stable): 'a'}
+        plan.published = {'redis', 'harbor', 'nginx'}
+        Collector(src_repos(), mocker.Mock(), settings, plan).work()
+        load.assert_called_once()
+        # Each repository is preprocessed as soon as it is acquired, and stable again for the dependency changed in bitnami.
+        assert events == [('acquired', stable), ('preprocessed', stable, set()),
+                          ('acquired', bitnami), ('preprocessed', bitnami, {'redis'}),
+                          ('preprocessed', stable, {'harbor'})]
+        assert preprocess.call_count == 3
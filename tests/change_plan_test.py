@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import yaml
+import pytest
+from git import Repo
+
+from rdbox_app_market.change_plan import ChangePlan
+from rdbox_app_market.github import GithubRepos, ReferenceGithubRepos
+from rdbox_app_market.image_arch import ImageArch, ImageArchResolver
+
+
+class DummyReferenceRepos(ReferenceGithubRepos):
+    def __init__(self, repo, specific_dir_from_top):
+        self.url = 'https://github.com/helm/charts.git'
+        self.branch = 'master'
+        self.specific_dir_from_top = specific_dir_from_top
+        self.repo = repo
+        self.repo_dir = repo.working_tree_dir
+
+
+class DummyRdboxRepos(GithubRepos):
+    def __init__(self, repo, specific_dir_from_top):
+        self.url = 'git@github.com:rdbox-intec/rdbox_app_market.git'
+        self.branch = 'master'
+        self.specific_dir_from_top = specific_dir_from_top
+        self.repo = repo
+        self.repo_dir = repo.working_tree_dir
+
+
+@pytest.fixture
+def git_identity(monkeypatch):
+    for key in ['GIT_AUTHOR_NAME', 'GIT_COMMITTER_NAME']:
+        monkeypatch.setenv(key, 'rdbox-bot')
+    for key in ['GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_EMAIL']:
+        monkeypatch.setenv(key, 'info-rdbox@intec.co.jp')
+
+
+def commit_files(repo, files):
+    for path, text in files.items():
+        path = os.path.join(repo.working_tree_dir, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(text)
+    repo.git.add('.')
+    return repo.index.commit('update').hexsha
+
+
+REQUIREMENTS = {'redis': [], 'harbor': ['redis'], 'nginx': []}
+
+
+class TestChangePlan(object):
+    def test_select_all_without_state(self, tmp_path, git_identity, settings):
+        src = Repo.init(str(tmp_path / 'src'), initial_branch='master')
+        commit_files(src, {'stable/redis/values.yaml': 'a: 1\n', 'stable/harbor/values.yaml': 'a: 1\n', 'stable/nginx/values.yaml': 'a: 1\n'})
+        repo = DummyReferenceRepos(src, 'stable')
+        plan = ChangePlan(None, settings)
+        selection = plan.select([repo], {repo: REQUIREMENTS})
+        assert selection[repo] == {'redis', 'harbor', 'nginx'}
+        assert plan.get_carried_over_module_names() == set()
+
+    def test_select_changed_and_dependents(self, tmp_path, git_identity, settings):
+        src = Repo.init(str(tmp_path / 'src'), initial_branch='master')
+        since = commit_files(src, {'stable/redis/values.yaml': 'a: 1\n', 'stable/harbor/values.yaml': 'a: 1\n', 'stable/nginx/values.yaml': 'a: 1\n'})
+        commit_files(src, {'stable/redis/values.yaml': 'a: 2\n', 'stable/README.md': 'readme\n'})
+        repo = DummyReferenceRepos(src, 'stable')
+        plan = ChangePlan(None, settings)
+        plan.previous_commits = {ChangePlan.build_state_key(repo): since}
+        plan.published = {'redis', 'harbor', 'nginx'}
+        selection = plan.select([repo], {repo: REQUIREMENTS})
+        assert selection[repo] == {'redis', 'harbor'}
+        assert plan.get_carried_over_module_names() == {'nginx'}
+
+    def test_select_dependencies_in_other_repo(self, tmp_path, git_identity, settings):
+        src = Repo.init(str(tmp_path / 'src'), initial_branch='master')
+        since = commit_files(src, {'stable/harbor/values.yaml': 'a: 1\n', 'bitnami/redis/values.yaml': 'a: 1\n'})
+        commit_files(src, {'stable/harbor/values.yaml': 'a: 2\n'})
+        stable = DummyReferenceRepos(src, 'stable')
+        bitnami = DummyReferenceRepos(src, 'bitnami')
+        plan = ChangePlan(None, settings)
+        plan.previous_commits = {ChangePlan.build_state_key(stable): since, ChangePlan.build_state_key(bitnami): since}
+        plan.published = {'redis', 'harbor'}
+        selection = plan.select([stable, bitnami], {stable: {'harbor': ['redis']}, bitnami: {'redis': []}})
+        assert selection[stable] == {'harbor'}
+        # Only to verify harbor.
+        assert selection[bitnami] == {'redis'}
+        assert plan.get_carried_over_module_names(['harbor', 'redis']) == set()
+
+    def test_add_one_by_one(self, tmp_path, git_identity, settings):
+        src = Repo.init(str(tmp_path / 'src'), initial_branch='master')
+        since = commit_files(src, {'stable/harbor/values.yaml': 'a: 1\n', 'stable/nginx/values.yaml': 'a: 1\n', 'bitnami/redis/values.yaml': 'a: 1\n'})
+        commit_files(src, {'bitnami/redis/values.yaml': 'a: 2\n'})
+        stable = DummyReferenceRepos(src, 'stable')
+        bitnami = DummyReferenceRepos(src, 'bitnami')
+        plan = ChangePlan(None, settings)
+        plan.previous_commits = {ChangePlan.build_state_key(stable): since, ChangePlan.build_state_key(bitnami): since}
+        plan.published = {'redis', 'harbor', 'nginx'}
+        plan.add(stable, {'harbor': ['redis'], 'nginx': []})
+        assert plan.get_selection() == {stable: set()}
+        # The repository acquired later changes the selection of the earlier one.
+        plan.add(bitnami, {'redis': []})
+        assert plan.get_selection() == {stable: {'harbor'}, bitnami: {'redis'}}
+        assert plan.get_carried_over_module_names(['harbor', 'redis']) == {'nginx'}
+
+    def test_load_save_and_carry_over(self, tmp_path, git_identity, settings):
+        index = {'apiVersion': 'v1', 'generated': '2020-10-01T00:00:00Z', 'entries': {
+            'redis': [{'name': 'redis', 'version': '1.0.0', 'created': '2020-10-01T00:00:00Z', 'urls': ['https://rdbox-intec.github.io/rdbox_app_market/bot-gen/redis-1.0.0.tgz']}],
+            'nginx': [{'name': 'nginx', 'version': '2.0.0', 'created': '2020-10-01T00:00:00Z', 'urls': ['https://rdbox-intec.github.io/rdbox_app_market/bot-gen/nginx-2.0.0.tgz']}],
+        }}
+        master = Repo.init(str(tmp_path / 'master'), initial_branch='master')
+        commit_files(master, {'bot-gen/redis/values.yaml': 'a: 1\n', 'bot-gen/nginx/values.yaml': 'a: 1\n', 'bot-gen/rejected/values.yaml': 'a: 1\n'})
+        ghpage = Repo.init(str(tmp_path / 'ghpage'), initial_branch='gh-pages')
+        commit_files(ghpage, {'bot-gen/index.yaml': yaml.dump(index), 'bot-gen/redis-1.0.0.tgz': 'tgz', 'bot-gen/nginx-2.0.0.tgz': 'tgz'})
+        dst_master = DummyRdboxRepos(master, 'bot-gen')
+        dst_ghpage = DummyRdboxRepos(ghpage, 'bot-gen')
+        src = Repo.init(str(tmp_path / 'src'), initial_branch='master')
+        commit_files(src, {'stable/redis/values.yaml': 'a: 1\n', 'stable/nginx/values.yaml': 'a: 1\n', 'stable/rejected/values.yaml': 'a: 1\n'})
+        repo = DummyReferenceRepos(src, 'stable')
+        # 1st run (only the state is recorded)
+        plan = ChangePlan(dst_ghpage, settings)
+        plan.load(dst_master)
+        plan.select([repo], {repo: {'redis': [], 'nginx': [], 'rejected': []}})
+        plan.save(dst_master)
+        commit_files(master, {})
+        # 2nd run
+        commit_files(src, {'stable/redis/values.yaml': 'a: 2\n'})
+        # RdboxGithubRepos empties the directory.
+        for dst in [master, ghpage]:
+            shutil.rmtree(os.path.join(dst.working_tree_dir, 'bot-gen'))
+        plan = ChangePlan(dst_ghpage, settings)
+        plan.load(dst_master)
+        selection = plan.select([repo], {repo: {'redis': [], 'nginx': [], 'rejected': []}})
+        # Converted previously but not published.
+        assert selection[repo] == {'redis', 'rejected'}
+        index_path = plan.carry_over(dst_master, ['redis'])
+        try:
+            with open(index_path) as file:
+                carried = yaml.safe_load(file)
+        finally:
+            os.remove(index_path)
+        assert list(carried['entries'].keys()) == ['nginx']
+        assert carried['entries']['nginx'][0]['created'] == '2020-10-01T00:00:00Z'
+        assert os.path.isfile(os.path.join(master.working_tree_dir, 'bot-gen', 'nginx', 'values.yaml'))
+        assert not os.path.exists(os.path.join(master.working_tree_dir, 'bot-gen', 'rejected'))
+        assert os.path.isfile(os.path.join(ghpage.working_tree_dir, 'bot-gen', 'nginx-2.0.0.tgz'))
+        assert not os.path.exists(os.path.join(ghpage.working_tree_dir, 'bot-gen', 'redis-1.0.0.tgz'))
+
+    def test_fingerprint_mismatch(self, tmp_path, git_identity, settings):
+        master = Repo.init(str(tmp_path / 'master'), initial_branch='master')
+        commit_files(master, {'bot-gen/.upstream_commits.yaml': yaml.dump({'fingerprint': 'old', 'repositories': {'x': 'y'}})})
+        ghpage = Repo.init(str(tmp_path / 'ghpage'), initial_branch='gh-pages')
+        commit_files(ghpage, {'bot-gen/index.yaml': yaml.dump({'apiVersion': 'v1', 'entries': {}})})
+        plan = ChangePlan(DummyRdboxRepos(ghpage, 'bot-gen'), settings)
+        plan.load(DummyRdboxRepos(master, 'bot-gen'))
+        assert plan.previous_commits == {}
+
+    def test_fingerprint_registry(self, settings):
+        other = settings._replace(registry=settings.registry._replace(enabled=False))
+        assert ChangePlan.build_fingerprint(other) != ChangePlan.build_fingerprint(settings)
+        other = settings._replace(registry=settings.registry._replace(snapshot='snapshot.json'))
+        assert ChangePlan.build_fingerprint(other) == ChangePlan.build_fingerprint(settings)
+
+    def test_reconvert_when_image_gains_arm(self, tmp_path, git_identity, settings):
+        index = {'apiVersion': 'v1', 'generated': '2020-10-01T00:00:00Z', 'entries': {
+            'redis': [{'name': 'redis', 'version': '1.0.0', 'urls': ['https://rdbox-intec.github.io/rdbox_app_market/bot-gen/redis-1.0.0.tgz']}],
+            'nginx': [{'name': 'nginx', 'version': '2.0.0', 'urls': ['https://rdbox-intec.github.io/rdbox_app_market/bot-gen/nginx-2.0.0.tgz']}],
+        }}
+        master = Repo.init(str(tmp_path / 'master'), initial_branch='master')
+        commit_files(master, {'bot-gen/redis/values.yaml': 'a: 1\n', 'bot-gen/nginx/values.yaml': 'a: 1\n'})
+        ghpage = Repo.init(str(tmp_path / 'ghpage'), initial_branch='gh-pages')
+        commit_files(ghpage, {'bot-gen/index.yaml': yaml.dump(index), 'bot-gen/redis-1.0.0.tgz': 'tgz', 'bot-gen/nginx-2.0.0.tgz': 'tgz'})
+        dst_master = DummyRdboxRepos(master, 'bot-gen')
+        dst_ghpage = DummyRdboxRepos(ghpage, 'bot-gen')
+        src = Repo.init(str(tmp_path / 'src'), initial_branch='master')
+        commit_files(src, {'stable/redis/values.yaml': 'a: 1\n', 'stable/nginx/values.yaml': 'a: 1\n'})
+        repo = DummyReferenceRepos(src, 'stable')
+        requirements = {'redis': [], 'nginx': []}
+        images = {'redis': [('rdbox-test/redis', '6.0')], 'nginx': [('rdbox-test/nginx', 1.19)]}
+        resolver = ImageArchResolver.get_instance(settings)
+        resolver.preload({('rdbox-test/redis', '6.0'): ImageArch(True, ('amd64', 'arm64')), ('rdbox-test/nginx', '1.19'): ImageArch(True, ('amd64',))})
+        # 1st run (everything is converted)
+        plan = ChangePlan(dst_ghpage, settings)
+        plan.load(dst_master)
+        plan.add(repo, requirements, images)
+        assert plan.get_selection()[repo] == {'redis', 'nginx'}
+        plan.save(dst_master, ['redis', 'nginx'])
+        commit_files(master, {})
+        with open(os.path.join(master.working_tree_dir, 'bot-gen', ChangePlan.STATE_FILE)) as file:
+            state = yaml.safe_load(file)
+        assert state['image_archs'] == {'nginx': [['rdbox-test/nginx', '1.19', True, ['amd64']]],
+                                        'redis': [['rdbox-test/redis', '6.0', True, ['amd64', 'arm64']]]}
+        # 2nd run (no upstream change)
+        plan = ChangePlan(dst_ghpage, settings)
+        plan.load(dst_master)
+        plan.add(repo, requirements, images)
+        assert plan.get_selection()[repo] == set()
+        # 3rd run (the image of nginx gains arm64 on the registry)
+        resolver.preload({('rdbox-test/nginx', '1.19'): ImageArch(True, ('amd64', 'arm64'))})
+        plan = ChangePlan(dst_ghpage, settings)
+        plan.load(dst_master)
+        plan.add(repo, requirements, images)
+        assert plan.get_selection()[repo] == {'nginx'}
+        assert plan.get_carried_over_module_names(['nginx']) == {'redis'}
+        plan.save(dst_master, ['nginx'])
+        with open(os.path.join(master.working_tree_dir, 'bot-gen', ChangePlan.STATE_FILE)) as file:
+            state = yaml.safe_load(file)
+        # The carried over chart keeps its record.
+        assert state['image_archs'] == {'nginx': [['rdbox-test/nginx', '1.19', True, ['amd64', 'arm64']]],
+                                        'redis': [['rdbox-test/redis', '6.0', True, ['amd64', 'arm64']]]}
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+import json
+import textwrap
+import pytest
+
+from rdbox_app_market.app_market import HelmModule, ReadmeMd
+from rdbox_app_market.chart_features import ChartFeatures, ChartFeatureIndex, BaseRejectionRule, RejectionRules
+from rdbox_app_market.values_yaml import ValuesYaml, FilterOfIngress
+
+VALUES_YAML = {
+    'active': textwrap.dedent("""\
+        image:
+          repository: bitnami/nginx
+          tag: 1.19.2
+        nodeSelector: {}
+        persistence:
+          # storageClass: "-"
+          size: 8Gi
+        ingress:
+          enabled: false
+          path: /
+          hosts:
+            - chart-example.local
+          annotations: {}
+          tls: []
+        """),
+    'commentout': textwrap.dedent("""\
+        replicaCount: 1
+        # nodeSelector: {}
+        ingress:
+          enabled: false
+          certManager: false
+          hosts:
+            - name: nginx.local
+              path: /
+              tls: false
+              tlsSecret: nginx.local-tls
+        """),
+    'invalid': 'image: [\n',
+}
+README_MD = {
+    'active': '# nginx\n\n## TL;DR;\n\n$ helm install my-release bitnami/nginx\n',
+    'commentout': '# nginx\n\nThis chart is deprecated.\n',
+    'invalid': None,
+}
+CHART_YAML = {
+    'active': 'apiVersion: v1\nname: active\nversion: 1.0.0\n',
+    'commentout': 'apiVersion: v2\nname: commentout\nversion: 1.0.0\ntype: library\n',
+    'invalid': None,
+}
+
+
+@pytest.fixture
+def helm_modules(tmp_path, settings):
+    helm_modules = {}
+    for module_name, values_yaml in VALUES_YAML.items():
+        module_dir = tmp_path / module_name
+        module_dir.mkdir()
+        (module_dir / 'values.yaml').write_text(values_yaml)
+        if README_MD[module_name] is not None:
+            (module_dir / 'README.md').write_text(README_MD[module_name])
+        if CHART_YAML[module_name] is not None:
+            (module_dir / 'Chart.yaml').write_text(CHART_YAML[module_name])
+        helm_modules[module_name] = HelmModule(str(tmp_path), module_name, 1, settings)
+    (tmp_path / 'active' / 'requirements.yaml').write_text(textwrap.dedent("""\
+        dependencies:
+          - name: redis
+            version: 10.x.x
+            repository: https://charts.bitnami.com/bitnami
+        """))
+    helm_modules['active'] = HelmModule(str(tmp_path), 'active', 1, settings)
+    return helm_modules
+
+
+class TestChartFeatures(object):
+    def test_scan(self, helm_modules):
+        row = ChartFeatures.scan(helm_modules['active'])
+        assert row.to_dict() == {'module_name': 'active', 'active_nodeSelector': True, 'commentout_nodeSelector': False,
+                                 'expected_structure_for_imagetag': True, 'storageClass': True, 'ingress_shape': FilterOfIngress.SHAPE_STR_HOSTS,
+                                 'deprecated_at_head': False, 'tldr': True, 'bitnami': True, 'library_chart': False, 'requirements': ('redis',)}
+        row = ChartFeatures.scan(helm_modules['commentout'])
+        assert row.to_dict() == {'module_name': 'commentout', 'active_nodeSelector': False, 'commentout_nodeSelector': True,
+                                 'expected_structure_for_imagetag': None, 'storageClass': False, 'ingress_shape': FilterOfIngress.SHAPE_DICT_HOSTS,
+                                 'deprecated_at_head': True, 'tldr': False, 'bitnami': False, 'library_chart': True, 'requirements': ()}
+        row = ChartFeatures.scan(helm_modules['invalid'])
+        assert row.to_dict() == {'module_name': 'invalid', 'active_nodeSelector': False, 'commentout_nodeSelector': False,
+                                 'expected_structure_for_imagetag': False, 'storageClass': False, 'ingress_shape': None,
+                                 'deprecated_at_head': False, 'tldr': False, 'bitnami': False, 'library_chart': False, 'requirements': ()}
+
+    def test_same_as_helm_module(self, helm_modules):
+        for module_name, helm_module in helm_modules.items():
+            row = ChartFeatures.scan(helm_module)
+            assert row.get('active_nodeSelector') == helm_module.has_active_nodeSelector()
+            assert row.get('commentout_nodeSelector') == helm_module.has_commentout_nodeSelector()
+            assert row.get('expected_structure_for_imagetag') == helm_module.has_expected_structure_for_imagetag()
+            assert row.get('deprecated_at_head') == helm_module.is_contain_deprecate_string_at_head()
+            assert row.get('tldr') == helm_module.is_contain_tldr_string()
+            assert row.get('bitnami') == helm_module.is_contain_bitnami_string()
+
+    def test_lazy(self, helm_modules, mocker):
+        get_flags = mocker.spy(ReadmeMd, 'get_flags')
+        has_active_nodeSelector = mocker.spy(ValuesYaml, 'has_active_nodeSelector')
+        row = ChartFeatures(helm_modules['active'])
+        assert row.to_dict() == {'module_name': 'active'}
+        assert row.get('tldr') is True
+        assert row.get('bitnami') is True
+        assert get_flags.call_count == 1
+        assert has_active_nodeSelector.call_count == 0
+        assert row.to_dict() == {'module_name': 'active', 'deprecated_at_head': False, 'tldr': True, 'bitnami': True}
+        with pytest.raises(KeyError):
+            row.get('unknown')
+
+    def test_forget_values_yaml(self, helm_modules):
+        row = ChartFeatures(helm_modules['commentout'])
+        assert row.get('active_nodeSelector') is False
+        helm_modules['commentout'].correct_commentout_nodeSelector()
+        assert row.get('active_nodeSelector') is False
+        row.forget_values_yaml()
+        assert row.get('active_nodeSelector') is True
+
+    def test_is_bitnami_common(self, helm_modules, tmp_path, settings):
+        assert ChartFeatures(helm_modules['active']).is_bitnami_common() is False
+        (tmp_path / 'common').mkdir()
+        (tmp_path / 'common' / 'values.yaml').write_text('{}\n')
+        (tmp_path / 'common' / 'README.md').write_text('# Library Chart of bitnami\n')
+        assert ChartFeatures(HelmModule(str(tmp_path), 'common', 1, settings)).is_bitnami_common() is True
+        (tmp_path / 'common' / 'README.md').unlink()
+        assert ChartFeatures(HelmModule(str(tmp_path), 'common', 1, settings)).is_bitnami_common() is False
+
+
+class TestChartFeatureIndex(object):
+    def test_build(self, helm_modules):
+        index = ChartFeatureIndex.build(helm_modules, 4)
+        assert len(index) == 3
+        assert 'active' in index
+        assert index.get('invalid').to_dict() == ChartFeatures.scan(helm_modules['invalid']).to_dict()
+        assert len(ChartFeatureIndex.build({}, 4)) == 0
+
+    def test_map(self, helm_modules):
+        index = ChartFeatureIndex(helm_modules)
+        for max_workers in [1, 4]:
+            assert index.map(lambda row: row.get('active_nodeSelector'), ['invalid', 'commentout', 'active'], max_workers) == [False, False, True]
+        assert index.map(lambda row: row.get('tldr'), [], 4) == []
+
+    def test_dump(self, helm_modules, tmp_path):
+        index = ChartFeatureIndex.build(helm_modules)
+        index.dump(str(tmp_path / 'features.json'))
+        obj = json.loads((tmp_path / 'features.json').read_text())
+        assert list(obj.keys()) == ['active', 'commentout', 'invalid']
+        assert obj['active']['requirements'] == ['redis']
+        assert obj['commentout']['library_chart'] is True
+        assert list(obj['invalid'].keys()) == list(ChartFeatures.NAMES)
+
+
+class TestRejectionRules(object):
+    def test_build_default(self):
+        reasons = [rule.get_reason() for rule in RejectionRules.build_default(True).get_rules()]
+        assert reasons == ['deprecate', 'TLDR', 'nodeSelector', 'imageTag']
+        reasons = [rule.get_reason() for rule in RejectionRules.build_default(False).get_rules()]
+        assert reasons == ['deprecate', 'nodeSelector', 'imageTag']
+
+    def test_register(self):
+        class RuleOfLibrary(BaseRejectionRule):
+            REASON = 'library'
+            COST = 5
+
+            def rejects(self, row):
+                return row.get('library_chart')
+        rules = RejectionRules.build_default(False)
+        rules.register(RuleOfLibrary())
+        assert [rule.get_reason() for rule in rules.get_rules()] == ['deprecate', 'library', 'nodeSelector', 'imageTag']
+
+    def test_check(self, helm_modules, mocker):
+        has_active_nodeSelector = mocker.spy(ValuesYaml, 'has_active_nodeSelector')
+        rules = RejectionRules.build_default(True)
+        # deprecated (The values.yaml is not read)
+        row = ChartFeatures(helm_modules['commentout'])
+        assert rules.check(row) == 'deprecate'
+        assert has_active_nodeSelector.call_count == 0
+        assert row.get_modifications() == []
+        assert rules.check(ChartFeatures(helm_modules['active'])) is None
+        assert rules.check(ChartFeatures(helm_modules['invalid'])) == 'TLDR'
+        assert RejectionRules.build_default(False).check(ChartFeatures(helm_modules['invalid'])) == 'nodeSelector'
+
+    def test_check_commentout_nodeSelector(self, helm_modules, tmp_path):
+        (tmp_path / 'commentout' / 'README.md').write_text('## TL;DR\n')
+        row = ChartFeatures(helm_modules['commentout'])
+        assert RejectionRules.build_default(True).check(row) is None
+        assert row.get_modifications() == ['nodeSelector']
+        assert 'nodeSelector: {} #{}\n' in (tmp_path / 'commentout' / 'values.yaml').read_text()
+        assert row.get('active_nodeSelector') is True
+
+    def test_apply(self, helm_modules, tmp_path, mocker):
+        (tmp_path / 'commentout' / 'README.md').write_text('## TL;DR\n')
+        r_print = mocker.patch('rdbox_app_market.chart_features.r_print')
+        index = ChartFeatureIndex(helm_modules)
+        rejected = RejectionRules.build_default(True).apply(index, ['invalid', 'commentout', 'active'], 4)
+        assert rejected == ['invalid']
+        assert [call[0][0] for call in r_print.info.call_args_list] == ['Modify(nodeSelector): commentout', 'Delete(TLDR): invalid']
@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+import pytest
+
+from rdbox_app_market.settings import Settings, RdboxSettings, KubernetesSettings, DockerhubSettings, RegistrySettings, HelmSettings, GitSettings, CacheSettings
+
+
+@pytest.fixture
+def settings():
+    """The settings of rdbox_app_market.conf, independent of the working directory."""
+    return Settings(
+        RdboxSettings(0.8, '/tmp/rdbox_app_market.log', 'DEBUG', 'DEBUG'),
+        KubernetesSettings('rdbox.lan', 'rdbox-common-tls', 'openebs-jiva-rdbox'),
+        DockerhubSettings('https://hub.docker.com', 8, 10.0, 3, 1.0),
+        RegistrySettings(True, 'hub', 'https://registry-1.docker.io', 'localhost 127.0.0.1', '', 'amd64'),
+        HelmSettings(''),
+        GitSettings('/tmp/.rdbox_app_market.mirrors', True, 4, 1800.0, 3, 2.0),
+        CacheSettings('/tmp/.rdbox_app_market.cache/conversion', 2048.0, 30.0, '/tmp/.rdbox_app_market.cache/arch', 24.0, 1.0,
+                      '/tmp/.rdbox_app_market.cache/template', 30.0))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+import os
+import time
+
+from rdbox_app_market.conversion_cache import ConversionCache
+from rdbox_app_market.github import GithubRepos
+from rdbox_app_market.app_market import HelmModule
+from rdbox_app_market.image_arch import ImageArch
+
+
+class DummyPagesRepos(GithubRepos):
+    def __init__(self):
+        self.url = 'git@github.com:rdbox-intec/rdbox_app_market.git'
+        self.specific_dir_from_top = 'bot-gen'
+
+
+def make_chart(specific_dir_path, module_name, values_text, settings):
+    os.makedirs(os.path.join(specific_dir_path, module_name), exist_ok=True)
+    with open(os.path.join(specific_dir_path, module_name, 'values.yaml'), 'w') as file:
+        file.write(values_text)
+    return HelmModule(specific_dir_path, module_name, 1, settings)
+
+
+class TestConversionCache(object):
+    def test_build_key(self, tmp_path, settings):
+        cache = ConversionCache(str(tmp_path / 'cache'), 1, 1)
+        helm_module = make_chart(str(tmp_path / 'charts'), 'redis', 'nodeSelector: {}\n', settings)
+        key = cache.build_key(helm_module, 'isolations', False, DummyPagesRepos(), settings)
+        assert key == cache.build_key(helm_module, 'isolations', False, DummyPagesRepos(), settings)
+        assert key != cache.build_key(helm_module, 'dependons', False, DummyPagesRepos(), settings)
+        helm_module = make_chart(str(tmp_path / 'charts'), 'redis', 'nodeSelector: {}\nimage: {}\n', settings)
+        assert key != cache.build_key(helm_module, 'isolations', False, DummyPagesRepos(), settings)
+
+    def test_build_key_with_image_archs(self, tmp_path, settings):
+        cache = ConversionCache(str(tmp_path / 'cache'), 1, 1)
+        helm_module = make_chart(str(tmp_path / 'charts'), 'redis', 'nodeSelector: {}\n', settings)
+        amd64 = {('bitnami/redis', '6.0.8'): ImageArch(True, ('amd64',))}
+        key = cache.build_key(helm_module, 'isolations', False, DummyPagesRepos(), settings, amd64)
+        assert key == cache.build_key(helm_module, 'isolations', False, DummyPagesRepos(), settings, dict(amd64))
+        # The image came to support arm64 after the previous lookup expired.
+        multi_arch = {('bitnami/redis', '6.0.8'): ImageArch(True, ('amd64', 'arm64'))}
+        assert key != cache.build_key(helm_module, 'isolations', False, DummyPagesRepos(), settings, multi_arch)
+        assert key != cache.build_key(helm_module, 'isolations', False, DummyPagesRepos(), settings)
+
+    def test_store_and_restore(self, tmp_path, settings):
+        cache = ConversionCache(str(tmp_path / 'cache'), 1, 1)
+        specific_dir_path = str(tmp_path / 'charts')
+        helm_module = make_chart(specific_dir_path, 'redis', 'nodeSelector: {}\n', settings)
+        key = cache.build_key(helm_module, 'isolations', False, DummyPagesRepos(), settings)
+        assert cache.restore(key, helm_module.get_module_dir_path(), specific_dir_path, str(tmp_path / 'icons')) is None
+        # converted
+        make_chart(specific_dir_path, 'redis', 'nodeSelector:\n  beta.kubernetes.io/os: linux\n', settings)
+        tgz_path = os.path.join(specific_dir_path, 'redis-1.0.0.tgz')
+        with open(tgz_path, 'wb') as file:
+            file.write(b'tgz')
+        icon_path = str(tmp_path / 'redis.png')
+        with open(icon_path, 'wb') as file:
+            file.write(b'png')
+        cache.store(key, helm_module.get_module_dir_path(), tgz_path, [icon_path])
+        # next run
+        os.remove(tgz_path)
+        make_chart(specific_dir_path, 'redis', 'nodeSelector: {}\n', settings)
+        assert cache.restore(key, helm_module.get_module_dir_path(), specific_dir_path, str(tmp_path / 'icons')) == tgz_path
+        assert open(os.path.join(helm_module.get_module_dir_path(), 'values.yaml')).read() == 'nodeSelector:\n  beta.kubernetes.io/os: linux\n'
+        assert open(tgz_path, 'rb').read() == b'tgz'
+        assert os.path.isfile(str(tmp_path / 'icons' / 'redis.png'))
+
+    def test_evict(self, tmp_path, settings):
+        cache = ConversionCache(str(tmp_path / 'cache'), 1, 1)
+        specific_dir_path = str(tmp_path / 'charts')
+        tgz_path = os.path.join(specific_dir_path, 'chart.tgz')
+        keys = []
+        for module_name in ['old', 'new']:
+            helm_module = make_chart(specific_dir_path, module_name, module_name + ': {}\n', settings)
+            with open(tgz_path, 'wb') as file:
+                file.write(b'tgz')
+            keys.append(cache.build_key(helm_module, 'isolations', False, DummyPagesRepos(), settings))
+            cache.store(keys[-1], helm_module.get_module_dir_path(), tgz_path)
+        old_meta = os.path.join(cache.get_cache_dir(), keys[0][:2], keys[0], ConversionCache.META_FILE)
+        os.utime(old_meta, (time.time() - 2 * 24 * 60 * 60, time.time() - 2 * 24 * 60 * 60))
+        assert cache.evict() == [keys[0]]
+        assert cache.evict() == []
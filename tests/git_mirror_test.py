@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+import os
+import time
+import pytest
+from git import Repo, GitCommandError
+
+from rdbox_app_market.git_mirror import GitMirror, CloneRegistry, WorktreeStore
+
+
+@pytest.fixture
+def upstream(tmp_path, monkeypatch):
+    for key in ['GIT_AUTHOR_NAME', 'GIT_COMMITTER_NAME']:
+        monkeypatch.setenv(key, 'rdbox-bot')
+    for key in ['GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_EMAIL']:
+        monkeypatch.setenv(key, 'info-rdbox@intec.co.jp')
+    repo = Repo.init(str(tmp_path / 'upstream'), initial_branch='master')
+    os.makedirs(os.path.join(repo.working_tree_dir, 'stable', 'redis'))
+    with open(os.path.join(repo.working_tree_dir, 'stable', 'redis', 'values.yaml'), 'w') as file:
+        file.write('nodeSelector: {}\n')
+    repo.git.add('.')
+    repo.index.commit('init')
+    return repo
+
+
+def commit_file(repo, path, text):
+    with open(os.path.join(repo.working_tree_dir, path), 'w') as file:
+        file.write(text)
+    repo.git.add('.')
+    return repo.index.commit('update').hexsha
+
+
+def test_reuse_mirror(tmp_path, upstream):
+    mirror_path = str(tmp_path / 'mirror' / 'master')
+    mirror = GitMirror('file://' + upstream.working_tree_dir, 'master', mirror_path)
+    repo = mirror.acquire()
+    values_yaml = os.path.join(mirror_path, 'stable', 'redis', 'values.yaml')
+    with open(values_yaml, 'w') as file:
+        file.write('# modified by the previous run\n')
+    with open(os.path.join(mirror_path, 'garbage'), 'w') as file:
+        file.write('garbage\n')
+    mirror.release()
+    # fetch and reset
+    hexsha = commit_file(upstream, os.path.join('stable', 'redis', 'values.yaml'), 'nodeSelector: {}\nimage: {}\n')
+    repo = mirror.acquire()
+    assert repo.head.commit.hexsha == hexsha
+    assert open(values_yaml).read() == 'nodeSelector: {}\nimage: {}\n'
+    assert not os.path.exists(os.path.join(mirror_path, 'garbage'))
+    mirror.release()
+
+
+def test_reclone_damaged_mirror(tmp_path, upstream):
+    mirror_path = str(tmp_path / 'mirror' / 'master')
+    mirror = GitMirror('file://' + upstream.working_tree_dir, 'master', mirror_path)
+    mirror.acquire()
+    mirror.release()
+    os.remove(os.path.join(mirror_path, '.git', 'HEAD'))
+    repo = mirror.acquire()
+    assert repo.head.commit.hexsha == upstream.head.commit.hexsha
+    mirror.release()
+
+
+def test_kill_hung_clone(tmp_path, upstream, monkeypatch):
+    # The upload-pack of the upstream hangs.
+    hook = tmp_path / 'hang.sh'
+    hook.write_text('#!/bin/sh\nsleep 10\nexec "$@"\n')
+    hook.chmod(0o755)
+    config = tmp_path / 'gitconfig'
+    config.write_text('[uploadpack]\n\tpackObjectsHook = {hook}\n'.format(hook=hook))
+    monkeypatch.setenv('GIT_CONFIG_GLOBAL', str(config))
+    mirror = GitMirror('file://' + upstream.working_tree_dir, 'master', str(tmp_path / 'mirror' / 'master'), timeout=0.5)
+    started_at = time.monotonic()
+    with pytest.raises(GitCommandError):
+        mirror.acquire()
+    assert time.monotonic() - started_at < 5
+
+
+def test_sparse_checkout(tmp_path, upstream):
+    upstream.git.config('uploadpack.allowFilter', 'true')
+    os.makedirs(os.path.join(upstream.working_tree_dir, 'incubator', 'kafka'))
+    hexsha = commit_file(upstream, os.path.join('incubator', 'kafka', 'values.yaml'), 'nodeSelector: {}\n')
+    mirror_path = str(tmp_path / 'mirror' / 'master')
+    mirror = GitMirror('file://' + upstream.working_tree_dir, 'master', mirror_path, ['stable'])
+    repo = mirror.acquire()
+    assert repo.head.commit.hexsha == hexsha
+    assert repo.git.config('remote.origin.partialclonefilter') == 'blob:none'
+    assert os.path.isfile(os.path.join(mirror_path, 'stable', 'redis', 'values.yaml'))
+    assert not os.path.exists(os.path.join(mirror_path, 'incubator'))
+    mirror.add_sparse_dirs(['incubator'])
+    assert os.path.isfile(os.path.join(mirror_path, 'incubator', 'kafka', 'values.yaml'))
+    mirror.release()
+    # narrowed again on the next run
+    mirror = GitMirror('file://' + upstream.working_tree_dir, 'master', mirror_path, ['stable'])
+    mirror.acquire()
+    assert not os.path.exists(os.path.join(mirror_path, 'incubator'))
+    mirror.release()
+
+
+class TestCloneRegistry(object):
+    def test_shared_checkout(self, tmp_path, upstream):
+        url = 'file://' + upstream.working_tree_dir
+        mirror_path = str(tmp_path / 'mirror' / 'master')
+        stable = CloneRegistry.checkout(url, 'master', mirror_path, ['stable'])
+        hexsha = commit_file(upstream, 'README.md', '# charts\n')
+        incubator = CloneRegistry.checkout(url, 'master', mirror_path, ['incubator'])
+        # The second view is not fetched again.
+        assert incubator is stable
+        assert incubator.get_repo().head.commit.hexsha != hexsha
+        assert incubator.get_sparse_dirs() == ['stable', 'incubator']
+        CloneRegistry.release(url, 'master')
+        assert stable.get_repo() is not None
+        CloneRegistry.release(url, 'master')
+        assert stable.get_repo() is None
+        assert (url, 'master') not in CloneRegistry._entries
+
+
+class TestWorktreeStore(object):
+    def test_add_worktree(self, tmp_path, upstream):
+        upstream.git.checkout('-b', 'gh-pages')
+        commit_file(upstream, 'index.yaml', 'apiVersion: v1\n')
+        upstream.git.checkout('master')
+        origin = Repo.clone_from(upstream.working_tree_dir, str(tmp_path / 'origin.git'), bare=True)
+        url = 'file://' + origin.git_dir
+        store_path = str(tmp_path / 'store' / 'rdbox_app_market.git')
+        master = WorktreeStore.add_worktree(url, 'master', store_path, str(tmp_path / 'rdbox' / 'master'))
+        ghpage = WorktreeStore.add_worktree(url, 'gh-pages', store_path, str(tmp_path / 'rdbox' / 'gh-pages'))
+        assert os.path.isfile(os.path.join(master.working_tree_dir, 'stable', 'redis', 'values.yaml'))
+        assert os.path.isfile(os.path.join(ghpage.working_tree_dir, 'index.yaml'))
+        assert os.path.realpath(master.common_dir) == os.path.realpath(store_path)
+        assert os.path.realpath(ghpage.common_dir) == os.path.realpath(store_path)
+        # commit and push from the worktree
+        hexsha = commit_file(ghpage, 'index.yaml', 'apiVersion: v1\nentries: {}\n')
+        ghpage.remote(name='origin').push()
+        assert origin.commit('gh-pages').hexsha == hexsha
+        # replaced on the next run
+        with open(os.path.join(master.working_tree_dir, 'garbage'), 'w') as file:
+            file.write('garbage\n')
+        master = WorktreeStore.add_worktree(url, 'master', store_path, str(tmp_path / 'rdbox' / 'master'))
+        assert not os.path.exists(os.path.join(master.working_tree_dir, 'garbage'))
+        assert master.head.commit.hexsha == upstream.head.commit.hexsha
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+from http.client import InvalidURL
+import os
+import pytest
+from git import Repo
+
+from rdbox_app_market.github import GithubRepos, ReferenceGithubRepos
+from rdbox_app_market.git_mirror import WorktreeStore
+
+
+class DummyRepos(GithubRepos):
+    def __init__(self, url):
+        self.url = url
+        self.specific_dir_from_top = 'bot-gen'
+
+
+class TestGithubRepos(object):
+    @pytest.mark.parametrize('url', [
+        'https://github.com/rdbox-intec/rdbox_app_market.git',
+        'git@github.com:rdbox-intec/rdbox_app_market.git',
+        'file:///tmp/bench/remote/rdbox-intec/rdbox_app_market.git',
+    ])
+    def test_account_and_repository_name(self, url):
+        repos = DummyRepos(url)
+        assert GithubRepos.is_valid_url(url)
+        assert repos.get_account_name() == 'rdbox-intec'
+        assert repos.get_repository_name() == 'rdbox_app_market'
+        assert repos.get_url_of_pages() == 'https://rdbox-intec.github.io/rdbox_app_market/bot-gen'
+
+    def test_invalid_url(self, settings):
+        assert not GithubRepos.is_valid_url('/tmp/bench/remote/rdbox-intec/rdbox_app_market.git')
+        assert not GithubRepos.is_valid_url('file:///tmp/bench/remote/rdbox-intec/rdbox_app_market')
+        with pytest.raises(InvalidURL):
+            ReferenceGithubRepos('ftp://example.com/charts.git', 'master', settings)
+
+
+@pytest.fixture
+def origin(tmp_path, monkeypatch):
+    for key in ['GIT_AUTHOR_NAME', 'GIT_COMMITTER_NAME']:
+        monkeypatch.setenv(key, 'rdbox-bot')
+    for key in ['GIT_AUTHOR_EMAIL', 'GIT_COMMITTER_EMAIL']:
+        monkeypatch.setenv(key, 'info-rdbox@intec.co.jp')
+    work = Repo.init(str(tmp_path / 'work'), initial_branch='master')
+    commit_file(work, 'README.md', '# master\n')
+    work.git.checkout('-b', 'gh-pages')
+    commit_file(work, 'index.yaml', 'apiVersion: v1\n')
+    return Repo.clone_from(work.working_tree_dir, str(tmp_path / 'rdbox-intec' / 'rdbox_app_market.git'), bare=True)
+
+
+def commit_file(repo, path, text):
+    with open(os.path.join(repo.working_tree_dir, path), 'w') as file:
+        file.write(text)
+    repo.git.add('.')
+    return repo.index.commit('update').hexsha
+
+
+class WorktreeRepos(GithubRepos):
+    def __init__(self, origin, branch, tmp_path):
+        self.url = 'file://' + origin.git_dir
+        self.branch = branch
+        self.specific_dir_from_top = ''
+        self.repo_dir = str(tmp_path / 'rdbox' / branch)
+        self.repo = WorktreeStore.add_worktree(self.url, branch, str(tmp_path / 'store.git'), self.repo_dir)
+
+
+class TestPushAtomically(object):
+    def test_push(self, tmp_path, origin):
+        master = WorktreeRepos(origin, 'master', tmp_path)
+        ghpage = WorktreeRepos(origin, 'gh-pages', tmp_path)
+        hexsha_master = commit_file(master.repo, 'README.md', '# updated\n')
+        hexsha_ghpage = commit_file(ghpage.repo, 'index.yaml', 'apiVersion: v1\nentries: {}\n')
+        result = GithubRepos.push_atomically([ghpage, master], retries=0, backoff=0)
+        assert result.is_success()
+        assert result.get_attempts() == 1
+        assert origin.commit('master').hexsha == hexsha_master
+        assert origin.commit('gh-pages').hexsha == hexsha_ghpage
+
+    def test_rebase_on_reject(self, tmp_path, origin):
+        master = WorktreeRepos(origin, 'master', tmp_path)
+        ghpage = WorktreeRepos(origin, 'gh-pages', tmp_path)
+        commit_file(master.repo, 'bot-gen.txt', 'charts\n')
+        commit_file(ghpage.repo, 'index.yaml', 'apiVersion: v1\nentries: {}\n')
+        # Somebody else pushed to master meanwhile.
+        other = Repo.clone_from(origin.git_dir, str(tmp_path / 'other'), branch='master')
+        hexsha_other = commit_file(other, 'README.md', '# by other\n')
+        other.git.push('origin', 'master')
+        result = GithubRepos.push_atomically([ghpage, master], retries=2, backoff=0)
+        assert result.is_success()
+        assert result.get_attempts() == 2
+        assert origin.commit('master').parents[0].hexsha == hexsha_other
+        assert origin.git.show('master:bot-gen.txt') == 'charts'
+
+    def test_conflict(self, tmp_path, origin):
+        master = WorktreeRepos(origin, 'master', tmp_path)
+        ghpage = WorktreeRepos(origin, 'gh-pages', tmp_path)
+        hexsha_ghpage = origin.commit('gh-pages').hexsha
+        commit_file(master.repo, 'README.md', '# by bot\n')
+        commit_file(ghpage.repo, 'index.yaml', 'apiVersion: v1\nentries: {}\n')
+        other = Repo.clone_from(origin.git_dir, str(tmp_path / 'other'), branch='master')
+        hexsha_other = commit_file(other, 'README.md', '# by other\n')
+        other.git.push('origin', 'master')
+        result = GithubRepos.push_atomically([ghpage, master], retries=2, backoff=0)
+        assert not result.is_success()
+        # Neither branch is updated.
+        assert origin.commit('master').hexsha == hexsha_other
+        assert origin.commit('gh-pages').hexsha == hexsha_ghpage
+        assert master.repo.git.status('--porcelain') == ''
+
+    def test_no_retry_on_other_errors(self, mocker, tmp_path, origin):
+        master = WorktreeRepos(origin, 'master', tmp_path)
+        ghpage = WorktreeRepos(origin, 'gh-pages', tmp_path)
+        commit_file(master.repo, 'README.md', '# by bot\n')
+        # like an authentication failure
+        master.repo.git.remote('set-url', 'origin', 'file://' + str(tmp_path / 'missing.git'))
+        sleep = mocker.patch('rdbox_app_market.github.time.sleep')
+        rebase = mocker.spy(WorktreeRepos, 'rebase_onto_remote')
+        result = GithubRepos.push_atomically([ghpage, master], retries=2, backoff=1)
+        assert not result.is_success()
+        assert result.get_attempts() == 1
+        assert 'missing.git' in result.get_message()
+        sleep.assert_not_called()
+        rebase.assert_not_called()
+
+    @pytest.mark.parametrize('output, expected', [
+        ('To origin\n!\trefs/heads/master:refs/heads/master\t[rejected] (fetch first)\nDone', True),
+        ('To origin\n!\trefs/heads/master:refs/heads/master\t[rejected] (non-fast-forward)\nDone', True),
+        ('To origin\n!\trefs/heads/master:refs/heads/master\t[remote rejected] (pre-receive hook declined)\nDone', False),
+        ('', False),
+    ])
+    def test_is_rejected_push(self, output, expected):
+        assert GithubRepos.is_rejected_push(output) is expected
+
+
+class TestReferenceGithubRepos(object):
+    def test_mirror_settings(self, tmp_path, origin, settings):
+        settings = settings._replace(git=settings.git._replace(mirror_dir=str(tmp_path / 'mirrors'), sparse_checkout=False))
+        repos = ReferenceGithubRepos('file://' + origin.git_dir, 'master', settings, specific_dir_from_top='stable')
+        try:
+            assert repos.get_dirpath() == str(tmp_path / 'mirrors' / 'rdbox-intec' / 'rdbox_app_market' / 'master')
+            assert os.path.isfile(os.path.join(repos.get_dirpath(), 'README.md'))
+            assert repos.get_sparse_dirs() == []
+            repos.settings = settings._replace(git=settings.git._replace(sparse_checkout=True))
+            assert repos.get_sparse_dirs() == ['stable']
+        finally:
+            repos.close()
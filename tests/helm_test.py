@@ -14,3 +14,19 @@ def test_init(mocker):
     mocker.patch('platform.system').return_value = 'Windows'
     helm_command = HelmCommand()
     assert helm_command.helm == 'helm'
+
+    helm_command = HelmCommand('/opt/helm/bin/helm')
+    assert helm_command.helm == '/opt/helm/bin/helm'
+
+
+def test_version(mocker):
+    run = mocker.patch('subprocess.run')
+    run.return_value.returncode = 0
+    run.return_value.stdout = 'v3.4.1+gc4e7485\n'
+    mocker.patch.object(HelmCommand, '_versions', {})
+    helm_command = HelmCommand('/opt/helm/bin/helm')
+    assert helm_command.version() == 'v3.4.1+gc4e7485'
+    assert HelmCommand('/opt/helm/bin/helm').version() == 'v3.4.1+gc4e7485'
+    assert run.call_count == 1
+    run.side_effect = OSError()
+    assert HelmCommand('/nonexistent/helm').version() == ''
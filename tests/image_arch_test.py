@@ -0,0 +1,434 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from multiprocessing import Pool
+
+import pytest
+import requests
+
+from rdbox_app_market.image_arch import ImageArch, ImageArchCache, DockerhubClient, ImageArchResolver
+from rdbox_app_market.image_arch import DockerhubTagsSource, RegistryV2Source, ImageArchSnapshot, ImageArchSnapshotMiss
+
+
+def dummy_response(mocker, status_code, architectures=(), headers=None):
+    response = mocker.Mock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.url = 'https://hub.docker.com/v2/repositories/bitnami/nginx/tags/1.19.2'
+    response.json.return_value = {'images': [{'architecture': architecture} for architecture in architectures]}
+    return response
+
+
+def dummy_client(mocker, retries=0):
+    client = DockerhubClient(4, 10, retries, 0)
+    client.session = mocker.Mock()
+    return client
+
+
+def put_and_get(args):
+    cache_dir, index = args
+    cache = ImageArchCache(cache_dir, 1, 1)
+    cache.put('bitnami/nginx', '1.19.2', ImageArch(True, ('amd64', 'arm64')))
+    return cache.get('bitnami/nginx', '1.19.2')
+
+
+class RegistryStandin(object):
+    """A local registry with the registry v2 API and the anonymous token flow.
+
+    - multiarch/app:1.0 is a manifest list (amd64, arm64 and an attestation)
+    - single/app:1.0 is a manifest of an amd64 image (The architecture is in the config blob)
+    """
+
+    MANIFESTS = {
+        ('multiarch/app', '1.0'): ('application/vnd.docker.distribution.manifest.list.v2+json', {'manifests': [
+            {'digest': 'sha256:1', 'platform': {'architecture': 'amd64', 'os': 'linux'}},
+            {'digest': 'sha256:2', 'platform': {'architecture': 'arm64', 'os': 'linux', 'variant': 'v8'}},
+            {'digest': 'sha256:3', 'platform': {'architecture': 'unknown', 'os': 'unknown'}}]}),
+        ('single/app', '1.0'): ('application/vnd.docker.distribution.manifest.v2+json', {'config': {'digest': 'sha256:c'}}),
+    }
+    BLOBS = {('single/app', 'sha256:c'): {'architecture': 'amd64', 'os': 'linux'}}
+
+    def __init__(self):
+        self.requests = []
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                standin.requests.append(self.path)
+                status, headers, body = standin.respond(urlparse(self.path), self.headers)
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def get_registry(self):
+        return '127.0.0.1:{port}'.format(port=self.server.server_address[1])
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def respond(self, url, headers):
+        if url.path == '/token':
+            scope = parse_qs(url.query)['scope'][0]
+            return 200, {}, json.dumps({'token': 'token:' + scope, 'expires_in': 300}).encode()
+        parts = url.path.strip('/').split('/')
+        repository, kind, reference = '/'.join(parts[1:-2]), parts[-2], parts[-1]
+        if headers.get('Authorization') != 'Bearer token:repository:{repository}:pull'.format(repository=repository):
+            challenge = 'Bearer realm="http://{registry}/token",service="standin",scope="repository:{repository}:pull"'.format(
+                registry=self.get_registry(), repository=repository)
+            return 401, {'WWW-Authenticate': challenge}, b'{}'
+        if kind == 'manifests' and (repository, reference) in self.MANIFESTS:
+            media_type, manifest = self.MANIFESTS[(repository, reference)]
+            return 200, {'Content-Type': media_type}, json.dumps(dict(manifest, mediaType=media_type)).encode()
+        if kind == 'blobs' and (repository, reference) in self.BLOBS:
+            return 200, {}, json.dumps(self.BLOBS[(repository, reference)]).encode()
+        return 404, {}, b'{}'
+
+
+@pytest.fixture
+def registry():
+    standin = RegistryStandin()
+    yield standin
+    standin.close()
+
+
+class TestImageArch(object):
+    def test_has_arm(self):
+        assert ImageArch(True, ('amd64', 'arm64')).has_arm() is True
+        assert ImageArch(True, ('amd64', 'arm')).has_arm() is True
+        assert ImageArch(True, ('amd64',)).has_arm() is False
+        assert ImageArch.NOT_FOUND.has_arm() is False
+
+
+class TestImageArchCache(object):
+    def test_put_and_get(self, tmp_path):
+        cache = ImageArchCache(str(tmp_path), 24, 1)
+        assert cache.get('bitnami/nginx', '1.19.2') is None
+        cache.put('bitnami/nginx', '1.19.2', ImageArch(True, ('amd64', 'arm64')))
+        cache.put('bitnami/nginx', 'none', ImageArch.NOT_FOUND)
+        assert cache.get('bitnami/nginx', '1.19.2') == ImageArch(True, ('amd64', 'arm64'))
+        assert cache.get('bitnami/nginx', 'none') == ImageArch.NOT_FOUND
+        assert ImageArchCache(str(tmp_path), 24, 1).get('bitnami/nginx', '1.19.2') == ImageArch(True, ('amd64', 'arm64'))
+        assert cache.get('bitnami/nginx', '1.19.3') is None
+        assert [name for name in os.listdir(str(tmp_path)) if not os.path.isdir(os.path.join(str(tmp_path), name))] == []
+
+    def test_ttl(self, tmp_path, mocker):
+        cache = ImageArchCache(str(tmp_path), 24, 1)
+        cache.put('bitnami/nginx', '1.19.2', ImageArch(True, ('amd64',)))
+        cache.put('bitnami/nginx', 'none', ImageArch.NOT_FOUND)
+        now = time.time()
+        mocker.patch('rdbox_app_market.image_arch.time.time').return_value = now + 2 * 60 * 60
+        assert cache.get('bitnami/nginx', '1.19.2') == ImageArch(True, ('amd64',))
+        assert cache.get('bitnami/nginx', 'none') is None
+        mocker.patch('rdbox_app_market.image_arch.time.time').return_value = now + 25 * 60 * 60
+        assert cache.get('bitnami/nginx', '1.19.2') is None
+
+    def test_disabled(self, tmp_path):
+        cache = ImageArchCache(str(tmp_path), 24, 0)
+        cache.put('bitnami/nginx', 'none', ImageArch.NOT_FOUND)
+        assert cache.get('bitnami/nginx', 'none') is None
+        cache = ImageArchCache(str(tmp_path / 'disabled'), 0, 0)
+        cache.put('bitnami/nginx', '1.19.2', ImageArch(True, ('amd64',)))
+        assert cache.get('bitnami/nginx', '1.19.2') is None
+        assert not os.path.exists(str(tmp_path / 'disabled'))
+
+    def test_broken_entry(self, tmp_path):
+        cache = ImageArchCache(str(tmp_path), 24, 1)
+        cache.put('bitnami/nginx', '1.19.2', ImageArch(True, ('amd64',)))
+        for root, _, files in os.walk(str(tmp_path)):
+            for name in files:
+                with open(os.path.join(root, name), 'w') as file:
+                    file.write('{"repository": ')
+        assert cache.get('bitnami/nginx', '1.19.2') is None
+
+    def test_evict(self, tmp_path):
+        cache = ImageArchCache(str(tmp_path), 1, 1)
+        cache.put('bitnami/nginx', '1.19.2', ImageArch(True, ('amd64',)))
+        cache.put('bitnami/redis', '6.0.8', ImageArch(True, ('amd64',)))
+        assert cache.evict() == 0
+        for root, _, files in os.walk(str(tmp_path)):
+            for name in files:
+                os.utime(os.path.join(root, name), (0, 0))
+        assert cache.evict() == 2
+        assert cache.get('bitnami/nginx', '1.19.2') is None
+
+    def test_concurrent(self, tmp_path):
+        with Pool(4) as pool:
+            results = pool.map(put_and_get, [(str(tmp_path), index) for index in range(32)])
+        assert results == [ImageArch(True, ('amd64', 'arm64'))] * 32
+
+
+class TestImageArchResolver(object):
+    def test_resolve(self, tmp_path, mocker):
+        client = dummy_client(mocker)
+        get = client.session.get
+        get.return_value = dummy_response(mocker, 200, ['amd64', 'arm64'])
+        resolver = ImageArchResolver('https://hub.docker.com', ImageArchCache(str(tmp_path), 24, 1), client)
+        assert resolver.resolve('bitnami/nginx', '1.19.2') == ImageArch(True, ('amd64', 'arm64'))
+        assert resolver.resolve('bitnami/nginx', '1.19.2') == ImageArch(True, ('amd64', 'arm64'))
+        get.assert_called_once_with('https://hub.docker.com/v2/repositories/bitnami/nginx/tags/1.19.2', headers=None, timeout=10)
+        # Another process (or run)
+        resolver = ImageArchResolver('https://hub.docker.com', ImageArchCache(str(tmp_path), 24, 1), client)
+        assert resolver.resolve('bitnami/nginx', '1.19.2').has_arm() is True
+        assert get.call_count == 1
+
+    def test_resolve_official_image(self, mocker):
+        client = dummy_client(mocker)
+        get = client.session.get
+        get.return_value = dummy_response(mocker, 200, ['amd64'])
+        resolver = ImageArchResolver('https://hub.docker.com', None, client)
+        assert resolver.resolve('nginx', 1.19).has_arm() is False
+        get.assert_called_once_with('https://hub.docker.com/v2/repositories/library/nginx/tags/1.19', headers=None, timeout=10)
+
+    def test_resolve_not_found(self, tmp_path, mocker):
+        client = dummy_client(mocker)
+        get = client.session.get
+        get.return_value = dummy_response(mocker, 404)
+        cache = ImageArchCache(str(tmp_path), 24, 1)
+        assert ImageArchResolver('https://hub.docker.com', cache, client).resolve('bitnami/nginx', None) == ImageArch.NOT_FOUND
+        assert cache.get('bitnami/nginx', 'None') == ImageArch.NOT_FOUND
+        assert ImageArchResolver('https://hub.docker.com', cache, client).resolve('bitnami/nginx', None) == ImageArch.NOT_FOUND
+        assert get.call_count == 1
+
+    def test_resolve_error(self, tmp_path, mocker):
+        client = dummy_client(mocker)
+        get = client.session.get
+        get.return_value = dummy_response(mocker, 503)
+        cache = ImageArchCache(str(tmp_path), 24, 1)
+        resolver = ImageArchResolver('https://hub.docker.com', cache, client)
+        assert resolver.resolve('bitnami/nginx', '1.19.2') == ImageArch.NOT_FOUND
+        get.return_value = dummy_response(mocker, 200, ['arm64'])
+        assert resolver.resolve('bitnami/nginx', '1.19.2').has_arm() is True
+        assert get.call_count == 2
+
+    def test_split_registry(self):
+        assert ImageArchResolver.split_registry('nginx') == ('docker.io', 'library/nginx')
+        assert ImageArchResolver.split_registry('bitnami/nginx') == ('docker.io', 'bitnami/nginx')
+        assert ImageArchResolver.split_registry('docker.io/nginx') == ('docker.io', 'library/nginx')
+        assert ImageArchResolver.split_registry('quay.io/bitnami/nginx') == ('quay.io', 'bitnami/nginx')
+        assert ImageArchResolver.split_registry('localhost:5000/app') == ('localhost:5000', 'app')
+        assert ImageArchResolver.normalize_repository('index.docker.io/bitnami/nginx') == 'bitnami/nginx'
+        assert ImageArchResolver.normalize_repository('gcr.io/google-containers/pause') == 'gcr.io/google-containers/pause'
+
+    def test_supports(self, mocker):
+        resolver = ImageArchResolver('https://hub.docker.com', None, dummy_client(mocker))
+        assert resolver.supports('bitnami/nginx') is True
+        assert resolver.supports('quay.io/bitnami/nginx') is False
+        assert resolver.resolve('quay.io/bitnami/nginx', '1.0') == ImageArch.NOT_FOUND
+
+    def test_build_sources(self, settings):
+        client = DockerhubClient()
+        sources = ImageArchResolver.build_sources(settings, client)
+        assert [type(source) for source in sources] == [DockerhubTagsSource, RegistryV2Source]
+        assert [source.supports('docker.io') for source in sources] == [True, False]
+        assert [source.supports('quay.io') for source in sources] == [False, True]
+        settings = settings._replace(registry=settings.registry._replace(enabled=False, dockerhub_api='registry'))
+        sources = ImageArchResolver.build_sources(settings, client)
+        assert [type(source) for source in sources] == [RegistryV2Source]
+        assert sources[0].supports('docker.io') is True
+        assert sources[0].supports('quay.io') is False
+
+    def test_resolve_on_registry(self, registry, tmp_path):
+        client = DockerhubClient(4, 10)
+        resolver = ImageArchResolver('https://hub.docker.com', ImageArchCache(str(tmp_path), 24, 1), client,
+                                     [RegistryV2Source(client, plain_http_hosts=['127.0.0.1'], dockerhub=False)])
+        repo_uri = registry.get_registry() + '/multiarch/app'
+        assert resolver.resolve(repo_uri, 1.0) == ImageArch(True, ('amd64', 'arm64'))
+        # Through the cache
+        resolver = ImageArchResolver('https://hub.docker.com', ImageArchCache(str(tmp_path), 24, 1), client, resolver.get_sources())
+        assert resolver.resolve(repo_uri, 1.0).has_arm() is True
+        assert resolver.resolve(registry.get_registry() + '/single/app', '1.0') == ImageArch(True, ('amd64',))
+        assert resolver.resolve(registry.get_registry() + '/single/app', '2.0') == ImageArch.NOT_FOUND
+        assert [path.split('?')[0] for path in registry.requests] == [
+            '/v2/multiarch/app/manifests/1.0', '/token', '/v2/multiarch/app/manifests/1.0',
+            '/v2/single/app/manifests/1.0', '/token', '/v2/single/app/manifests/1.0', '/v2/single/app/blobs/sha256:c',
+            # The token is reused.
+            '/v2/single/app/manifests/2.0']
+
+    def test_get_instance(self, settings):
+        resolver = ImageArchResolver.get_instance(settings)
+        assert ImageArchResolver.get_instance(settings) is resolver
+        assert resolver.get_cache().get_cache_dir() == '/tmp/.rdbox_app_market.cache/arch'
+        assert resolver.client.timeout == 10.0
+        assert resolver.client.retries == 3
+        other = settings._replace(dockerhub=settings.dockerhub._replace(url='http://127.0.0.1:8080'))
+        other_resolver = ImageArchResolver.get_instance(other)
+        assert other_resolver is not resolver
+        # forked worker
+        ImageArchResolver._instance_pid = -1
+        assert ImageArchResolver.get_instance(other) is not other_resolver
+
+    def test_prefetch(self, mocker):
+        client = dummy_client(mocker)
+        client.session.get.side_effect = lambda url, headers, timeout: dummy_response(mocker, 200, ['arm64'] if 'redis' in url else ['amd64'])
+        resolver = ImageArchResolver('https://hub.docker.com', None, client)
+        image_archs = resolver.prefetch({'nginx': [('bitnami/nginx', '1.19.2'), ('bitnami/redis', '6.0.8')],
+                                         'redis': [('bitnami/redis', '6.0.8')],
+                                         'empty': []}, 4)
+        assert image_archs == {'nginx': {('bitnami/nginx', '1.19.2'): ImageArch(True, ('amd64',)), ('bitnami/redis', '6.0.8'): ImageArch(True, ('arm64',))},
+                               'redis': {('bitnami/redis', '6.0.8'): ImageArch(True, ('arm64',))},
+                               'empty': {}}
+        assert client.session.get.call_count == 2
+        assert resolver.resolve('bitnami/redis', '6.0.8').has_arm() is True
+        assert client.session.get.call_count == 2
+
+    def test_prefetch_error(self, mocker):
+        client = dummy_client(mocker)
+        client.session.get.side_effect = [dummy_response(mocker, 503), requests.ConnectionError()]
+        resolver = ImageArchResolver('https://hub.docker.com', None, client)
+        image_archs = resolver.prefetch({'nginx': [('bitnami/nginx', '1.19.2'), ('bitnami/redis', '6.0.8')]}, 1)
+        # Left to the conversion
+        assert image_archs == {'nginx': {}}
+
+    def test_preload(self, mocker):
+        client = dummy_client(mocker)
+        resolver = ImageArchResolver('https://hub.docker.com', None, client)
+        resolver.preload({('library/nginx', '1.19'): ImageArch(True, ('arm64',))})
+        assert resolver.resolve('nginx', 1.19).has_arm() is True
+        assert client.session.get.call_count == 0
+
+
+class TestImageArchSnapshot(object):
+    IMAGE_ARCHS = {('library/nginx', '1.19'): ImageArch(True, ('amd64', 'arm64')),
+                   ('bitnami/redis', '6.0.8'): ImageArch(True, ('amd64',)),
+                   ('quay.io/bitnami/none', '1.0'): ImageArch.NOT_FOUND}
+
+    def test_dump_and_load(self, tmp_path):
+        ImageArchSnapshot(self.IMAGE_ARCHS).dump(str(tmp_path / 'snapshot.json'))
+        snapshot = ImageArchSnapshot.load(str(tmp_path / 'snapshot.json'), ImageArchSnapshot.MISS_FAIL)
+        assert len(snapshot) == 3
+        assert snapshot.get('library/nginx', '1.19') == ImageArch(True, ('amd64', 'arm64'))
+        assert snapshot.get('quay.io/bitnami/none', '1.0') == ImageArch.NOT_FOUND
+        assert snapshot.get('library/nginx', '1.20') is None
+        assert snapshot.get_miss_policy() == ImageArchSnapshot.MISS_FAIL
+        # Deterministic
+        ImageArchSnapshot(dict(reversed(list(self.IMAGE_ARCHS.items())))).dump(str(tmp_path / 'reversed.json'))
+        assert (tmp_path / 'snapshot.json').read_text() == (tmp_path / 'reversed.json').read_text()
+
+    def test_load_invalid(self, tmp_path):
+        (tmp_path / 'snapshot.json').write_text('{"images": []}')
+        with pytest.raises(ValueError):
+            ImageArchSnapshot.load(str(tmp_path / 'snapshot.json'))
+
+    def test_from_settings(self, tmp_path, settings):
+        assert ImageArchSnapshot.from_settings(settings) is None
+        ImageArchSnapshot(self.IMAGE_ARCHS).dump(str(tmp_path / 'snapshot.json'))
+        settings = settings._replace(registry=settings.registry._replace(snapshot=str(tmp_path / 'snapshot.json'), snapshot_miss='network'))
+        snapshot = ImageArchSnapshot.from_settings(settings)
+        assert len(snapshot) == 3
+        assert snapshot.get_miss_policy() == ImageArchSnapshot.MISS_NETWORK
+        assert ImageArchResolver.get_instance(settings).resolve('nginx', 1.19).has_arm() is True
+
+    @pytest.mark.parametrize('miss_policy', [ImageArchSnapshot.MISS_AMD64, ImageArchSnapshot.MISS_FAIL, ImageArchSnapshot.MISS_NETWORK])
+    def test_resolve(self, mocker, tmp_path, miss_policy):
+        client = dummy_client(mocker)
+        client.session.get.return_value = dummy_response(mocker, 200, ['arm64'])
+        resolver = ImageArchResolver('https://hub.docker.com', ImageArchCache(str(tmp_path), 24, 1), client, None,
+                                     ImageArchSnapshot(self.IMAGE_ARCHS, miss_policy))
+        assert resolver.resolve('nginx', 1.19) == ImageArch(True, ('amd64', 'arm64'))
+        assert resolver.resolve('bitnami/redis', '6.0.8').has_arm() is False
+        if miss_policy == ImageArchSnapshot.MISS_AMD64:
+            assert resolver.resolve('bitnami/nginx', '1.19.2') == ImageArch.NOT_FOUND
+        elif miss_policy == ImageArchSnapshot.MISS_FAIL:
+            with pytest.raises(ImageArchSnapshotMiss):
+                resolver.resolve('bitnami/nginx', '1.19.2')
+        else:
+            assert resolver.resolve('bitnami/nginx', '1.19.2').has_arm() is True
+        assert client.session.get.call_count == (1 if miss_policy == ImageArchSnapshot.MISS_NETWORK else 0)
+        # The misses are not exported.
+        resolver.export_snapshot(str(tmp_path / 'exported.json'))
+        exported = ImageArchSnapshot.load(str(tmp_path / 'exported.json'))
+        assert len(exported) == (3 if miss_policy == ImageArchSnapshot.MISS_NETWORK else 2)
+
+    def test_prefetch_with_miss(self, mocker):
+        client = dummy_client(mocker)
+        resolver = ImageArchResolver('https://hub.docker.com', None, client, None, ImageArchSnapshot(self.IMAGE_ARCHS, ImageArchSnapshot.MISS_FAIL))
+        image_archs = resolver.prefetch({'nginx': [('nginx', 1.19), ('bitnami/nginx', '1.19.2')]}, 2)
+        assert image_archs == {'nginx': {('library/nginx', '1.19'): ImageArch(True, ('amd64', 'arm64'))}}
+        assert client.session.get.call_count == 0
+
+
+class TestDockerhubClient(object):
+    def test_get(self, mocker):
+        client = dummy_client(mocker, 3)
+        client.session.get.return_value = dummy_response(mocker, 200, ['amd64'])
+        assert client.get('https://hub.docker.com/v2/repositories/bitnami/nginx/tags/1.19.2').status_code == 200
+        client.session.get.assert_called_once_with('https://hub.docker.com/v2/repositories/bitnami/nginx/tags/1.19.2', headers=None, timeout=10)
+
+    def test_retry(self, mocker):
+        sleep = mocker.patch('rdbox_app_market.image_arch.time.sleep')
+        client = DockerhubClient(4, 10, 3, 1)
+        client.session = mocker.Mock()
+        client.session.get.side_effect = [requests.Timeout(), dummy_response(mocker, 503), dummy_response(mocker, 404)]
+        assert client.get('https://hub.docker.com/v2/repositories/bitnami/nginx/tags/none').status_code == 404
+        assert client.session.get.call_count == 3
+        assert [call[0][0] for call in sleep.call_args_list] == [1, 2]
+
+    def test_retry_exhausted(self, mocker):
+        mocker.patch('rdbox_app_market.image_arch.time.sleep')
+        client = dummy_client(mocker, 2)
+        client.session.get.side_effect = requests.ConnectionError()
+        with pytest.raises(requests.ConnectionError):
+            client.get('https://hub.docker.com/v2/repositories/bitnami/nginx/tags/1.19.2')
+        assert client.session.get.call_count == 3
+        client.session.get.side_effect = None
+        client.session.get.return_value = dummy_response(mocker, 500)
+        assert client.get('https://hub.docker.com/v2/repositories/bitnami/nginx/tags/1.19.2').status_code == 500
+
+    def test_retry_after(self, mocker):
+        now = time.time()
+        mocker.patch('rdbox_app_market.image_arch.time.time').return_value = now
+        sleep = mocker.patch('rdbox_app_market.image_arch.time.sleep')
+        client = dummy_client(mocker, 1)
+        client.session.get.side_effect = [dummy_response(mocker, 429, headers={'Retry-After': '30'}), dummy_response(mocker, 200, ['amd64'])]
+        assert client.get('https://hub.docker.com/v2/repositories/bitnami/nginx/tags/1.19.2').status_code == 200
+        assert [call[0][0] for call in sleep.call_args_list] == [30]
+
+    def test_rate_limit(self, mocker):
+        now = time.time()
+        mocker.patch('rdbox_app_market.image_arch.time.time').return_value = now
+        sleep = mocker.patch('rdbox_app_market.image_arch.time.sleep')
+        client = dummy_client(mocker)
+        client.session.get.return_value = dummy_response(mocker, 200, ['amd64'], {'X-RateLimit-Remaining': '0;w=21600', 'X-RateLimit-Reset': str(now + 60)})
+        client.get('https://hub.docker.com/v2/repositories/bitnami/nginx/tags/1.19.2')
+        assert sleep.call_count == 0
+        # The next request waits for the reset.
+        client.get('https://hub.docker.com/v2/repositories/bitnami/redis/tags/6.0.8')
+        assert [call[0][0] for call in sleep.call_args_list] == [60]
+
+
+class TestRegistryV2Source(object):
+    def test_get_base_url(self):
+        source = RegistryV2Source(DockerhubClient(), 'https://registry-1.docker.io', ['localhost'])
+        assert source.get_base_url('docker.io') == 'https://registry-1.docker.io'
+        assert source.get_base_url('quay.io') == 'https://quay.io'
+        assert source.get_base_url('localhost:5000') == 'http://localhost:5000'
+
+    def test_fetch_error(self, mocker):
+        client = dummy_client(mocker)
+        client.session.get.return_value = dummy_response(mocker, 500)
+        assert RegistryV2Source(client).fetch('quay.io', 'bitnami/nginx', '1.19.2') is None
+        client.session.get.return_value = dummy_response(mocker, 401)
+        assert RegistryV2Source(client).fetch('quay.io', 'bitnami/nginx', '1.19.2') == ImageArch.NOT_FOUND
+
+    def test_fetch_schema1(self, mocker):
+        client = dummy_client(mocker)
+        response = dummy_response(mocker, 200)
+        response.json.return_value = {'schemaVersion': 1, 'architecture': 'arm'}
+        client.session.get.return_value = response
+        assert RegistryV2Source(client).fetch('quay.io', 'bitnami/nginx', '1.19.2') == ImageArch(True, ('arm',))
+        assert client.session.get.call_args[1]['headers']['Accept'].startswith('application/vnd.docker.distribution.manifest.list.v2+json')
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+from rdbox_app_market.github import PushResult
+from rdbox_app_market.app_market import ChartInSpecificDirPackError
+from rdbox_app_market.image_arch import ImageArch, ImageArchResolver, ImageArchSnapshot
+from rdbox_app_market.mission_control import MissionControl, VendorMissionControl, RDBOXMissionControl
+
+
+class DummyRdboxRepos(object):
+    def __init__(self, branch, specific_dir_from_top):
+        self.branch = branch
+        self.specific_dir_from_top = specific_dir_from_top
+        self.commits = []
+
+    def get_view(self, specific_dir_from_top):
+        view = DummyRdboxRepos(self.branch, specific_dir_from_top)
+        view.commits = self.commits
+        return view
+
+    def commit(self):
+        self.commits.append(self.branch)
+
+
+class TestMissionControl(object):
+    def test_launch_all(self, mocker, tmp_path, settings):
+        mocker.patch('rdbox_app_market.github.GithubRepos.TOP_DIR', str(tmp_path / 'top'))
+        acquisition_class = mocker.patch('rdbox_app_market.mission_control.RepositoryAcquisition')
+        acquisition = acquisition_class.from_settings.return_value
+        dst = {'master': DummyRdboxRepos('master', 'bot-gen'), 'gh-pages': DummyRdboxRepos('gh-pages', 'bot-gen')}
+
+        def submit(repos_class, url, branch, **kwargs):
+            task = mocker.Mock()
+            task.result.return_value = dst[branch] if url == MissionControl.DST_URL else object()
+            return task
+        acquisition.submit.side_effect = submit
+        collector = mocker.patch('rdbox_app_market.mission_control.Collector')
+        collector.return_value.work.return_value = (None, None)
+        publisher = mocker.patch('rdbox_app_market.mission_control.Publisher')
+        pool = mocker.patch('rdbox_app_market.mission_control.Pool')
+        mocker.patch('rdbox_app_market.mission_control.ChartInSpecificDir.get_number_of_processes').return_value = 1
+        push = mocker.patch('rdbox_app_market.mission_control.GithubRepos.push_atomically')
+        push.return_value = PushResult(['gh-pages', 'master'], True, 1)
+        assert MissionControl.launch_all([VendorMissionControl, RDBOXMissionControl], True, settings, use_cache=False, use_change_plan=False)
+        # one pool, one commit and push per branch
+        assert pool.call_count == 1
+        assert [call[0][2].specific_dir_from_top for call in publisher.call_args_list] == ['bot-gen', 'manually']
+        assert all(call[0][6] is pool.return_value for call in publisher.call_args_list)
+        assert all(call[0][3] is settings for call in publisher.call_args_list)
+        assert all(call[0][2] is settings for call in collector.call_args_list)
+        acquisition_class.from_settings.assert_called_with(settings)
+        assert all(call[1]['settings'] is settings for call in acquisition.submit.call_args_list if call[0][1] != MissionControl.DST_URL)
+        assert [call[0][1].specific_dir_from_top for call in collector.call_args_list] == ['bot-gen', 'manually']
+        publisher.return_value.work.assert_called_with(True, exec_commit=False)
+        assert dst['master'].commits == ['master']
+        assert dst['gh-pages'].commits == ['gh-pages']
+        assert [repos.branch for repos in push.call_args[0][0]] == ['gh-pages', 'master']
+        acquisition.close.assert_called_once()
+        assert all(call[0][4] is None for call in collector.call_args_list)
+        # The features of each mission are dumped to their own file.
+        MissionControl.launch_all([VendorMissionControl, RDBOXMissionControl], True, settings, use_cache=False, use_change_plan=False,
+                                  dump_features=str(tmp_path / 'features.json'))
+        assert [call[0][4] for call in collector.call_args_list[-2:]] == [str(tmp_path / 'features.bot-gen.json'), str(tmp_path / 'features.manually.json')]
+        MissionControl.launch_all([VendorMissionControl], True, settings, use_cache=False, use_change_plan=False, dump_features=str(tmp_path / 'features.json'))
+        assert collector.call_args[0][4] == str(tmp_path / 'features.json')
+        # A failed push fails the run.
+        push.return_value = PushResult(['gh-pages', 'master'], False, 4, 'rejected')
+        assert not MissionControl.launch_all([VendorMissionControl], True, settings, use_cache=False, use_change_plan=False)
+        # A failed pack is neither committed nor pushed.
+        dst['master'].commits.clear()
+        dst['gh-pages'].commits.clear()
+        push.reset_mock()
+        publisher.return_value.work.side_effect = ChartInSpecificDirPackError('index.yaml')
+        assert not MissionControl.launch_all([VendorMissionControl, RDBOXMissionControl], True, settings, use_cache=False, use_change_plan=False)
+        assert dst['master'].commits == []
+        assert dst['gh-pages'].commits == []
+        push.assert_not_called()
+
+    def test_export_arch_snapshot(self, tmp_path, settings):
+        ImageArchResolver.get_instance(settings).preload({('bitnami/nginx', '1.19.2'): ImageArch(True, ('amd64', 'arm64'))})
+        MissionControl.export_arch_snapshot(str(tmp_path / 'snapshot.json'), settings)
+        snapshot = ImageArchSnapshot.load(str(tmp_path / 'snapshot.json'))
+        assert snapshot.get('bitnami/nginx', '1.19.2') == ImageArch(True, ('amd64', 'arm64'))
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+import os
+import pickle
+import configparser
+import pytest
+
+from rdbox_app_market.settings import Settings, SettingsError
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'rdbox_app_market.conf')
+
+
+@pytest.fixture
+def config(mocker):
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE)
+    mocker.patch('rdbox_app_market.config.get', side_effect=config.get)
+    mocker.patch('rdbox_app_market.config.getboolean', side_effect=config.getboolean)
+    return config
+
+
+class TestSettings(object):
+    def test_from_config(self, config, settings):
+        loaded = Settings.from_config()
+        assert loaded == settings
+        assert loaded.kubernetes.common_domain == 'rdbox.lan'
+        assert loaded.rdbox.maximum_cpu_usage == 0.8
+        assert loaded.git.sparse_checkout is True
+        assert loaded.git.max_concurrent_acquisitions == 4
+        assert loaded.git.push_backoff == 2.0
+
+    def test_immutable(self, settings):
+        with pytest.raises(AttributeError):
+            settings.kubernetes.common_domain = 'example.com'
+        assert pickle.loads(pickle.dumps(settings)) == settings
+
+    @pytest.mark.parametrize('section, key, value', [
+        ('rdbox', 'maximum_cpu_usage', 'many'),
+        ('git', 'sparse_checkout', 'maybe'),
+        ('git', 'push_retries', '1.5'),
+        ('rdbox', 'maximum_cpu_usage', '0'),
+        ('rdbox', 'log_level', 'VERBOSE'),
+        ('kubernetes', 'common_domain', ''),
+        ('dockerhub', 'url', 'hub.docker.com'),
+        ('dockerhub', 'max_concurrent_requests', '0'),
+        ('dockerhub', 'backoff', '-1'),
+        ('registry', 'dockerhub_api', 'v1'),
+        ('registry', 'snapshot_miss', 'ignore'),
+        ('registry', 'snapshot', '/nonexistent/arch_snapshot.json'),
+        ('git', 'push_retries', '-1'),
+        ('cache', 'arch_negative_ttl_hours', '-1'),
+    ])
+    def test_invalid_value(self, config, section, key, value):
+        config.set(section, key, value)
+        with pytest.raises(SettingsError, match=r'\[{section}\] {key}'.format(section=section, key=key)):
+            Settings.from_config()
+
+    def test_missing_value(self, config):
+        config.remove_option('cache', 'conversion_dir')
+        with pytest.raises(SettingsError, match=r'\[cache\] conversion_dir'):
+            Settings.from_config()
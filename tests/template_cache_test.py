@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+import os
+
+from rdbox_app_market.template_cache import TemplateValidation, TemplateValidationCache
+
+
+def make_chart(module_dir_path, values_text):
+    os.makedirs(os.path.join(module_dir_path, 'templates'), exist_ok=True)
+    with open(os.path.join(module_dir_path, 'values.yaml'), 'w') as file:
+        file.write(values_text)
+    with open(os.path.join(module_dir_path, 'templates', 'deployment.yaml'), 'w') as file:
+        file.write('kind: Deployment\n')
+    return module_dir_path
+
+
+class TestTemplateValidationCache(object):
+    def test_build_key(self, tmp_path):
+        cache = TemplateValidationCache(str(tmp_path / 'cache'), 1)
+        module_dir_path = make_chart(str(tmp_path / 'redis'), 'nodeSelector: {}\n')
+        key = cache.build_key(module_dir_path, ['a.b'], 'v3.4.1', 'isolations')
+        assert key == cache.build_key(module_dir_path, ['a.b'], 'v3.4.1', 'isolations')
+        assert key != cache.build_key(module_dir_path, ['a.c'], 'v3.4.1', 'isolations')
+        assert key != cache.build_key(module_dir_path, ['a.b'], 'v3.5.0', 'isolations')
+        assert key != cache.build_key(module_dir_path, ['a.b'], 'v3.4.1', 'dependons')
+        make_chart(module_dir_path, 'nodeSelector:\n  beta.kubernetes.io/os: linux\n')
+        assert key != cache.build_key(module_dir_path, ['a.b'], 'v3.4.1', 'isolations')
+        os.makedirs(str(tmp_path / 'empty'))
+        assert cache.build_key(str(tmp_path / 'empty'), [], 'v3.4.1', 'isolations') is None
+        assert TemplateValidationCache(str(tmp_path / 'cache'), 0).build_key(module_dir_path, [], 'v3.4.1', 'isolations') is None
+
+    def test_put_and_get(self, tmp_path):
+        cache = TemplateValidationCache(str(tmp_path / 'cache'), 1)
+        key = cache.build_key(make_chart(str(tmp_path / 'redis'), 'nodeSelector: {}\n'), [], 'v3.4.1', 'isolations')
+        assert cache.get(key) is None
+        cache.put(key, TemplateValidation(False, ('redis/templates/deployment.yaml',)))
+        assert cache.get(key) == TemplateValidation(False, ('redis/templates/deployment.yaml',))
+        assert TemplateValidationCache(str(tmp_path / 'cache'), 1).get(key).correct is False
+        # broken entry
+        for root, _, files in os.walk(str(tmp_path / 'cache')):
+            for name in files:
+                with open(os.path.join(root, name), 'w') as file:
+                    file.write('{"key": ')
+        assert cache.get(key) is None
+
+    def test_evict(self, tmp_path):
+        cache = TemplateValidationCache(str(tmp_path / 'cache'), 1)
+        key = cache.build_key(make_chart(str(tmp_path / 'redis'), 'nodeSelector: {}\n'), [], 'v3.4.1', 'isolations')
+        cache.put(key, TemplateValidation(True, ()))
+        assert cache.evict() == 0
+        for root, _, files in os.walk(str(tmp_path / 'cache')):
+            for name in files:
+                os.utime(os.path.join(root, name), (0, 0))
+        # Used entries are kept.
+        assert cache.get(key) == TemplateValidation(True, ())
+        assert cache.evict() == 0
+        for root, _, files in os.walk(str(tmp_path / 'cache')):
+            for name in files:
+                os.utime(os.path.join(root, name), (0, 0))
+        assert cache.evict() == 1
+        assert cache.get(key) is None
@@ -1,4 +1,8 @@
 #!/usr/bin/env python3
+import os
+import random
+from git import Repo
+
 from rdbox_app_market.util import Util
 
 
@@ -15,3 +19,90 @@ def test_has_key_recursion_full():
     assert Util.has_key_recursion_full(data, '2nd') == {'_.one': {'3rd': 'HOGE'}, '_.two': {'3rd': 'FUGE'}}
     assert Util.has_key_recursion_full(data, '3rd') == {'_.one.2nd': 'HOGE', '_.two.2nd': 'FUGE'}
     assert Util.has_key_recursion_full(data, '4th') == {}
+
+
+def test_has_key_recursion_hidden_by_none():
+    data = {'a': {'key': None, 'b': {'key': 'hidden'}}, 'c': {'key': 'found'}}
+    assert Util.has_key_recursion(data, 'key') == 'found'
+    assert Util.has_key_recursion({'key': None, 'a': {'key': 'hidden'}}, 'key') is None
+    # The key of a dict precedes the keys below its former values.
+    data = {'a': {'b': {'key': 'deep'}, 'key': 'shallow'}}
+    assert Util.has_key_recursion(data, 'key') == 'shallow'
+
+
+def test_find_keys():
+    data = {'one': {'two': 'three', 'one': 'inner'}, 'two': {'one': 1, 'deep': {'two': 2}}}
+    occurrences = Util.find_keys(data, ['one', 'two', 'none'])
+    # The key is not searched again inside its own value.
+    assert occurrences['one'] == [(('_',), data['one']), (('_', 'two'), 1)]
+    assert occurrences['two'] == [(('_', 'one'), 'three'), (('_',), data['two'])]
+    assert occurrences['none'] == []
+    assert Util.find_keys(data, ['one'], ('top',))['one'][1][0] == ('top', 'two')
+    # The path is shared by the occurrences in the same dict.
+    occurrences = Util.find_keys({'a': {'x': 1, 'y': 2}}, ['x', 'y'])
+    assert occurrences['x'][0][0] is occurrences['y'][0][0]
+
+
+def _has_key_recursion(obj, key):
+    if key in obj:
+        return obj[key]
+    for k, v in obj.items():
+        if isinstance(v, dict):
+            item = _has_key_recursion(v, key)
+            if item is not None:
+                return item
+
+
+def _has_key_recursion_full(obj, key, now=['_']):
+    fields_found = {}
+    for k, v in obj.items():
+        if k == key:
+            fields_found.setdefault('.'.join(now), v)
+        elif isinstance(v, dict):
+            for struct, result in _has_key_recursion_full(v, key, now + [k]).items():
+                fields_found.setdefault(struct, result)
+    return fields_found
+
+
+def _random_dict(rand, keys, depth=0):
+    obj = {}
+    for _ in range(rand.randint(0, 4)):
+        if depth < 5 and rand.random() < 0.5:
+            obj[rand.choice(keys)] = _random_dict(rand, keys, depth + 1)
+        else:
+            obj[rand.choice(keys)] = rand.choice([None, 1, 'text', [1], {}])
+    return obj
+
+
+def test_equivalence_with_recursion():
+    rand = random.Random(0)
+    keys = ['image', 'nodeSelector', 'ingress', 'a', 'b.c']
+    for _ in range(2000):
+        obj = _random_dict(rand, keys)
+        occurrences = Util.find_keys(obj, keys)
+        for key in keys:
+            expect = _has_key_recursion_full(obj, key)
+            assert list(Util.has_key_recursion_full(obj, key).items()) == list(expect.items())
+            assert list(Util.to_dotted_dict(occurrences[key]).items()) == list(expect.items())
+            assert Util.has_key_recursion(obj, key) == _has_key_recursion(obj, key)
+            assert Util.first_of_occurrences(occurrences[key]) == _has_key_recursion(obj, key)
+
+
+def test_git_tree_hash(tmp_path):
+    os.makedirs(str(tmp_path / 'redis' / 'templates'))
+    os.makedirs(str(tmp_path / 'redis' / 'empty'))
+    (tmp_path / 'redis' / 'values.yaml').write_text('nodeSelector: {}\n')
+    (tmp_path / 'redis' / 'templates' / 'deployment.yaml').write_text('kind: Deployment\n')
+    repo = Repo.init(str(tmp_path))
+    repo.git.add('.')
+    expect = repo.git.write_tree(prefix='redis/')
+    assert Util.git_tree_hash(str(tmp_path / 'redis')) == expect
+    assert Util.git_tree_hash(str(tmp_path / 'redis' / 'empty')) is None
+
+
+def test_get_http_session():
+    session = Util.get_http_session()
+    assert Util.get_http_session() is session
+    # forked worker
+    Util._http_session_pid = -1
+    assert Util.get_http_session() is not session
@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
+import re
+import pickle
+import random
 import textwrap
 import pytest
 
-from rdbox_app_market.values_yaml import ValuesYaml, FilterOfStorageClass
+from rdbox_app_market.settings import KubernetesSettings
+from rdbox_app_market.values_yaml import ValuesYaml, FilterOfStorageClass, FilterOfNodeSelector, StageOfIngress, StageOfNodeSelector
+from rdbox_app_market.values_yaml import IndentList, IndentIndex, LineTable, Structure, ValuesYamlDocument
 
 
 class TestValuesYaml(object):
@@ -11,12 +16,12 @@ class TestValuesYaml(object):
         _readlines_result[-1] = ''
         return _readlines_result
 
-    def test_constructor(self):
-        values_yaml = ValuesYaml('/tmp', 'test')
+    def test_constructor(self, settings):
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         assert values_yaml.module_name == 'test'
         assert values_yaml.full_path == '/tmp/values.yaml'
 
-    def test_has_active_nodeSelector(self, mocker):
+    def test_has_active_nodeSelector(self, mocker, settings):
         # test True
         test_text = textwrap.dedent("""\
             affinity: {}
@@ -24,7 +29,7 @@ class TestValuesYaml(object):
             tolerations: []
             """)
         mocker.patch.object(ValuesYaml, 'readlines').return_value = self.__dummy_readlines(test_text)
-        values_yaml = ValuesYaml('/tmp', 'test')
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         assert values_yaml.has_active_nodeSelector() is True
         # test False
         test_text = textwrap.dedent("""\
@@ -33,12 +38,14 @@ class TestValuesYaml(object):
             tolerations: []
             """)
         mocker.patch.object(ValuesYaml, 'readlines').return_value = self.__dummy_readlines(test_text)
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         assert values_yaml.has_active_nodeSelector() is False
         # test False
         mocker.patch.object(ValuesYaml, 'readlines').side_effect = FileNotFoundError()
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         assert values_yaml.has_active_nodeSelector() is False
 
-    def test_has_commentout_nodeSelector(self, mocker):
+    def test_has_commentout_nodeSelector(self, mocker, settings):
         # test True
         test_text = textwrap.dedent("""\
             affinity: {}
@@ -46,7 +53,7 @@ class TestValuesYaml(object):
             tolerations: []
             """)
         mocker.patch.object(ValuesYaml, 'readlines').return_value = self.__dummy_readlines(test_text)
-        values_yaml = ValuesYaml('/tmp', 'test')
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         assert values_yaml.has_commentout_nodeSelector() is True
         # test False
         test_text = textwrap.dedent("""\
@@ -55,12 +62,14 @@ class TestValuesYaml(object):
             tolerations: []
             """)
         mocker.patch.object(ValuesYaml, 'readlines').return_value = self.__dummy_readlines(test_text)
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         assert values_yaml.has_commentout_nodeSelector() is False
         # test False
         mocker.patch.object(ValuesYaml, 'readlines').side_effect = FileNotFoundError()
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         assert values_yaml.has_commentout_nodeSelector() is False
 
-    def test_correct_commentout_nodeSelector(self, mocker):
+    def test_correct_commentout_nodeSelector(self, mocker, settings):
         # test True
         test_text = textwrap.dedent("""\
             affinity: {}
@@ -73,7 +82,7 @@ class TestValuesYaml(object):
             tolerations: []
             """)
         mocker.patch.object(ValuesYaml, 'readlines').return_value = self.__dummy_readlines(test_text)
-        values_yaml = ValuesYaml('/tmp', 'test')
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         file_text, is_changed = values_yaml.correct_commentout_nodeSelector()
         assert is_changed is True
         assert file_text == expect_text
@@ -84,15 +93,17 @@ class TestValuesYaml(object):
             tolerations: []
             """)
         mocker.patch.object(ValuesYaml, 'readlines').return_value = self.__dummy_readlines(test_text)
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         file_text, is_changed = values_yaml.correct_commentout_nodeSelector()
         assert is_changed is False
         assert file_text == test_text
         # test Exception
         mocker.patch.object(ValuesYaml, 'readlines').side_effect = FileNotFoundError()
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         with pytest.raises(FileNotFoundError):
             values_yaml.correct_commentout_nodeSelector()
 
-    def test_has_expected_structure_for_imagetag(self, mocker):
+    def test_has_expected_structure_for_imagetag(self, mocker, settings):
         # test True
         test_text = textwrap.dedent("""\
             replicaCount: 1
@@ -104,7 +115,7 @@ class TestValuesYaml(object):
             affinity: {}
             """)
         mocker.patch.object(ValuesYaml, 'readlines').return_value = self.__dummy_readlines(test_text)
-        values_yaml = ValuesYaml('/tmp', 'test')
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         assert values_yaml.has_expected_structure_for_imagetag() is True
         # test False
         test_text = textwrap.dedent("""\
@@ -116,12 +127,14 @@ class TestValuesYaml(object):
             affinity: {}
             """)
         mocker.patch.object(ValuesYaml, 'readlines').return_value = self.__dummy_readlines(test_text)
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         assert values_yaml.has_expected_structure_for_imagetag() is False
         # test False
         mocker.patch.object(ValuesYaml, 'readlines').side_effect = FileNotFoundError()
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         assert values_yaml.has_expected_structure_for_imagetag() is False
 
-    def test_specify_storageClass_for_rdbox_global(self, mocker):
+    def test_specify_storageClass_for_rdbox_global(self, mocker, settings):
         # test data
         test_text = textwrap.dedent("""\
             ##
@@ -142,14 +155,13 @@ class TestValuesYaml(object):
         mocker.patch.object(ValuesYaml, 'readlines').return_value = self.__dummy_readlines(test_text)
         mocker.patch.object(ValuesYaml, 'write_text').return_value = None
         mocker.patch.object(FilterOfStorageClass, '_FilterOfStorageClass__get_indent_info').return_value = [], 2
-        mocker.patch('rdbox_app_market.config.get').return_value = 'openebs-jiva-rdbox'
         # assert
-        values_yaml = ValuesYaml('/tmp', 'test')
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         file_text, is_changed = values_yaml.specify_storageClass_for_rdbox()
         assert is_changed is True
         assert file_text == expect_text
 
-    def test_specify_storageClass_for_rdbox_no_storageClass(self, mocker):
+    def test_specify_storageClass_for_rdbox_no_storageClass(self, mocker, settings):
         # test data
         test_text = textwrap.dedent("""\
             ##
@@ -163,12 +175,12 @@ class TestValuesYaml(object):
         mocker.patch.object(ValuesYaml, 'readlines').return_value = self.__dummy_readlines(test_text)
         mocker.patch.object(ValuesYaml, 'write_text').return_value = None
         # assert
-        values_yaml = ValuesYaml('/tmp', 'test')
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         file_text, is_changed = values_yaml.specify_storageClass_for_rdbox()
         assert is_changed is False
         assert file_text == test_text
 
-    def test_specify_storageClass_for_rdbox_no_storageClass_in_global(self, mocker):
+    def test_specify_storageClass_for_rdbox_no_storageClass_in_global(self, mocker, settings):
         # test data
         test_text = textwrap.dedent("""\
             ##
@@ -196,14 +208,13 @@ class TestValuesYaml(object):
         mocker.patch.object(ValuesYaml, 'write_text').return_value = None
         mocker.patch.object(FilterOfStorageClass, '_FilterOfStorageClass__get_indent_info').return_value = \
             [-1, -1, -1, -1, -1, -1, 0, 2, -1, 0], 2
-        mocker.patch('rdbox_app_market.config.get').return_value = 'openebs-jiva-rdbox'
         # assert
-        values_yaml = ValuesYaml('/tmp', 'test')
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         file_text, is_changed = values_yaml.specify_storageClass_for_rdbox()
         assert is_changed is True
         assert file_text == expect_text
 
-    def test_specify_storageClass_for_rdbox_separate(self, mocker):
+    def test_specify_storageClass_for_rdbox_separate(self, mocker, settings):
         # test data
         test_text = textwrap.dedent("""\
             persistence:
@@ -219,14 +230,13 @@ class TestValuesYaml(object):
         mocker.patch.object(ValuesYaml, 'write_text').return_value = None
         mocker.patch.object(FilterOfStorageClass, '_FilterOfStorageClass__get_indent_info').return_value = \
             [0, 2, -1, 0], 2
-        mocker.patch('rdbox_app_market.config.get').return_value = 'openebs-jiva-rdbox'
         # assert
-        values_yaml = ValuesYaml('/tmp', 'test')
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         file_text, is_changed = values_yaml.specify_storageClass_for_rdbox()
         assert is_changed is True
         assert file_text == expect_text
 
-    def test_specify_storageClass_for_rdbox_separate_anomalous_comment(self, mocker):
+    def test_specify_storageClass_for_rdbox_separate_anomalous_comment(self, mocker, settings):
         # test data
         test_text = textwrap.dedent("""\
             persistence:
@@ -244,14 +254,13 @@ class TestValuesYaml(object):
         mocker.patch.object(ValuesYaml, 'write_text').return_value = None
         mocker.patch.object(FilterOfStorageClass, '_FilterOfStorageClass__get_indent_info').return_value = \
             [0, 2, -1, 2, 0], 2
-        mocker.patch('rdbox_app_market.config.get').return_value = 'openebs-jiva-rdbox'
         # assert
-        values_yaml = ValuesYaml('/tmp', 'test')
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         file_text, is_changed = values_yaml.specify_storageClass_for_rdbox()
         assert is_changed is True
         assert file_text == expect_text
 
-    def test_specify_nodeSelector_for_rdbox(self, mocker):
+    def test_specify_nodeSelector_for_rdbox(self, mocker, settings):
         test_text = textwrap.dedent("""\
             replicaCount: 1
             image:
@@ -273,14 +282,16 @@ class TestValuesYaml(object):
             """)
         mocker.patch.object(ValuesYaml, 'readlines').return_value = self.__dummy_readlines(test_text)
         mocker.patch.object(ValuesYaml, 'write_text').return_value = None
+        # The retries do not sleep.
+        settings = settings._replace(dockerhub=settings.dockerhub._replace(backoff=0.0))
         # assert
-        values_yaml = ValuesYaml('/tmp', 'test')
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
         file_text, is_changed, multi_arch_dict = values_yaml.specify_nodeSelector_for_rdbox()
         assert is_changed is True
         assert file_text == expect_text
         assert multi_arch_dict == {'_': 'registry'}
 
-    def test_specify_ingress_for_rdbox_str_hosts(self, mocker):
+    def test_specify_ingress_for_rdbox_str_hosts(self, mocker, settings):
         test_text = textwrap.dedent("""\
             replicaCount: 1
             ingress:
@@ -323,10 +334,354 @@ class TestValuesYaml(object):
             """)
         mocker.patch.object(ValuesYaml, 'readlines').return_value = self.__dummy_readlines(test_text)
         mocker.patch.object(ValuesYaml, 'write_text').return_value = None
-        mocker.patch('rdbox_app_market.config.get').return_value = 'rdbox.lan'
+        settings = settings._replace(kubernetes=KubernetesSettings('rdbox.lan', 'rdbox.lan', 'rdbox.lan'))
         # assert
-        values_yaml = ValuesYaml('/tmp', 'docker-registry')
+        values_yaml = ValuesYaml('/tmp', 'docker-registry', settings)
         file_text, is_changed = values_yaml.specify_ingress_for_rdbox()
         print(file_text)
         assert is_changed is True
         assert file_text == expect_text
+
+    def test_document_is_read_once(self, mocker, settings):
+        test_text = textwrap.dedent("""\
+            image:
+              repository: registry
+              tag: 2.7.1
+            # nodeSelector: {}
+            persistence:
+              enable: true
+              # storageClass: "-"
+            """)
+        readlines = mocker.patch.object(ValuesYaml, 'readlines')
+        readlines.return_value = self.__dummy_readlines(test_text)
+        mocker.patch.object(ValuesYaml, 'write_text').return_value = None
+        # assert
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
+        assert values_yaml.has_active_nodeSelector() is False
+        assert values_yaml.has_commentout_nodeSelector() is True
+        assert values_yaml.has_expected_structure_for_imagetag() is True
+        values_yaml.specify_storageClass_for_rdbox()
+        values_yaml.specify_ingress_for_rdbox()
+        assert readlines.call_count == 1
+
+    def test_document_is_replaced_on_write(self, mocker, settings):
+        test_text = textwrap.dedent("""\
+            affinity: {}
+            # nodeSelector: {}
+            tolerations: []
+            """)
+        readlines = mocker.patch.object(ValuesYaml, 'readlines')
+        readlines.return_value = self.__dummy_readlines(test_text)
+        write_text = mocker.patch.object(ValuesYaml, 'write_text')
+        # assert
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
+        assert values_yaml.has_active_nodeSelector() is False
+        file_text, is_changed = values_yaml.correct_commentout_nodeSelector()
+        assert is_changed is True
+        write_text.assert_called_once()
+        assert ''.join(write_text.call_args[0][0]) == file_text
+        assert values_yaml.get_document().get_text() == file_text
+        assert values_yaml.has_active_nodeSelector() is True
+        assert values_yaml.has_commentout_nodeSelector() is False
+        assert readlines.call_count == 1
+
+    def test_specify_nodeSelector_for_rdbox_asks_dockerhub_once(self, mocker, settings):
+        test_text = textwrap.dedent("""\
+            image:
+              repository: registry
+              tag: 2.7.1
+            nodeSelector: {}
+            """)
+        mocker.patch.object(ValuesYaml, 'readlines').return_value = self.__dummy_readlines(test_text)
+        mocker.patch.object(ValuesYaml, 'write_text').return_value = None
+        has_multiarch_image = mocker.patch.object(FilterOfNodeSelector, '_FilterOfNodeSelector__has_multiarch_image')
+        has_multiarch_image.return_value = True
+        # assert
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
+        file_text, is_changed, multi_arch_dict = values_yaml.specify_nodeSelector_for_rdbox()
+        assert is_changed is True
+        assert multi_arch_dict == {'_': 'registry'}
+        assert has_multiarch_image.call_count == 1
+
+    def test_get_images_to_look_up(self, mocker, settings):
+        test_text = textwrap.dedent("""\
+            image:
+              repository: bitnami/nginx
+              tag: 1.19.2
+            nodeSelector: {}
+            metrics:
+              image:
+                repository: quay.io/bitnami/nginx-exporter
+                tag: 0.8.0
+              nodeSelector: {}
+            """)
+        mocker.patch.object(ValuesYaml, 'readlines').return_value = self.__dummy_readlines(test_text)
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
+        assert values_yaml.get_images_to_look_up() == [('bitnami/nginx', '1.19.2'), ('quay.io/bitnami/nginx-exporter', '0.8.0')]
+        # Only the Docker Hub
+        settings_of_dockerhub = settings._replace(registry=settings.registry._replace(enabled=False))
+        assert ValuesYaml('/tmp', 'test', settings_of_dockerhub).get_images_to_look_up() == [('bitnami/nginx', '1.19.2')]
+        # Not looked up if an image has no nodeSelector.
+        mocker.patch.object(ValuesYaml, 'readlines').return_value = self.__dummy_readlines(test_text.replace('  nodeSelector: {}\n', ''))
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
+        assert values_yaml.get_images_to_look_up() == []
+        mocker.patch.object(ValuesYaml, 'readlines').return_value = self.__dummy_readlines('image: [\n')
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
+        assert values_yaml.get_images_to_look_up() == []
+
+    def __fused_test_text(self):
+        return textwrap.dedent("""\
+            image:
+              repository: registry
+              tag: 2.7.1
+            persistence:
+              enabled: true
+              # storageClass: "-"
+            ingress:
+              enabled: false
+              path: /
+              hosts:
+                - chart-example.local
+              annotations: {}
+              tls: []
+            nodeSelector: {}
+            affinity: {}
+            """)
+
+    def test_specify_all_for_rdbox(self, mocker, settings):
+        test_text = self.__fused_test_text()
+        readlines = mocker.patch.object(ValuesYaml, 'readlines')
+        readlines.return_value = self.__dummy_readlines(test_text)
+        write_text = mocker.patch.object(ValuesYaml, 'write_text')
+        mocker.patch.object(FilterOfNodeSelector, '_FilterOfNodeSelector__has_multiarch_image').return_value = False
+        settings = settings._replace(kubernetes=KubernetesSettings('rdbox.lan', 'rdbox.lan', 'rdbox.lan'))
+        # sequential
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
+        values_yaml.specify_storageClass_for_rdbox()
+        values_yaml.specify_ingress_for_rdbox()
+        expect_text, _, _ = values_yaml.specify_nodeSelector_for_rdbox()
+        assert write_text.call_count == 3
+        # fused
+        write_text.reset_mock()
+        readlines.reset_mock()
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
+        result = values_yaml.specify_all_for_rdbox()
+        assert result.get_file_text() == expect_text
+        assert result.is_changed() is True
+        assert result.get_changed_stage_names() == ['storageClass', 'ingress', 'nodeSelector']
+        assert result.get_failed_stage_names() == []
+        assert result.get_stage('nodeSelector').get_multi_arch_dict() == {}
+        readlines.assert_called_once_with()
+        write_text.assert_called_once()
+        assert ''.join(write_text.call_args[0][0]) == expect_text
+        assert values_yaml.get_document().get_text() == expect_text
+
+    def test_specify_all_for_rdbox_dry_run(self, mocker, settings):
+        test_text = self.__fused_test_text()
+        mocker.patch.object(ValuesYaml, 'readlines').return_value = self.__dummy_readlines(test_text)
+        write_text = mocker.patch.object(ValuesYaml, 'write_text')
+        mocker.patch.object(FilterOfNodeSelector, '_FilterOfNodeSelector__has_multiarch_image').return_value = False
+        settings = settings._replace(kubernetes=KubernetesSettings('rdbox.lan', 'rdbox.lan', 'rdbox.lan'))
+        # assert
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
+        result = values_yaml.specify_all_for_rdbox(dry_run=True)
+        assert result.is_changed() is True
+        write_text.assert_not_called()
+        assert values_yaml.get_document().get_text() == test_text
+        diff = result.get_diff()
+        assert diff.startswith('--- a/values.yaml\n+++ b/values.yaml\n')
+        assert '-  # storageClass: "-"\n' in diff
+        assert '+  storageClass: rdbox.lan\n' in diff
+        assert '+  beta.kubernetes.io/arch: amd64\n' in diff
+
+    def test_specify_all_for_rdbox_skips_failed_stage(self, mocker, settings):
+        test_text = self.__fused_test_text()
+        mocker.patch.object(ValuesYaml, 'readlines').return_value = self.__dummy_readlines(test_text)
+        write_text = mocker.patch.object(ValuesYaml, 'write_text')
+        mocker.patch.object(FilterOfNodeSelector, '_FilterOfNodeSelector__has_multiarch_image').return_value = False
+        settings = settings._replace(kubernetes=KubernetesSettings('rdbox.lan', 'rdbox.lan', 'rdbox.lan'))
+        mocker.patch.object(StageOfIngress, 'apply').side_effect = ValueError()
+        # assert
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
+        result = values_yaml.specify_all_for_rdbox()
+        assert result.get_changed_stage_names() == ['storageClass', 'nodeSelector']
+        assert result.get_failed_stage_names() == ['ingress']
+        write_text.assert_called_once()
+        assert ''.join(write_text.call_args[0][0]) == result.get_file_text()
+        # A required stage
+        mocker.patch.object(StageOfNodeSelector, 'apply').side_effect = ValueError()
+        write_text.reset_mock()
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
+        with pytest.raises(ValueError):
+            values_yaml.specify_all_for_rdbox()
+        write_text.assert_not_called()
+
+    def test_pickle_without_document(self, mocker, settings):
+        mocker.patch.object(ValuesYaml, 'readlines').return_value = ['a: 1\n']
+        values_yaml = ValuesYaml('/tmp', 'test', settings)
+        values_yaml.get_document()
+        restored = pickle.loads(pickle.dumps(values_yaml))
+        assert restored.document is None
+        assert restored.full_path == values_yaml.full_path
+
+    def test_write_text(self, tmp_path, settings):
+        path = tmp_path / 'values.yaml'
+        path.write_text('a: 1\n')
+        path.chmod(0o640)
+        values_yaml = ValuesYaml(str(tmp_path), 'test', settings)
+        values_yaml.write_text(line for line in ['a: 2\n', 'b: 3\n'])
+        assert path.read_text() == 'a: 2\nb: 3\n'
+        assert path.stat().st_mode & 0o777 == 0o640
+        values_yaml.write_text('c: 4\n')
+        assert path.read_text() == 'c: 4\n'
+        assert [p.name for p in tmp_path.iterdir()] == ['values.yaml']
+
+    def test_write_text_keeps_file_on_error(self, tmp_path, settings):
+        def broken_lines():
+            yield 'a: 2\n'
+            raise ValueError()
+        path = tmp_path / 'values.yaml'
+        path.write_text('a: 1\n')
+        values_yaml = ValuesYaml(str(tmp_path), 'test', settings)
+        with pytest.raises(ValueError):
+            values_yaml.write_text(broken_lines())
+        assert path.read_text() == 'a: 1\n'
+        assert [p.name for p in tmp_path.iterdir()] == ['values.yaml']
+
+    def test_iter_lines(self, mocker, settings):
+        test_text = textwrap.dedent("""\
+            global:
+              imageRegistry: r
+              # storageClass: "-"
+            image:
+              repository: registry
+              tag: 2.7.1
+            nodeSelector: {}
+            persistence:
+              # storageClass: "-"
+            """)
+        mocker.patch.object(FilterOfNodeSelector, '_FilterOfNodeSelector__has_multiarch_image').return_value = False
+        settings = settings._replace(kubernetes=KubernetesSettings('rdbox.lan', 'rdbox.lan', 'rdbox.lan'))
+        lines = test_text.splitlines(True)
+        for filter_class in [FilterOfStorageClass, FilterOfNodeSelector]:
+            file_text, is_changed = filter_class('test', settings, lines).filter()
+            filtered_lines = list(filter_class('test', settings, lines).iter_lines())
+            assert is_changed is True
+            assert ''.join(filtered_lines) == file_text
+            assert filtered_lines == file_text.splitlines(True)
+
+
+class TestValuesYamlFeatures(object):
+    def test_features(self):
+        test_text = textwrap.dedent("""\
+            image:
+              repository: registry
+              tag: 2.7.1
+            nodeSelector: {}
+            metrics:
+              image:
+                repository: exporter
+                tag: 0.8.0
+              nodeSelector:
+            ingress:
+              enabled: false
+            """)
+        document = ValuesYamlDocument(test_text.splitlines(True))
+        features = document.get_features()
+        assert document.get_features() is features
+        assert features.get_occurrences('image') == [(('_',), {'repository': 'registry', 'tag': '2.7.1'}),
+                                                     (('_', 'metrics'), {'repository': 'exporter', 'tag': '0.8.0'})]
+        assert features.get_dicts('image') == {'_': {'repository': 'registry', 'tag': '2.7.1'},
+                                               '_.metrics': {'repository': 'exporter', 'tag': '0.8.0'}}
+        assert features.get_dicts('ingress') == {'_': {'enabled': False}}
+        assert features.get_first('nodeSelector') == {}
+        assert features.get_first('image') == {'repository': 'registry', 'tag': '2.7.1'}
+
+    def test_features_of_invalid_yaml(self):
+        with pytest.raises(Exception):
+            ValuesYamlDocument(['- a\n']).get_features()
+
+
+class TestIndentIndex(object):
+    TEXT = textwrap.dedent("""\
+        image:
+          repository: registry
+          tag: 2.7.1
+        command: >-
+          folded
+            text
+        ingress:
+          enabled: false
+          hosts:
+            - name: chart-example.local
+              path: /
+          # annotations:
+          tls: []
+        list:
+          - a
+          - b:
+              c: d
+        nodeSelector: {}
+        """)
+    CANDIDATES = ['  key: value\n', '    - item\n', '# comment\n', '\n', 'top: |\n', '      deep: 1\n', '  - name: x\n', 'next:\n']
+
+    def __full_indent_list(self, lines):
+        il = IndentList()
+        for line in lines:
+            il.add_with_line_of_text(line)
+        return il.to_list(), il.get_unit_indent_length()
+
+    def test_same_as_full_computation(self):
+        rand = random.Random(0)
+        for _ in range(50):
+            lines = self.TEXT.splitlines(True)
+            indent_index = IndentIndex(lines)
+            assert (indent_index.to_list(), indent_index.get_unit_indent_length()) == self.__full_indent_list(lines)
+            for _ in range(20):
+                index = rand.randrange(len(lines) + 1)
+                line = rand.choice(self.CANDIDATES)
+                if rand.random() < 0.5 or index == len(lines):
+                    indent_index.insert(index, line)
+                else:
+                    indent_index.replace(index, line)
+                if rand.random() < 0.5:
+                    indent_index.refresh()
+                    assert (indent_index.to_list(), indent_index.get_unit_indent_length()) == self.__full_indent_list(lines)
+            indent_index.refresh()
+            assert indent_index.lines is lines
+            assert (indent_index.to_list(), indent_index.get_unit_indent_length()) == self.__full_indent_list(lines)
+
+
+class TestLineTable(object):
+    LINES = TestIndentIndex.TEXT.splitlines(True) + TestIndentIndex.CANDIDATES + [
+        '  # storageClass: "-"\n', '#  storageClass: "-"\n', '# global:\n', '##  global:\n', 'global:\n', ':\n', '  :\n',
+        '  beta.kubernetes.io/os: linux\n', '-x: 1\n', '  - image: a\n', 'nodeSelector:{}\n', 'script: |-\n', '   \n', 'last']
+
+    def test_classify(self):
+        table = LineTable(self.LINES)
+        for i, line in enumerate(self.LINES):
+            assert table.is_kind_of(i, LineTable.BLANK) == bool(re.match(r'^\s*\n', line))
+            assert table.is_kind_of(i, LineTable.COMMENT) == bool(re.match(r'^\s*#', line))
+            assert table.is_kind_of(i, LineTable.PLAIN_KEY) == bool(re.match(r'^\s*[0-9a-zA-Z]*:', line))
+            for key in ['nodeSelector', 'image', 'storageClass', 'global', 'beta.kubernetes.io/os']:
+                assert (table.get_key(i) == key) == bool(re.match(r'^\s*' + re.escape(key) + ':', line))
+                assert table.is_key_or_commented_key(i, key) == bool(re.match(r'^\s*#*\s*' + re.escape(key) + ':', line))
+            if not table.is_kind_of(i, LineTable.BLANK | LineTable.COMMENT):
+                assert table.is_kind_of(i, LineTable.LIST_ITEM) == bool(re.match(r'^\s*-', line))
+                assert table.is_kind_of(i, LineTable.BLOCK_SCALAR) == bool(re.match(r'^\s*[0-9a-zA-Z\-]{1,}: (\>|\|)(\-|\+|)', line))
+        assert table.count_key('nodeSelector') == 2
+        assert table.has_key_or_commented_key('storageClass') is True
+
+    def test_indent_and_path(self):
+        lines = TestIndentIndex.TEXT.splitlines(True)
+        table = LineTable(lines)
+        il = IndentList()
+        for line in lines:
+            il.add_with_line_of_text(line)
+        assert list(table.get_indent_list()) == il.to_list()
+        assert table.get_unit_indent_length() == il.get_unit_indent_length() == 2
+        structure = Structure(2)
+        for i, (line, indent) in enumerate(zip(lines, il.to_list())):
+            structure.update(line, indent)
+            assert list(table.get_path(i)) == structure.get_struct()
+        assert table.get_path(lines.index('  hosts:\n')) == ('_', 'ingress')
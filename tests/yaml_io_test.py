@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+import io
+import datetime
+import importlib
+import textwrap
+import pytest
+import yaml
+
+from rdbox_app_market import yaml_io
+
+OBJECTS = [
+    {'nodeSelector': {'beta.kubernetes.io/os': 'linux', 'beta.kubernetes.io/arch': 'amd64', 'node.rdbox.com/location': 'hq'}},
+    {'nodeSelector': {}},
+    [{'secretName': 'rdbox.lan', 'hosts': ['*.rdbox.lan']}],
+    {'dependencies': [{'name': 'redis', 'version': '10.x.x', 'repository': 'https://rdbox-intec.github.io/rdbox_app_market/bot-gen', 'condition': 'redis.enabled', 'tags': None}]},
+    {'apiVersion': 'v1', 'name': 'nginx', 'version': '1.0.0', 'appVersion': '1.19.2',
+     'description': 'Chart for the nginx server, ' * 6, 'keywords': ['nginx', 'http', 'web'],
+     'maintainers': [{'name': 'RDBOX Project', 'email': 'info-rdbox@intec.co.jp'}],
+     'icon': 'https://raw.githubusercontent.com/rdbox-intec/rdbox_app_market/master/icons/nginx.png'},
+    {'apiVersion': 'v1', 'entries': {'nginx': [{'created': '2020-08-01T00:00:00.000000Z', 'digest': 'a' * 64, 'urls': ['nginx-1.0.0.tgz']}]}},
+    {'str': 'yes', 'octal': '0123', 'float': '1.10', 'null': 'null', 'colon': 'a: b', 'quote': "it's", 'tab': 'a\tb',
+     'leading': ' x', 'trailing': 'x ', 'multi': 'line1\nline2\n', 'unicode': 'ノード ü', 'empty': '', 'long': 'x' * 120},
+    {'int': 1, 'float': 1.5, 'bool': False, 'none': None, 'empty_dict': {}, 'empty_list': [], 'date': datetime.date(2020, 8, 1),
+     'nested': {'a': {'b': {'c': [1, 2, {'d': 'e'}]}}}},
+    {}, [], 'text', None, 1,
+]
+
+DUMP_OPTIONS = [{}, {'indent': 2}, {'indent': 4}, {'default_flow_style': False}, {'allow_unicode': True}]
+
+TEXTS = [
+    textwrap.dedent("""\
+        image:
+          registry: docker.io
+          repository: bitnami/nginx
+          tag: 1.19.2-debian-10-r28
+        nodeSelector: {}
+        # storageClass: "-"
+        ingress:
+          enabled: false
+          hosts:
+            - name: nginx.local
+              path: /
+              tls: false
+          annotations: {}
+        command: >-
+          folded
+          text
+        script: |
+          #!/bin/sh
+          echo "ok"
+        anchors:
+          base: &base {a: 1}
+          derived:
+            <<: *base
+            b: 2
+        created: 2020-08-01T00:00:00.000000Z
+        """),
+    '',
+    '# only a comment\n',
+]
+
+
+@pytest.mark.skipif(not yaml.__with_libyaml__, reason='PyYAML is built without libyaml')
+class TestEquivalence(object):
+    @pytest.mark.parametrize('obj', OBJECTS)
+    @pytest.mark.parametrize('options', DUMP_OPTIONS)
+    def test_dump(self, obj, options):
+        assert yaml_io.WITH_LIBYAML is True
+        assert yaml_io.dump(obj, **options) == yaml.dump(obj, Dumper=yaml.SafeDumper, **options)
+        assert yaml_io.dump(obj, **options) == yaml.dump(obj, **options)
+
+    @pytest.mark.parametrize('obj', OBJECTS)
+    def test_dump_to_stream(self, obj):
+        stream = io.StringIO()
+        assert yaml_io.dump(obj, stream) is None
+        assert stream.getvalue() == yaml.dump(obj, Dumper=yaml.SafeDumper)
+
+    @pytest.mark.parametrize('obj', OBJECTS)
+    def test_round_trip(self, obj):
+        assert yaml_io.safe_load(yaml_io.dump(obj)) == yaml.safe_load(yaml.dump(obj, Dumper=yaml.SafeDumper))
+
+    @pytest.mark.parametrize('text', TEXTS)
+    def test_safe_load(self, text):
+        assert yaml_io.safe_load(text) == yaml.safe_load(text)
+        assert yaml_io.safe_load(io.StringIO(text)) == yaml.safe_load(io.StringIO(text))
+
+    def test_safe_load_error(self):
+        with pytest.raises(yaml_io.YAMLError):
+            yaml_io.safe_load('a: [1, 2\n')
+        with pytest.raises(yaml_io.YAMLError):
+            yaml_io.safe_load('!!python/object:os.system {}\n')
+
+    def test_subclass_of_loader(self):
+        class Loader(yaml_io.SafeLoader):
+            pass
+        Loader.yaml_implicit_resolvers = {
+            first: [(tag, regexp) for tag, regexp in resolvers if tag != 'tag:yaml.org,2002:timestamp']
+            for first, resolvers in yaml_io.SafeLoader.yaml_implicit_resolvers.items()
+        }
+        assert yaml_io.safe_load('created: 2020-08-01T00:00:00Z\n', Loader=Loader) == {'created': '2020-08-01T00:00:00Z'}
+
+
+class TestFallback(object):
+    @pytest.fixture
+    def pure_yaml_io(self, monkeypatch):
+        monkeypatch.delattr(yaml, 'CSafeLoader', raising=False)
+        monkeypatch.delattr(yaml, 'CSafeDumper', raising=False)
+        yield importlib.reload(yaml_io)
+        monkeypatch.undo()
+        importlib.reload(yaml_io)
+
+    def test_fallback(self, pure_yaml_io):
+        assert pure_yaml_io.WITH_LIBYAML is False
+        assert pure_yaml_io.SafeLoader is yaml.SafeLoader
+        assert pure_yaml_io.SafeDumper is yaml.SafeDumper
+
+    @pytest.mark.parametrize('obj', OBJECTS)
+    def test_dump(self, pure_yaml_io, obj):
+        assert pure_yaml_io.dump(obj, indent=2) == yaml.dump(obj, Dumper=yaml.SafeDumper, indent=2)
+
+    @pytest.mark.parametrize('text', TEXTS)
+    def test_safe_load(self, pure_yaml_io, text):
+        assert pure_yaml_io.safe_load(text) == yaml.safe_load(text)